@@ -0,0 +1,110 @@
+# async_validation.py
+
+from __future__ import print_function
+from copy import deepcopy
+import os
+import threading
+import time
+
+import numpy as np
+import torch
+
+import end2end
+from models.pruning import match_pruned_shapes
+
+
+class AsyncValidator(object):
+    """Validates weight snapshots on a fixed held-out subset in a background thread while
+       training goes on.
+       * The subset is the first opts.validation_batches batches of the validation loader
+         (the split held out of the training files, see utils.split_validation), read into
+         memory once. The test split is never used, so it stays unseen by the selection.
+       * submit() only copies the weights. If the previous validation is still running the
+         snapshot is dropped instead of waiting.
+       * Every result is appended to [dir_comment]_validation.csv (iteration, time, SER and
+         per-SNR SER), and the snapshot with the lowest SER so far is saved as
+         best_maskCNN.pkl / best_C_XtoY.pkl in opts.checkpoint_dir (--load_iters best).
+    """
+
+    def __init__(self, validation_dataloader_X, opts):
+        self.opts = opts
+        self.subset = []
+        for batch_index, batch in enumerate(validation_dataloader_X):
+            if batch_index >= opts.validation_batches:
+                break
+            self.subset.append(batch)
+
+        self.models = None
+        self.thread = None
+        self.history = []
+        self.best = (None, np.inf)
+        self.skipped = 0
+        self.start_time = time.time()
+        self.log_path = os.path.join(opts.root_path, opts.dir_comment + '_validation.csv')
+        with open(self.log_path, 'w') as log:
+            log.write(','.join(['iteration', 'time', 'ser'] + ['snr_{}'.format(snr) for snr in opts.snr_list]) + '\n')
+
+    def refresh(self, validation_dataloader_X):
+        """Tops the subset up to opts.validation_batches batches once the validation split has
+           grown (continuous training). The best SER so far is forgotten when the subset changes.
+        """
+        if len(self.subset) >= self.opts.validation_batches:
+            return
+        subset = []
+        for batch_index, batch in enumerate(validation_dataloader_X):
+            if batch_index >= self.opts.validation_batches:
+                break
+            subset.append(batch)
+        if sum(len(batch[1]) for batch in subset) > sum(len(batch[1]) for batch in self.subset):
+            self.subset = subset
+            self.best = (None, np.inf)
+
+    def submit(self, iteration, mask_CNN, C_XtoY):
+        """Starts the validation of the current weights, returns False if it was dropped.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.skipped += 1
+            return False
+        if self.models is None:
+            self.models = (deepcopy(mask_CNN), deepcopy(C_XtoY))
+        snapshot = [{key: value.detach().clone() for key, value in model.state_dict().items()}
+                    for model in (mask_CNN, C_XtoY)]
+        self.thread = threading.Thread(target=self.validate, args=(iteration, snapshot))
+        self.thread.start()
+        return True
+
+    def validate(self, iteration, snapshot):
+        mask_CNN, C_XtoY = self.models
+        # the models may have been pruned since the last snapshot
+        match_pruned_shapes(mask_CNN, snapshot[0])
+        match_pruned_shapes(C_XtoY, snapshot[1])
+        mask_CNN.load_state_dict(snapshot[0])
+        C_XtoY.load_state_dict(snapshot[1])
+        ser, count = end2end.evaluate_ser(self.subset, mask_CNN, C_XtoY, self.opts)
+        total_ser = np.sum(ser * count) / max(count.sum(), 1)
+        elapsed = time.time() - self.start_time
+        self.history.append((iteration, elapsed, total_ser, ser))
+        with open(self.log_path, 'a') as log:
+            log.write(','.join(['{}'.format(iteration), '{:.1f}'.format(elapsed), '{:.6f}'.format(total_ser)] +
+                               ['{:.6f}'.format(value) if n > 0 else '' for value, n in zip(ser, count)]) + '\n')
+        if total_ser < self.best[1]:
+            self.best = (iteration, total_ser)
+            torch.save(snapshot[0], os.path.join(self.opts.checkpoint_dir, 'best_maskCNN.pkl'))
+            torch.save(snapshot[1], os.path.join(self.opts.checkpoint_dir, 'best_C_XtoY.pkl'))
+
+    def close(self):
+        """Waits for the running validation and prints the SER curve.
+        """
+        if self.thread is not None:
+            self.thread.join()
+        print('=' * 80)
+        print('Validation on {} batches, {} snapshots dropped while busy'.format(
+            len(self.subset), self.skipped).center(80))
+        print('-' * 80)
+        print('{:>10} | {:>10} | {:>10} | {}'.format('iteration', 'time (s)', 'SER', 'best'))
+        for iteration, elapsed, total_ser, _ in self.history:
+            print('{:>10d} | {:>10.1f} | {:>10.4f} | {}'.format(
+                iteration, elapsed, total_ser, '*' if iteration == self.best[0] else ''))
+        print('-' * 80)
+        print('Per-SNR SER curves: {}'.format(self.log_path))
+        print('=' * 80)
@@ -0,0 +1,166 @@
+# autotune.py
+
+from __future__ import print_function
+from copy import deepcopy
+import json
+import os
+import queue
+import time
+
+import torch
+import torch.multiprocessing as mp
+import torch.nn as nn
+import torch.optim as optim
+
+import datasets.data_loader as data_loader
+from models.model_components import create_mask_model, create_classifier
+from utils import set_threads, signal_to_network_input, parse_file_names, inference_mode
+
+# the options searched by the autotuner, in the order they are tuned
+TUNED_OPTIONS = ['num_threads', 'num_interop_threads', 'num_workers', 'batch_size']
+
+
+def candidate_values(opts):
+    """Returns the values tried for every tuned option.
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    threads = opts.autotune_threads or sorted(set([2 ** k for k in range(cores.bit_length()) if 2 ** k <= cores] + [cores]))
+    return {'num_threads': threads,
+            'num_interop_threads': opts.autotune_interop_threads,
+            'num_workers': opts.autotune_workers,
+            'batch_size': opts.autotune_batch_sizes}
+
+
+def repeated_batches(dataloader_X, dataloader_Y):
+    """Yields the paired batches of the X and Y loaders pass after pass, until a pass
+       yields none (an empty split, or fewer files than batch_size).
+    """
+    while True:
+        empty = True
+        for batches in zip(dataloader_X, dataloader_Y):
+            empty = False
+            yield batches
+        if empty:
+            return
+
+
+def measure_setting(opts, files_train, files_test, results_queue):
+    """Runs opts.autotune_warmup + opts.autotune_batches batches of the real pipeline
+       (lora_loader X and Y, the input front end, the mask model and the classifier, forward
+       and backward or inference only) with the settings of opts and puts the samples/s of
+       the timed batches on results_queue. Runs in its own process because the inter-op
+       threads can only be set once per process.
+    """
+    set_threads(opts)
+    training_dataloader_X, _ = data_loader.lora_loader(opts, files_train, files_test, False)
+    training_dataloader_Y, _ = data_loader.lora_loader(opts, files_train, files_test, True)
+    mask_CNN = create_mask_model(opts)
+    C_XtoY = create_classifier(opts)
+    if torch.cuda.is_available():
+        mask_CNN.cuda()
+        C_XtoY.cuda()
+    g_optimizer = optim.Adam(list(mask_CNN.parameters()) + list(C_XtoY.parameters()), opts.lr,
+                             [opts.beta1, opts.beta2])
+    loss_spec = nn.MSELoss(reduction='mean')
+    loss_class = nn.CrossEntropyLoss()
+
+    num_samples = 0
+    start_time = None
+    for step, ((images_X, name_X), (images_Y, _)) in enumerate(repeated_batches(training_dataloader_X,
+                                                                                training_dataloader_Y)):
+        if step == opts.autotune_warmup:
+            num_samples = 0
+            start_time = time.time()
+        if step == opts.autotune_warmup + opts.autotune_batches:
+            break
+        if torch.cuda.is_available():
+            images_X, images_Y = images_X.cuda(), images_Y.cuda()
+        if opts.autotune_mode == 'inference':
+            with inference_mode():
+                C_XtoY(mask_CNN(signal_to_network_input(images_X, opts)))
+        else:
+            labels_X = torch.tensor(parse_file_names(name_X)[3], device=images_X.device)
+            fake_Y_spectrum = mask_CNN(signal_to_network_input(images_X, opts))
+            G_Y_loss = opts.scaling_for_imaging_loss * loss_spec(fake_Y_spectrum, signal_to_network_input(images_Y, opts)) \
+                + opts.scaling_for_classification_loss * loss_class(C_XtoY(fake_Y_spectrum), labels_X)
+            g_optimizer.zero_grad()
+            G_Y_loss.backward()
+            g_optimizer.step()
+        num_samples += len(name_X)
+    if start_time is None:
+        raise RuntimeError('The training loader gives no batches with batch_size {}'.format(opts.batch_size))
+    results_queue.put(num_samples / (time.time() - start_time))
+
+
+def run_setting(opts, settings, files_train, files_test):
+    """Measures one setting in a forked process, returns its samples/s or None if it failed
+       or did not finish within opts.autotune_timeout seconds.
+    """
+    setting_opts = deepcopy(opts)
+    for name, value in settings.items():
+        setattr(setting_opts, name, value)
+    context = mp.get_context('fork')
+    results_queue = context.Queue()
+    process = context.Process(target=measure_setting, args=(setting_opts, files_train, files_test, results_queue))
+    process.start()
+    process.join(opts.autotune_timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return None
+    if process.exitcode != 0:
+        return None
+    try:
+        return results_queue.get(timeout=10)
+    except queue.Empty:
+        return None
+
+
+def autotune(opts, files_train, files_test):
+    """Tunes the options of TUNED_OPTIONS one after the other (coordinate search): each
+       option is swept with the others at their best value so far, starting from the
+       current options (0 threads: the PyTorch default). Prints the samples/s of every setting, writes the best one as a
+       profile for --profile and returns it.
+    """
+    candidates = candidate_values(opts)
+    best = dict((name, getattr(opts, name)) for name in TUNED_OPTIONS)
+    measured = {}
+
+    print('=' * 80)
+    print('Throughput autotuning, {} mode, SF{}'.format(opts.autotune_mode, opts.sf).center(80))
+    print('-' * 80)
+    print(' | '.join(['{:>12}'.format(name) for name in TUNED_OPTIONS] + ['{:>12}'.format('samples/s')]))
+    # the current options first, as the baseline
+    default_key = tuple(best[option] for option in TUNED_OPTIONS)
+    for name in [None] + TUNED_OPTIONS:
+        for value in candidates[name] if name else [None]:
+            settings = dict(best, **{name: value}) if name else best
+            key = tuple(settings[option] for option in TUNED_OPTIONS)
+            if key not in measured:
+                measured[key] = run_setting(opts, settings, files_train, files_test)
+                throughput = measured[key]
+                print(' | '.join(['{:>12d}'.format(value) for value in key] +
+                                 ['{:>12}'.format('failed') if throughput is None else '{:>12.1f}'.format(throughput)]))
+        succeeded = [key for key in measured if measured[key] is not None]
+        if succeeded:
+            best = dict(zip(TUNED_OPTIONS, max(succeeded, key=lambda key: measured[key])))
+    print('-' * 80)
+
+    best_key = tuple(best[option] for option in TUNED_OPTIONS)
+    if measured[best_key] is None:
+        raise RuntimeError('Every autotuning setting failed')
+    print('Best: {}, {:.1f} samples/s'.format(
+        ', '.join('{}={}'.format(name, value) for name, value in best.items()), measured[best_key]))
+    if measured.get(default_key):
+        print('Speedup over the current options: {:.2f}x'.format(measured[best_key] / measured[default_key]))
+
+    output = opts.autotune_output or os.path.join(opts.root_path, opts.dir_comment + '_profile.json')
+    with open(output, 'w') as profile:
+        json.dump({'mode': opts.autotune_mode, 'sf': opts.sf, 'samples_per_sec': measured[best_key],
+                   'settings': best,
+                   'measured': [dict(zip(TUNED_OPTIONS, key), samples_per_sec=throughput)
+                                for key, throughput in measured.items()]},
+                  profile, indent=2)
+    print('Profile written to {} (main.py --profile {})'.format(output, output))
+    print('=' * 80)
+    return best
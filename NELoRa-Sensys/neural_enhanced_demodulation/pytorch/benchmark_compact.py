@@ -0,0 +1,92 @@
+"""Compares the parameters, memory and latency of the full and the compact (projected
+mask head, factorized classifier) models for SF7-SF12."""
+from __future__ import print_function
+from copy import deepcopy
+import resource
+import time
+
+import torch
+import torch.multiprocessing as mp
+
+from utils import print_opts, signal_to_network_input
+from models.model_components import create_mask_model, create_classifier
+import config
+
+
+def build_models(opts):
+    return create_mask_model(opts), create_classifier(opts)
+
+
+def count_parameters(opts):
+    """Counts the parameters of both models, without allocating them on torch versions
+       with meta tensors (the full classifier has billions of weights at high SF).
+    """
+    if hasattr(torch.device('cpu'), '__enter__'):
+        with torch.device('meta'):
+            models = build_models(opts)
+    else:
+        models = build_models(opts)
+    return [sum(p.numel() for p in model.parameters()) for model in models]
+
+
+def measure_inference(opts, repeats, results_queue):
+    """Builds both models and puts the peak memory (weights and activations) and the mean
+       inference time of a batch on results_queue. Runs in its own process.
+    """
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    mask_CNN, C_XtoY = build_models(opts)
+    mask_CNN.eval()
+    C_XtoY.eval()
+    x = signal_to_network_input(torch.randn(opts.batch_size, opts.stft_nfft, dtype=torch.cfloat), opts)
+    with torch.no_grad():
+        C_XtoY(mask_CNN(x))
+        start_time = time.time()
+        for _ in range(repeats):
+            C_XtoY(mask_CNN(x))
+        elapsed = (time.time() - start_time) / repeats * 1000
+    results_queue.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - baseline, elapsed))
+
+
+def main(opts):
+    """Measures every SF of opts.benchmark_sf for the full and the compact models. Models
+       above opts.benchmark_max_params parameters are counted but not built.
+    """
+    context = mp.get_context('fork')
+    compact_proj_dim = opts.lstm_proj_dim if opts.lstm_proj_dim > 0 else 256
+    print('=' * 80)
+    print('Full vs compact models, batch {}'.format(opts.batch_size).center(80))
+    print('-' * 80)
+    print('{:>4} | {:>8} | {:>13} | {:>13} | {:>12} | {:>12}'.format(
+        'SF', 'model', 'mask params', 'clf params', 'memory (MB)', 'latency (ms)'))
+    for sf in opts.benchmark_sf:
+        for name, classifier, lstm_proj_dim in [('full', 'hybrid', 0), ('compact', 'factorized', compact_proj_dim)]:
+            sf_opts = deepcopy(opts)
+            sf_opts.sf = sf
+            sf_opts.classifier = classifier
+            sf_opts.lstm_proj_dim = lstm_proj_dim
+            config.prepare_opts(sf_opts)
+            mask_params, classifier_params = count_parameters(sf_opts)
+            row = '{:>4d} | {:>8} | {:>13d} | {:>13d} | '.format(sf, name, mask_params, classifier_params)
+
+            if mask_params + classifier_params > opts.benchmark_max_params:
+                print(row + '{:>12} | {:>12}'.format('too large', '-'))
+                continue
+            results_queue = context.Queue()
+            process = context.Process(target=measure_inference, args=(sf_opts, opts.benchmark_repeats, results_queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(row + 'failed with exit code {}'.format(process.exitcode))
+                continue
+            print(row + '{:>12.1f} | {:>12.1f}'.format(*results_queue.get()))
+    print('=' * 80)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,106 @@
+"""Validates the band-limited STFT front end (--stft_mode band) against the full STFT and
+compares their FLOPs, memory and time for several oversampling factors. The chirp-z transform
+of the band-limited front end takes about 2.2x fewer FLOPs than the full STFT at 8x
+oversampling and 4.6x fewer at 16x, below 8x it falls back to the full STFT."""
+from __future__ import print_function
+from copy import deepcopy
+import math
+import time
+
+import torch
+
+from utils import print_opts, signal_to_network_input, band_limited_stft, stft_flops, inference_mode
+import config
+import end2end
+
+
+def front_end_costs(opts):
+    """Returns the real FLOPs per frame and the bytes of the complex spectrum per symbol of the
+       full STFT and of the band-limited one (utils.stft_flops), and whether the band-limited
+       one runs the chirp-z transform. Where it does not, it computes the full STFT too.
+    """
+    num_frames = opts.stft_nfft // opts.stft_overlap + 1
+    full_flops, zoom_flops = stft_flops(opts.stft_nfft, opts.stft_window, opts.freq_size)
+    full = (full_flops, opts.stft_nfft * num_frames * 8)
+    zoom = zoom_flops < full_flops
+    band = (zoom_flops, opts.freq_size * num_frames * 8) if zoom else full
+    return full, band, zoom
+
+
+def time_front_end(symbols, opts, repeats):
+    with inference_mode():
+        signal_to_network_input(symbols, opts)
+        start_time = time.time()
+        for _ in range(repeats):
+            signal_to_network_input(symbols, opts)
+    return (time.time() - start_time) / repeats / symbols.shape[0] * 1e6
+
+
+def main(opts):
+    """Compares both modes on random symbols at fs = 2, 4, 8 and 16 times bw, then checks the
+    outputs of the models of opts.load_iters (random weights if there is no such checkpoint)
+    at opts.fs. The max error is that of the network input, relative to its largest value.
+    """
+    print('=' * 80)
+    print('STFT front end, SF{}, batch {}, {} repeats'.format(opts.sf, opts.batch_size, opts.benchmark_repeats).center(80))
+    print('-' * 80)
+    print('{:>6} | {:>6} | {:>14} | {:>14} | {:>12} | {:>10} | {:>10}'.format(
+        'fs/bw', 'nfft', 'kFLOPs/frame', 'spectrum kB', 'us/symbol', 'speedup', 'max error'))
+    for oversampling in [2, 4, 8, 16]:
+        mode_opts = {}
+        for stft_mode in ['full', 'band']:
+            mode_opts[stft_mode] = deepcopy(opts)
+            mode_opts[stft_mode].fs = opts.bw * oversampling
+            mode_opts[stft_mode].stft_nfft = opts.n_classes * oversampling
+            mode_opts[stft_mode].stft_mode = stft_mode
+        symbols = torch.randn(opts.batch_size, mode_opts['full'].stft_nfft, dtype=torch.cfloat)
+        with inference_mode():
+            full_input = signal_to_network_input(symbols, mode_opts['full'])
+            error = (full_input - signal_to_network_input(symbols, mode_opts['band'])).abs().max().item()
+            error /= full_input.abs().max().item()
+        full_costs, band_costs, zoom = front_end_costs(mode_opts['full'])
+        costs = {'full': full_costs, 'band': band_costs}
+        timings = dict((stft_mode, time_front_end(symbols, mode_opts[stft_mode], opts.benchmark_repeats))
+                       for stft_mode in ['full', 'band'])
+        for stft_mode in ['full', 'band']:
+            print('{:>6} | {:>6} | {:>14.1f} | {:>14.1f} | {:>12.1f} | {:>10} | {:>10}'.format(
+                oversampling if stft_mode == 'full' else '',
+                mode_opts['full'].stft_nfft if stft_mode == 'full' else 'band' if zoom else 'band*',
+                costs[stft_mode][0] / 1000, costs[stft_mode][1] / 1024, timings[stft_mode],
+                '{:.2f}'.format(timings['full'] / timings[stft_mode]),
+                '{:.2e}'.format(error) if stft_mode == 'band' else ''))
+    print('-' * 80)
+    print('band: chirp-z transform of the kept bins, band*: full STFT, the chirp-z transform would')
+    print('take more FLOPs (it takes two FFTs of 2^(sf+1) points, the full STFT one of nfft points)')
+    print('=' * 80)
+
+    mask_CNN, C_XtoY = end2end.load_or_create_model(opts)
+    mask_CNN.eval()
+    C_XtoY.eval()
+    band_opts = deepcopy(opts)
+    band_opts.stft_mode = 'band'
+    symbols = torch.randn(opts.batch_size, opts.stft_nfft, dtype=torch.cfloat)
+    raw = torch.stft(input=symbols, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
+                     win_length=opts.stft_window, pad_mode='constant')
+    band = band_limited_stft(symbols, opts)
+    trim_size = opts.freq_size // 2
+    with inference_mode():
+        labels_estimated = C_XtoY(mask_CNN(signal_to_network_input(symbols, opts)))
+        band_labels_estimated = C_XtoY(mask_CNN(signal_to_network_input(symbols, band_opts)))
+    difference = (torch.cat((raw[:, :trim_size], raw[:, -trim_size:]), 1) - band).abs().max().item()
+    print('Kept bins: max |difference| {:.3e}, {:.3e} of max |bin| {:.3e}'.format(
+        difference, difference / raw.abs().max().item(), raw.abs().max().item()))
+    print('Models: max |logit difference| {:.3e} | same decisions: {:.4f}'.format(
+        (labels_estimated - band_labels_estimated).abs().max().item(),
+        (labels_estimated.argmax(1) == band_labels_estimated.argmax(1)).float().mean().item()))
+    print('=' * 80)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,63 @@
+"""Checks that optimize_for_inference keeps the outputs of the trained models and reports
+its CPU speedup."""
+from __future__ import print_function
+import time
+
+import torch
+
+from utils import print_opts, signal_to_network_input, inference_mode
+from models.inference_optimization import optimize_for_inference
+import config
+import end2end
+
+
+def time_forward(mask_CNN, C_XtoY, x, repeats):
+    """Returns the outputs and the mean time (ms) of C_XtoY(mask_CNN(x)).
+    """
+    with inference_mode():
+        C_XtoY(mask_CNN(x))
+        start_time = time.time()
+        for _ in range(repeats):
+            masked = mask_CNN(x)
+            labels_estimated = C_XtoY(masked)
+    return masked, labels_estimated, (time.time() - start_time) / repeats * 1000
+
+
+def main(opts):
+    """Loads the checkpoint of opts.load_iters (random weights if there is no such checkpoint) and compares
+       the eval-mode models with their optimized copies on random symbols.
+    """
+    mask_CNN, C_XtoY = end2end.load_or_create_model(opts)
+    mask_CNN.eval()
+    C_XtoY.eval()
+    fast_mask_CNN, fast_C_XtoY = optimize_for_inference(mask_CNN), optimize_for_inference(C_XtoY)
+
+    symbols = torch.randn(opts.batch_size, opts.stft_nfft, dtype=torch.cfloat)
+    if torch.cuda.is_available():
+        symbols = symbols.cuda()
+    x = signal_to_network_input(symbols, opts)
+    masked, labels_estimated, elapsed = time_forward(mask_CNN, C_XtoY, x, opts.benchmark_repeats)
+    fast_masked, fast_labels_estimated, fast_elapsed = time_forward(fast_mask_CNN, fast_C_XtoY, x,
+                                                                    opts.benchmark_repeats)
+
+    print('=' * 80)
+    print('optimize_for_inference, batch {}, {} threads'.format(opts.batch_size, torch.get_num_threads()).center(80))
+    print('-' * 80)
+    print('max |masked difference|: {:.3e} (max |masked| {:.3e})'.format(
+        (masked - fast_masked).abs().max().item(), masked.abs().max().item()))
+    print('max |logit difference|: {:.3e} | same decisions: {:.4f}'.format(
+        (labels_estimated - fast_labels_estimated).abs().max().item(),
+        (labels_estimated.argmax(1) == fast_labels_estimated.argmax(1)).float().mean().item()))
+    print('eval mode: {:.2f} ms | optimized: {:.2f} ms | speedup: {:.2f}x'.format(
+        elapsed, fast_elapsed, elapsed / fast_elapsed))
+    print('=' * 80)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,112 @@
+"""Compares the STFT and the dechirped FFT input modes: per-symbol MACs, activation memory,
+parameters, latency and per-SNR SER."""
+from __future__ import print_function
+from copy import deepcopy
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from utils import generate_dataset, print_opts, print_ser_table, signal_to_network_input, inference_mode
+from models.model_components import create_mask_model, create_classifier
+import config
+import datasets.data_loader as data_loader
+import end2end
+
+
+def count_costs(models, x):
+    """Runs x through the models in sequence and returns the multiply-accumulates and the
+       bytes of the layer outputs, both per symbol.
+    """
+    costs = {'macs': 0, 'bytes': 0}
+
+    def hook(module, inputs, output):
+        if isinstance(output, tuple):
+            output = output[0]
+        costs['bytes'] += output.numel() * output.element_size()
+        if isinstance(module, (nn.Conv1d, nn.Conv2d)):
+            costs['macs'] += output.numel() * module.in_channels // module.groups * int(np.prod(module.kernel_size))
+        elif isinstance(module, nn.Linear):
+            costs['macs'] += output.numel() * module.in_features
+        elif isinstance(module, nn.LSTM):
+            directions = 2 if module.bidirectional else 1
+            costs['macs'] += output.shape[0] * output.shape[1] * directions * 4 * module.hidden_size * (
+                module.input_size + module.hidden_size)
+
+    handles = [module.register_forward_hook(hook) for model in models for module in model.modules()
+               if len(list(module.children())) == 0 or isinstance(module, nn.LSTM)]
+    with inference_mode():
+        out = x
+        for model in models:
+            out = model(out)
+    for handle in handles:
+        handle.remove()
+    return costs['macs'] / x.shape[0], costs['bytes'] / x.shape[0]
+
+
+def measure_latency(models, symbols, opts, repeats=20):
+    """Returns the mean time (ms) per symbol of the input transform and both models.
+    """
+    with inference_mode():
+        out = signal_to_network_input(symbols, opts)
+        for model in models:
+            out = model(out)
+        start_time = time.time()
+        for _ in range(repeats):
+            out = signal_to_network_input(symbols, opts)
+            for model in models:
+                out = model(out)
+    return (time.time() - start_time) / repeats / symbols.shape[0] * 1000
+
+
+def main(opts):
+    """Benchmarks both input modes on random symbols, then evaluates the checkpoints of
+    opts.dir_comment (STFT mode) and opts.compare_dir_comment (dechirp mode) if given.
+    """
+    symbols = torch.randn(opts.batch_size, opts.n_classes * opts.fs // opts.bw, dtype=torch.cfloat)
+    mode_opts = {}
+    for input_mode in ['stft', 'dechirp']:
+        mode_opts[input_mode] = deepcopy(opts)
+        mode_opts[input_mode].input_mode = input_mode
+
+    print('=' * 80)
+    print('Input modes, SF{}, batch {}, {} threads'.format(opts.sf, opts.batch_size, torch.get_num_threads()).center(80))
+    print('-' * 80)
+    print('{:>8} | {:>14} | {:>10} | {:>12} | {:>14} | {:>10}'.format(
+        'mode', 'input shape', 'parameters', 'MACs/symbol', 'activations/sym', 'ms/symbol'))
+    for input_mode, input_opts in mode_opts.items():
+        models = [create_mask_model(input_opts).eval(), create_classifier(input_opts).eval()]
+        x = signal_to_network_input(symbols, input_opts)
+        num_params = sum(p.numel() for model in models for p in model.parameters())
+        macs, activation_bytes = count_costs(models, x)
+        print('{:>8} | {:>14} | {:>10d} | {:>12.3g} | {:>12.1f}kB | {:>10.3f}'.format(
+            input_mode, 'x'.join(str(size) for size in x.shape[1:]), num_params, macs, activation_bytes / 1024,
+            measure_latency(models, symbols, input_opts)))
+    print('=' * 80)
+
+    if opts.compare_dir_comment:
+        [files_train, files_test
+         ] = generate_dataset(opts.root_path, opts.data_dir, opts.ratio_bt_train_and_test,
+                              opts.code_list, opts.snr_list, opts.bw_list, opts.sf_list,
+                              opts.instance_list, opts.sorting_type)
+        _, testing_dataloader_X = data_loader.lora_loader(opts, files_train, files_test, False)
+        mode_opts['dechirp'].checkpoint_dir = os.path.join(opts.evaluations_path,
+                                                           opts.compare_dir_comment + '_checkpoints')
+
+        ser = {}
+        for input_mode, input_opts in mode_opts.items():
+            mask_CNN, C_XtoY = end2end.load_checkpoint(input_opts)
+            ser[input_mode], count = end2end.evaluate_ser(testing_dataloader_X, mask_CNN, C_XtoY, input_opts)
+        print_ser_table('SER per SNR: STFT vs dechirped FFT input', ser, count, opts.snr_list)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,128 @@
+"""Compares the bytes allocated and the time of a training step (forward and backward of
+maskCNN and the classifier) of the time-major layout against the previous one."""
+from __future__ import print_function
+from copy import deepcopy
+import time
+
+import torch
+import torch.nn as nn
+
+from utils import print_opts, to_var, spec_to_network_input
+from models.model_components import maskCNNModel, create_classifier
+import config
+
+
+def legacy_spec_to_network_input(x, opts):
+    """The previous spec_to_network_input: [B, C, H, W] through two transposes of view_as_real.
+    """
+    trim_size = opts.freq_size // 2
+    y = torch.cat((x[:, -trim_size:, :], x[:, 0:trim_size, :]), 1)
+    if opts.normalization:
+        y_abs_max = torch.tensor(list(map(lambda x: torch.max(x), torch.abs(y))))
+        y = torch.div(y, to_var(torch.unsqueeze(torch.unsqueeze(y_abs_max, 1), 2)))
+    y = torch.view_as_real(y)
+    y = torch.transpose(y, 2, 3)
+    return torch.transpose(y, 1, 2)
+
+
+def legacy_mask_model(mask_CNN):
+    """A copy of mask_CNN with the padding folded into its convs moved back to ZeroPad2d layers.
+    """
+    legacy = deepcopy(mask_CNN)
+    layers = list(legacy.conv)
+    for index, (layer, conv) in enumerate(zip(layers[:-1], layers[1:])):
+        if isinstance(layer, nn.Identity) and isinstance(conv, nn.Conv2d):
+            top, left = conv.padding
+            legacy.conv[index] = nn.ZeroPad2d((left, left, top, top))
+            conv.padding = (0, 0)
+    return legacy
+
+
+def legacy_mask_forward(mask_CNN, x):
+    """The previous maskCNNModel.forward, with its contiguous copies.
+    """
+    out = x.transpose(2, 3).contiguous()
+    out = mask_CNN.conv(out)
+    out = out.transpose(1, 2).contiguous()
+    out = out.view(out.size(0), out.size(1), -1)
+    out, _ = mask_CNN.lstm(out)
+    out = mask_CNN.fc(out)
+    out = out.view(out.size(0), out.size(1), mask_CNN.opts.y_image_channel, -1)
+    out = torch.sigmoid(out)
+    out = out.transpose(1, 2).contiguous()
+    out = out.transpose(2, 3).contiguous()
+    return out * x
+
+
+def train_step(front_end, mask_forward, C_XtoY, spectrum, opts):
+    x = front_end(spectrum, opts)
+    fake_Y_spectrum = mask_forward(x)
+    loss = fake_Y_spectrum.abs().mean() + C_XtoY(fake_Y_spectrum).logsumexp(1).mean()
+    loss.backward()
+    return x, fake_Y_spectrum
+
+
+def measure(step, repeats):
+    """Returns the bytes allocated by the operators (frees not subtracted) and the mean time
+       in ms of one call of step.
+    """
+    step()
+    with torch.autograd.profiler.profile(profile_memory=True) as prof:
+        step()
+    allocated = sum(max(event.self_cpu_memory_usage, 0) for event in prof.function_events)
+    start_time = time.time()
+    for _ in range(repeats):
+        step()
+    return allocated, (time.time() - start_time) / repeats * 1000
+
+
+def main(opts):
+    """Runs a training step of random symbols through both layouts with the same weights,
+    checks that the outputs match and that the state dict keys are unchanged.
+    """
+    symbols = torch.randn(opts.batch_size, opts.n_classes * opts.fs // opts.bw, dtype=torch.cfloat)
+    spectrum = torch.stft(input=symbols, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
+                          win_length=opts.stft_window, pad_mode='constant')
+    mask_CNN = maskCNNModel(opts).train()
+    C_XtoY = create_classifier(opts).train()
+    legacy_CNN = legacy_mask_model(mask_CNN)
+    same_keys = list(mask_CNN.state_dict().keys()) == list(legacy_CNN.state_dict().keys())
+    legacy_CNN.load_state_dict(mask_CNN.state_dict())
+
+    legacy_x, legacy_out = train_step(legacy_spec_to_network_input, lambda x: legacy_mask_forward(legacy_CNN, x),
+                                      C_XtoY, spectrum, opts)
+    x, out = train_step(spec_to_network_input, mask_CNN, C_XtoY, spectrum, opts)
+    input_error = (x - legacy_x).abs().max().item()
+    output_error = (out - legacy_out).abs().max().item()
+
+    results = {}
+    results['previous'] = measure(lambda: train_step(legacy_spec_to_network_input,
+                                                     lambda x: legacy_mask_forward(legacy_CNN, x),
+                                                     C_XtoY, spectrum, opts), opts.benchmark_repeats)
+    results['time-major'] = measure(lambda: train_step(spec_to_network_input, mask_CNN, C_XtoY, spectrum, opts),
+                                    opts.benchmark_repeats)
+
+    print('=' * 80)
+    print('Training step layout, SF{}, batch {}, {} repeats'.format(
+        opts.sf, opts.batch_size, opts.benchmark_repeats).center(80))
+    print('-' * 80)
+    print('{:>12} | {:>16} | {:>12} | {:>10}'.format('layout', 'allocated (MB)', 'step (ms)', 'speedup'))
+    for name, (allocated, step_time) in results.items():
+        print('{:>12} | {:>16.2f} | {:>12.2f} | {:>10.2f}'.format(
+            name, allocated / 2 ** 20, step_time, results['previous'][1] / step_time))
+    print('-' * 80)
+    print('Input strides {} (was {}), max difference: input {:.2e}, masked output {:.2e}'.format(
+        x.stride(), legacy_x.stride(), input_error, output_error))
+    print('State dict keys unchanged: {}, allocations saved: {:.2f} MB per step'.format(
+        same_keys, (results['previous'][0] - results['time-major'][0]) / 2 ** 20))
+    print('=' * 80)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,84 @@
+"""Compares the LSTM and the temporal-conv mask heads: parameters, latency and per-SNR SER."""
+from __future__ import print_function
+from copy import deepcopy
+import os
+import time
+
+import torch
+
+from utils import generate_dataset, print_opts, print_ser_table, signal_to_network_input
+from models.model_components import create_mask_model
+import config
+import datasets.data_loader as data_loader
+import end2end
+
+
+def measure_latency(model, x, repeats=20):
+    """Returns the mean inference and training-step time (ms) of model on x.
+    """
+    model.eval()
+    with torch.no_grad():
+        model(x)
+        start_time = time.time()
+        for _ in range(repeats):
+            model(x)
+        inference = (time.time() - start_time) / repeats * 1000
+
+    model.train()
+    model(x).sum().backward()
+    start_time = time.time()
+    for _ in range(repeats):
+        model.zero_grad()
+        model(x).sum().backward()
+    training = (time.time() - start_time) / repeats * 1000
+    return inference, training
+
+
+def main(opts):
+    """Benchmarks both heads on random input, then evaluates the checkpoints of
+    opts.dir_comment (LSTM head) and opts.compare_dir_comment (TCN head) if given.
+    """
+    symbols = torch.randn(opts.batch_size, opts.n_classes * opts.fs // opts.bw, dtype=torch.cfloat)
+    x = signal_to_network_input(symbols, opts)
+
+    print('=' * 80)
+    print('Mask head latency, batch {}, {} threads'.format(opts.batch_size, torch.get_num_threads()).center(80))
+    print('-' * 80)
+    print('{:>8} | {:>12} | {:>16} | {:>16}'.format('head', 'parameters', 'inference (ms)', 'train step (ms)'))
+    for mask_head in ['lstm', 'tcn']:
+        head_opts = deepcopy(opts)
+        head_opts.mask_head = mask_head
+        model = create_mask_model(head_opts)
+        num_params = sum(p.numel() for p in model.parameters())
+        inference, training = measure_latency(model, x)
+        print('{:>8} | {:>12d} | {:>16.2f} | {:>16.2f}'.format(mask_head, num_params, inference, training))
+    print('=' * 80)
+
+    if opts.compare_dir_comment:
+        [files_train, files_test
+         ] = generate_dataset(opts.root_path, opts.data_dir, opts.ratio_bt_train_and_test,
+                              opts.code_list, opts.snr_list, opts.bw_list, opts.sf_list,
+                              opts.instance_list, opts.sorting_type)
+        _, testing_dataloader_X = data_loader.lora_loader(opts, files_train, files_test, False)
+
+        lstm_opts = deepcopy(opts)
+        lstm_opts.mask_head = 'lstm'
+        tcn_opts = deepcopy(opts)
+        tcn_opts.mask_head = 'tcn'
+        tcn_opts.checkpoint_dir = os.path.join(opts.evaluations_path, opts.compare_dir_comment + '_checkpoints')
+
+        ser = {}
+        for mask_head, head_opts in [('lstm', lstm_opts), ('tcn', tcn_opts)]:
+            mask_CNN, C_XtoY = end2end.load_checkpoint(head_opts)
+            ser[mask_head], count = end2end.evaluate_ser(testing_dataloader_X, mask_CNN, C_XtoY, head_opts)
+        print_ser_table('SER per SNR: LSTM vs TCN mask head', ser, count, opts.snr_list)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
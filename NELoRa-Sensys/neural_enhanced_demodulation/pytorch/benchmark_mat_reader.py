@@ -0,0 +1,63 @@
+"""Compares the per-file load time of the native MAT v5 reader with the scipy.io.loadmat path."""
+from __future__ import print_function
+import os
+import time
+
+import numpy as np
+import scipy.io as scio
+import torch
+
+from utils import print_opts
+from datasets.mat_reader import load_complex, LAYOUTS
+from bulk_demod import list_symbol_files
+import config
+
+
+def load_scipy(path, feature_name):
+    """The previous lora_dataset.__getitem__ path.
+    """
+    lora_img = np.array(scio.loadmat(path)[feature_name].tolist())
+    lora_img = np.squeeze(lora_img)
+    return torch.tensor(lora_img, dtype=torch.cfloat)
+
+
+def load_native(path, feature_name):
+    return torch.from_numpy(load_complex(path, feature_name))
+
+
+def main(opts):
+    """Loads the first opts.benchmark_files files of opts.data_dir with both readers (after
+    one untimed pass to warm the page cache) and checks that they give the same symbols.
+    """
+    paths = list_symbol_files(os.path.join(opts.root_path, opts.data_dir))[:opts.benchmark_files]
+    for path in paths:
+        with open(path, 'rb') as mat_file:
+            mat_file.read()
+
+    timings = {}
+    symbols = {}
+    for name, load in [('scipy', load_scipy), ('native', load_native)]:
+        start_time = time.time()
+        symbols[name] = [load(path, opts.feature_name) for path in paths]
+        timings[name] = (time.time() - start_time) / max(len(paths), 1) * 1e6
+    mismatches = sum(not torch.equal(a, b) for a, b in zip(symbols['scipy'], symbols['native']))
+
+    print('=' * 80)
+    print('MAT file load time, {} files'.format(len(paths)).center(80))
+    print('-' * 80)
+    print('{:>8} | {:>14} | {:>10}'.format('reader', 'us per file', 'speedup'))
+    for name in ['scipy', 'native']:
+        print('{:>8} | {:>14.1f} | {:>10.2f}'.format(name, timings[name], timings['scipy'] / timings[name]))
+    print('-' * 80)
+    print('{} layouts parsed, {} files differ from scipy'.format(len(LAYOUTS), mismatches))
+    print('=' * 80)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,87 @@
+"""Reports the peak memory and iteration time of mask model training for SF7-SF12,
+with and without the memory saving mode."""
+from __future__ import print_function
+from copy import deepcopy
+import resource
+import time
+
+import torch
+import torch.multiprocessing as mp
+
+from utils import print_opts, signal_to_network_input
+from models.model_components import create_mask_model
+import config
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_training_step(opts, repeats, results_queue):
+    """Runs repeats training steps of the mask model on random symbols and puts the
+       parameters, the peak activation memory and the mean step time on results_queue.
+       Runs in its own process so the peak memory of every setting is measured alone.
+    """
+    model = create_mask_model(opts)
+    optimizer = torch.optim.Adam(model.parameters(), opts.lr, [opts.beta1, opts.beta2])
+    x = signal_to_network_input(torch.randn(opts.batch_size, opts.stft_nfft, dtype=torch.cfloat), opts)
+    target = torch.rand_like(x)
+    # allocate the gradients and the optimizer state (a zero gradient step leaves the
+    # weights unchanged) so that only the activations count towards the peak
+    for param in model.parameters():
+        param.grad = torch.zeros_like(param)
+    optimizer.step()
+    baseline = peak_rss_mb()
+
+    elapsed = 0.0
+    for step in range(repeats + 1):
+        start_time = time.time()
+        optimizer.zero_grad()
+        loss = torch.nn.functional.mse_loss(model(x), target)
+        loss.backward()
+        optimizer.step()
+        if step > 0:
+            elapsed += time.time() - start_time
+    num_params = sum(p.numel() for p in model.parameters())
+    results_queue.put((num_params, peak_rss_mb() - baseline, elapsed / repeats * 1000))
+
+
+def main(opts):
+    """Measures every SF of opts.benchmark_sf in the normal and the memory saving mode.
+    """
+    context = mp.get_context('fork')
+    print('=' * 80)
+    print('{} training step, batch {}'.format(type(create_mask_model(opts)).__name__, opts.batch_size).center(80))
+    print('-' * 80)
+    print('{:>4} | {:>8} | {:>12} | {:>15} | {:>15}'.format('SF', 'mode', 'parameters', 'activations (MB)',
+                                                             'iteration (ms)'))
+    for sf in opts.benchmark_sf:
+        for memory_saving in [False, True]:
+            sf_opts = deepcopy(opts)
+            sf_opts.sf = sf
+            sf_opts.memory_saving = memory_saving
+            config.prepare_opts(sf_opts)
+
+            results_queue = context.Queue()
+            process = context.Process(target=measure_training_step, args=(sf_opts, opts.benchmark_repeats,
+                                                                          results_queue))
+            process.start()
+            process.join()
+            mode = 'saving' if memory_saving else 'normal'
+            if process.exitcode != 0:
+                print('{:>4d} | {:>8} | failed with exit code {}'.format(sf, mode, process.exitcode))
+                continue
+            num_params, peak_memory, iteration_time = results_queue.get()
+            print('{:>4d} | {:>8} | {:>12d} | {:>15.1f} | {:>15.1f}'.format(
+                sf, mode, num_params, peak_memory, iteration_time))
+    print('=' * 80)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,83 @@
+"""Measures the training loader throughput with and without the threaded read-ahead on a
+filesystem with an emulated per-read latency (--benchmark_latency)."""
+from __future__ import print_function
+from copy import deepcopy
+import time
+
+import torch
+
+from utils import generate_dataset, print_opts
+import config
+import datasets.data_loader as data_loader
+from datasets.data_watcher import StreamSampler
+from datasets.read_ahead import ReadAhead
+
+
+class DelayedReadAhead(ReadAhead):
+    """A ReadAhead whose reads take opts.benchmark_latency ms longer.
+    """
+
+    def __init__(self, opts):
+        super(DelayedReadAhead, self).__init__(opts)
+        self.latency = opts.benchmark_latency / 1000.0
+
+    def read_file(self, path):
+        time.sleep(self.latency)
+        return super(DelayedReadAhead, self).read_file(path)
+
+
+def run_loader(dataset, sampler, opts):
+    """Iterates one pass of the training loader, returns the symbols and the seconds taken.
+    """
+    training_dataloader, _ = data_loader.dataset_loader(opts, dataset, dataset, sampler)
+    start_time = time.time()
+    symbols = [images for images, _ in training_dataloader]
+    return torch.cat(symbols), time.time() - start_time
+
+
+def main(opts):
+    """Reads the first opts.benchmark_files training files in one shuffled order with the
+    DataLoader workers (no added latency) and with read-ahead settings of increasing depth
+    (with the added latency), and checks that they give the same symbols.
+    """
+    files_train, _ = generate_dataset(opts.root_path, opts.data_dir, opts.ratio_bt_train_and_test,
+                                      opts.code_list, opts.snr_list, opts.bw_list, opts.sf_list,
+                                      opts.instance_list, opts.sorting_type)
+    files = files_train[:opts.benchmark_files]
+    sampler = StreamSampler(opts, files)
+
+    dataset = data_loader.lora_dataset(opts, files)
+    reference, reference_time = run_loader(dataset, sampler, opts)
+    num_files = reference.shape[0]
+
+    print('=' * 80)
+    print('Training loader, {} files, {:.0f} ms added per read'.format(num_files, opts.benchmark_latency).center(80))
+    print('-' * 80)
+    print('{:>22} | {:>10} | {:>10} | {:>10} | {:>10} | {:>6}'.format(
+        'loader', 'files/s', 'MB/s', 'stall s', 'waited', 'same'))
+    print('{:>22} | {:>10.1f} | {:>10} | {:>10} | {:>10} | {:>6}'.format(
+        '{} workers, 0 ms'.format(opts.num_workers), num_files / reference_time, '', '', '', ''))
+    for depth, threads in [(1, 1), (8, 8), (64, 16), (256, 64)]:
+        read_ahead_opts = deepcopy(opts)
+        read_ahead_opts.read_ahead = depth
+        read_ahead_opts.read_ahead_threads = threads
+        dataset.read_ahead = DelayedReadAhead(read_ahead_opts)
+        symbols, _ = run_loader(dataset, sampler, read_ahead_opts)
+        read_ahead = dataset.read_ahead
+        elapsed = time.time() - read_ahead.start_time
+        print('{:>22} | {:>10.1f} | {:>10.1f} | {:>10.2f} | {:>10} | {:>6}'.format(
+            'depth {}, {} threads'.format(depth, threads), read_ahead.files_read / elapsed,
+            read_ahead.bytes_read / 2 ** 20 / elapsed, read_ahead.stall_time, read_ahead.counts['waited'],
+            'yes' if torch.equal(symbols, reference) else 'no'))
+        read_ahead.close()
+    print('=' * 80)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
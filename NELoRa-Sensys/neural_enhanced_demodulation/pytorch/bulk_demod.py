@@ -0,0 +1,153 @@
+# bulk_demod.py
+
+from __future__ import print_function
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+
+from datasets.mat_reader import load_complex
+from utils import signal_to_network_input, inference_mode
+
+
+def list_symbol_files(input_dir):
+    """Returns the sorted paths of all .mat files under input_dir.
+    """
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        paths += [os.path.join(root, name) for name in files if name.endswith('.mat')]
+    return sorted(paths)
+
+
+def read_symbol(path, feature_name):
+    """Reads one chirp symbol from a .mat file.
+    """
+    return load_complex(path, feature_name)
+
+
+def demodulate_shard(worker, batches, mask_CNN, C_XtoY, opts, output_dir, cores, results_queue=None):
+    """Demodulates the batches (lists of paths) of one worker and appends file, predicted
+       code and softmax confidence to predictions_[worker].csv after every batch. The
+       files of the next batch are read by opts.bulk_readers threads during inference.
+    """
+    if cores is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+        torch.set_num_threads(len(cores))
+
+    num_symbols = 0
+    start_time = time.time()
+    with open(os.path.join(output_dir, 'predictions_{:02d}.csv'.format(worker)), 'w') as writer, \
+            ThreadPoolExecutor(opts.bulk_readers) as readers:
+        writer.write('file,predicted,confidence\n')
+        futures = [readers.submit(read_symbol, path, opts.feature_name) for path in batches[0]] if batches else []
+        for batch_index, batch in enumerate(batches):
+            symbols = torch.from_numpy(np.stack([future.result() for future in futures]))
+            if batch_index + 1 < len(batches):
+                futures = [readers.submit(read_symbol, path, opts.feature_name)
+                           for path in batches[batch_index + 1]]
+
+            with inference_mode():
+                if torch.cuda.is_available():
+                    symbols = symbols.cuda()
+                labels_estimated = C_XtoY(mask_CNN(signal_to_network_input(symbols, opts)))
+                confidence, predicted = torch.max(F.softmax(labels_estimated, dim=1), 1)
+
+            writer.write(''.join('{},{},{:.4f}\n'.format(os.path.basename(path), code, score) for path, code, score
+                                 in zip(batch, predicted.tolist(), confidence.tolist())))
+            writer.flush()
+            num_symbols += len(batch)
+
+    elapsed = time.time() - start_time
+    if results_queue is not None:
+        results_queue.put((worker, num_symbols, elapsed))
+    return num_symbols, elapsed
+
+
+def run_bulk(paths, mask_CNN, C_XtoY, opts, num_workers, output_dir):
+    """Splits paths into batches of opts.bulk_batch_size, deals them round-robin to
+       num_workers forked processes pinned to disjoint core sets, and returns the
+       per-worker (symbols, seconds) and the wall-clock time. The models are put in
+       eval mode and their weights in shared memory before forking. A worker that dies
+       is reported and left out of the stats.
+    """
+    mask_CNN.eval()
+    C_XtoY.eval()
+    batches = [paths[start:start + opts.bulk_batch_size] for start in range(0, len(paths), opts.bulk_batch_size)]
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    start_time = time.time()
+    if num_workers == 1 or torch.cuda.is_available():
+        stats = {0: demodulate_shard(0, batches, mask_CNN, C_XtoY, opts, output_dir, None)}
+        return stats, time.time() - start_time
+
+    mask_CNN.share_memory()
+    C_XtoY.share_memory()
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    core_sets = [[int(core) for core in core_set] for core_set in np.array_split(cores, min(num_workers, len(cores)))]
+
+    context = mp.get_context('fork')
+    results_queue = context.Queue()
+    processes = []
+    for worker in range(num_workers):
+        process = context.Process(target=demodulate_shard, args=(
+            worker, batches[worker::num_workers], mask_CNN, C_XtoY, opts, output_dir,
+            core_sets[worker % len(core_sets)], results_queue))
+        process.start()
+        processes.append(process)
+    stats = {}
+    running = dict(enumerate(processes))
+    while running:
+        try:
+            worker, num_symbols, elapsed = results_queue.get(timeout=10)
+        except queue.Empty:
+            for worker, process in list(running.items()):
+                if not process.is_alive() and process.exitcode != 0:
+                    print('Worker {} failed with exit code {}, predictions_{:02d}.csv only has the batches '
+                          'done before'.format(worker, process.exitcode, worker))
+                    running.pop(worker)
+            continue
+        stats[worker] = (num_symbols, elapsed)
+        running.pop(worker).join()
+    return stats, time.time() - start_time
+
+
+def report_bulk(stats, elapsed):
+    """Prints the symbols and throughput of every worker and of the whole run.
+    """
+    print('=' * 80)
+    print('Bulk demodulation'.center(80))
+    print('-' * 80)
+    print('{:>8} | {:>10} | {:>10} | {:>12}'.format('worker', 'symbols', 'time (s)', 'symbols/s'))
+    for worker in sorted(stats):
+        num_symbols, worker_elapsed = stats[worker]
+        print('{:>8d} | {:>10d} | {:>10.2f} | {:>12.1f}'.format(
+            worker, num_symbols, worker_elapsed, num_symbols / max(worker_elapsed, 1e-9)))
+    print('-' * 80)
+    total = sum(num_symbols for num_symbols, _ in stats.values())
+    print('{} symbols in {:.2f} s: {:.1f} symbols/s'.format(total, elapsed, total / max(elapsed, 1e-9)))
+    print('=' * 80)
+
+
+def report_scaling(paths, mask_CNN, C_XtoY, opts, max_workers, output_dir):
+    """Runs paths with 1, 2, 4, ... max_workers workers and prints the speedup and
+       parallel efficiency against one worker.
+    """
+    counts = sorted(set([2 ** k for k in range(int(np.log2(max_workers)) + 1)] + [max_workers]))
+    print('=' * 80)
+    print('Bulk demodulation scaling, {} symbols'.format(len(paths)).center(80))
+    print('-' * 80)
+    print('{:>8} | {:>10} | {:>12} | {:>8} | {:>10}'.format('workers', 'time (s)', 'symbols/s', 'speedup', 'efficiency'))
+    baseline = None
+    for num_workers in counts:
+        _, elapsed = run_bulk(paths, mask_CNN, C_XtoY, opts, num_workers, output_dir)
+        baseline = elapsed if baseline is None else baseline
+        print('{:>8d} | {:>10.2f} | {:>12.1f} | {:>8.2f} | {:>10.2f}'.format(
+            num_workers, elapsed, len(paths) / elapsed, baseline / elapsed, baseline / elapsed / num_workers))
+    print('=' * 80)
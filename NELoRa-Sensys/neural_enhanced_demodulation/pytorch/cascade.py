@@ -0,0 +1,96 @@
+# cascade.py
+
+from __future__ import print_function
+import time
+
+import numpy as np
+import torch
+
+from utils import to_var, signal_to_network_input, parse_file_names
+from chirp_utils import dechirp_decode
+
+
+class CascadeDemodulator(object):
+    """Decides every symbol with the dechirp + FFT baseline first and only forwards
+       the symbols whose peak-to-second-peak ratio is below opts.cascade_threshold
+       to mask_CNN + C_XtoY.
+    """
+
+    def __init__(self, mask_CNN, C_XtoY, opts):
+        self.mask_CNN = mask_CNN.eval()
+        self.C_XtoY = C_XtoY.eval()
+        self.opts = opts
+
+    def neural(self, symbols):
+        """Classifies symbols [B, nsamp] with the neural path only.
+        """
+        if symbols.shape[0] == 0:
+            return torch.zeros(0, dtype=torch.long, device=symbols.device)
+        with torch.no_grad():
+            labels_estimated = self.C_XtoY(self.mask_CNN(signal_to_network_input(symbols, self.opts)))
+        return torch.max(labels_estimated, 1)[1]
+
+    def demodulate(self, symbols):
+        """Returns the decoded codes of symbols [B, nsamp] and the mask of the
+           symbols that were routed to the neural path.
+        """
+        opts = self.opts
+        with torch.no_grad():
+            codes, confidence = dechirp_decode(symbols, opts.sf, opts.bw, opts.fs)
+        routed = confidence < opts.cascade_threshold
+        codes[routed] = self.neural(symbols[routed])
+        return codes, routed
+
+
+def evaluate_cascade(testing_dataloader_X, mask_CNN, C_XtoY, opts):
+    """Runs the cascade and the all-neural path over the test set and prints the
+       per-SNR SER of both, the fraction of routed symbols and the throughput.
+    """
+    cascade = CascadeDemodulator(mask_CNN, C_XtoY, opts)
+
+    right = {'cascade': np.zeros(len(opts.snr_list)), 'neural': np.zeros(len(opts.snr_list))}
+    routed_count = np.zeros(len(opts.snr_list))
+    count = np.zeros(len(opts.snr_list))
+    elapsed = {'cascade': 0.0, 'neural': 0.0}
+
+    for iteration, (images_X_test, name_X_test) in enumerate(testing_dataloader_X):
+        _, snr_X_test_mapping, _, labels_X_test_mapping = parse_file_names(name_X_test)
+        images_X_test = to_var(images_X_test)
+        labels_X_test = to_var(torch.tensor(labels_X_test_mapping))
+        snr_index = np.array([opts.snr_list.index(snr) for snr in snr_X_test_mapping])
+
+        start_time = time.time()
+        codes_cascade, routed = cascade.demodulate(images_X_test)
+        elapsed['cascade'] += time.time() - start_time
+
+        start_time = time.time()
+        codes_neural = cascade.neural(images_X_test)
+        elapsed['neural'] += time.time() - start_time
+
+        np.add.at(right['cascade'], snr_index, (codes_cascade == labels_X_test).cpu().numpy())
+        np.add.at(right['neural'], snr_index, (codes_neural == labels_X_test).cpu().numpy())
+        np.add.at(routed_count, snr_index, routed.cpu().numpy())
+        np.add.at(count, snr_index, 1)
+
+        if iteration % opts.log_step == 0:
+            print('Testing Iteration [{:5d}/{:5d}]'.format(iteration, len(testing_dataloader_X)))
+
+    print('=' * 80)
+    print('Cascade threshold: {}'.format(opts.cascade_threshold).center(80))
+    print('-' * 80)
+    print('{:>8} | {:>8} | {:>12} | {:>12} | {:>8}'.format('SNR', 'count', 'SER cascade', 'SER neural', 'routed'))
+    for snr_index, snr in enumerate(opts.snr_list):
+        if count[snr_index] == 0:
+            continue
+        print('{:>8d} | {:>8d} | {:>12.4f} | {:>12.4f} | {:>8.3f}'.format(
+            snr, int(count[snr_index]),
+            1 - right['cascade'][snr_index] / count[snr_index],
+            1 - right['neural'][snr_index] / count[snr_index],
+            routed_count[snr_index] / count[snr_index]))
+    print('-' * 80)
+    total = count.sum()
+    print('Routed to the neural path: {:.3f}'.format(routed_count.sum() / total))
+    print('Throughput cascade: {:.1f} symbols/s | neural: {:.1f} symbols/s'.format(
+        total / elapsed['cascade'], total / elapsed['neural']))
+    print('=' * 80)
+    return right, routed_count, count, elapsed
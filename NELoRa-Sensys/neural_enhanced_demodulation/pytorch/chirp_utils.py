@@ -0,0 +1,86 @@
+# chirp_utils.py
+# Batched torch versions of the MATLAB chirp helpers (Utils.gen_symbol,
+# chirp_dchirp_fft, chirp_comp_alias, chirp_abs_alias).
+
+import functools
+import math
+
+import numpy as np
+import torch
+
+
+def gen_symbol(code_word, down, sf, bw, fs):
+    """Generates one (up or down) chirp symbol of fs * 2^sf / bw samples.
+    """
+    num_samp = fs * 2 ** sf // bw
+    t = np.arange(num_samp) / fs
+    f0 = -bw / 2
+    phase = 2 * np.pi * (f0 * t + bw / (2 * 2 ** sf / bw) * t ** 2)
+    baseline = np.cos(phase + np.pi / 2) + 1j * np.cos(phase)
+    if down:
+        baseline = np.conj(baseline)
+    baseline = np.tile(baseline, 2)
+    offset = int(round((2 ** sf - code_word) / 2 ** sf * num_samp))
+    return torch.tensor(baseline[offset:offset + num_samp], dtype=torch.cfloat)
+
+
+@functools.lru_cache(maxsize=None)
+def base_downchirp(sf, bw, fs):
+    """The base downchirp of dechirp_fft, generated once per (sf, bw, fs).
+    """
+    return gen_symbol(0, True, sf, bw, fs)
+
+
+def dechirp_fft(symbols, nfft, sf, bw, fs):
+    """Multiplies symbols [..., nsamp] with the base downchirp and returns the nfft-point FFT.
+    """
+    dn_chirp = base_downchirp(sf, bw, fs).to(symbols.device)
+    return torch.fft.fft(symbols * dn_chirp, n=nfft, dim=-1)
+
+
+def bins_to_codes(scores):
+    """Reorders per-bin scores [..., 2^sf] of the dechirped, alias-folded FFT into per-code
+       scores: the peak of code c is in bin -c mod 2^sf.
+    """
+    return torch.roll(torch.flip(scores, [-1]), 1, -1)
+
+
+def abs_alias(rz, over_rate):
+    """Folds the two aliased copies of the spectrum by adding their magnitudes.
+    """
+    target_nfft = int(round(rz.shape[-1] / over_rate))
+    return torch.abs(rz[..., :target_nfft]) + torch.abs(rz[..., -target_nfft:])
+
+
+def comp_alias(rz, over_rate, step=0.01):
+    """Folds the two aliased copies of the spectrum with the phase compensation that
+       gives the highest peak. Returns the folded spectrum and the compensation.
+    """
+    target_nfft = int(round(rz.shape[-1] / over_rate))
+    cut1 = rz[..., :target_nfft].unsqueeze(-2)
+    cut2 = rz[..., -target_nfft:].unsqueeze(-2)
+    comp = 2 * math.pi * torch.arange(0, 1, step, device=rz.device)
+    rotation = torch.exp(1j * comp).to(rz.dtype).unsqueeze(-1)
+    candidates = cut1 + cut2 * rotation
+    best = torch.abs(candidates).max(dim=-1)[0].argmax(dim=-1)
+    index = best[..., None, None].expand(*best.shape, 1, target_nfft)
+    return torch.gather(candidates, -2, index).squeeze(-2), comp[best]
+
+
+def dechirp_decode(symbols, sf, bw, fs, upsampling=8, step=0.05):
+    """Baseline dechirp decision for symbols [B, nsamp] as in generate_baseline.m,
+       folding the aliases with a coarser phase search (step) to keep it cheap.
+       Returns the decoded codes and the ratio of the peak to the highest value
+       outside of its main lobe and first sidelobes as a confidence score.
+    """
+    nsamp = symbols.shape[-1]
+    rz = dechirp_fft(symbols, nsamp * upsampling, sf, bw, fs)
+    spectrum = torch.abs(comp_alias(rz, fs / bw, step)[0])
+    peak, peak_index = torch.max(spectrum, dim=-1)
+    codes = torch.remainder(2 ** sf - torch.round((peak_index + 1).float() / upsampling).long(), 2 ** sf)
+
+    num_bins = spectrum.shape[-1]
+    distance = torch.remainder(torch.arange(num_bins, device=spectrum.device) - peak_index.unsqueeze(-1), num_bins)
+    main_lobe = torch.min(distance, num_bins - distance) <= 2 * upsampling
+    second_peak = torch.max(spectrum.masked_fill(main_lobe, 0), dim=-1)[0]
+    return codes, peak / second_peak.clamp(min=1e-12)
@@ -1,4 +1,6 @@
 import argparse
+import json
+import os
 import numpy as np
 
 
@@ -13,12 +15,87 @@ def create_parser():
                         default=0,
                         help='The selected gpu.')
 
+    parser.add_argument('--input_mode',
+                        type=str,
+                        default='stft',
+                        choices=['stft', 'dechirp'],
+                        help='The network input: the STFT image, or the dechirped FFT folded into 2^sf bins '
+                             '(with the compact DechirpMaskModel and DechirpClassifier).')
+    parser.add_argument('--stft_mode',
+                        type=str,
+                        default='full',
+                        choices=['full', 'band'],
+                        help='The STFT input: the full stft_nfft-point STFT, or only the freq_size bins the network '
+                             'keeps, by a chirp-z transform from 8x oversampling on (same values, see '
+                             'benchmark_front_end.py).')
+    parser.add_argument('--dechirp_windows',
+                        type=int,
+                        default=1,
+                        help='The number of sub-window FFTs stacked in the dechirp input mode.')
+    parser.add_argument('--dechirp_channels',
+                        type=int,
+                        default=32,
+                        help='The number of conv channels of the dechirp mode models.')
     parser.add_argument('--x_image_channel', type=int, default=2)
     parser.add_argument('--y_image_channel', type=int, default=2)
     parser.add_argument('--conv_kernel_size', type=int, default=3)
     parser.add_argument('--conv_padding_size', type=int, default=1)
     parser.add_argument('--lstm_dim', type=int, default=400)  # For mask_CNN model
     parser.add_argument('--fc1_dim', type=int, default=600)  # For mask_CNN model
+    parser.add_argument('--mask_head',
+                        type=str,
+                        default='lstm',
+                        choices=['lstm', 'tcn'],
+                        help='The temporal layer of the mask models: bidirectional LSTM or dilated temporal convolutions.')
+
+    parser.add_argument('--lstm_proj_dim',
+                        type=int,
+                        default=0,
+                        help='Project the 8 * 2^sf features per frame to this size before the mask head (0: none).')
+    parser.add_argument('--classifier',
+                        type=str,
+                        default='hybrid',
+                        choices=['hybrid', 'factorized'],
+                        help='The classifier: classificationHybridModel or its low-rank factorized version.')
+    parser.add_argument('--classifier_rank',
+                        type=int,
+                        default=256,
+                        help='The rank of the fully connected layers of the factorized classifier.')
+    parser.add_argument('--memory_saving',
+                        action='store_true',
+                        default=False,
+                        help='Choose whether to train maskCNNModel with activation checkpointing (for high SF).')
+    parser.add_argument('--checkpoint_segments',
+                        type=int,
+                        default=4,
+                        help='The number of checkpointed segments of the conv stack in memory saving mode.')
+    parser.add_argument('--time_chunk',
+                        type=int,
+                        default=8,
+                        help='The number of time frames per checkpointed FC chunk in memory saving mode.')
+
+    parser.add_argument('--benchmark_sf',
+                        nargs='+',
+                        default=list(range(7, 13)),
+                        type=int,
+                        help='The spreading factors measured by the benchmark scripts.')
+    parser.add_argument('--benchmark_files',
+                        type=int,
+                        default=2000,
+                        help='The number of data files read by benchmark_mat_reader.py and benchmark_read_ahead.py.')
+    parser.add_argument('--benchmark_repeats',
+                        type=int,
+                        default=3,
+                        help='The number of timed iterations per benchmark setting.')
+    parser.add_argument('--benchmark_latency',
+                        type=float,
+                        default=20.0,
+                        help='The latency in ms added to every file read by benchmark_read_ahead.py.')
+
+    parser.add_argument('--benchmark_max_params',
+                        type=int,
+                        default=500000000,
+                        help='The number of parameters above which the benchmark scripts only count a model.')
 
     parser.add_argument('--sf',
                         type=int,
@@ -65,10 +142,10 @@ def create_parser():
     )
     parser.add_argument(
         '--load_iters',
-        type=int,
-        default=100000,
+        type=str,
+        default='100000',
         help=
-        'The number of training iterations to run (you can Ctrl-C out earlier if you want).'
+        'The prefix of the loaded checkpoint: the iteration, or best for the best validated model.'
     )
     parser.add_argument('--batch_size',
                         type=int,
@@ -80,6 +157,19 @@ def create_parser():
         type=int,
         default=1,
         help='The number of threads to use for the DataLoader.')
+    parser.add_argument('--num_threads',
+                        type=int,
+                        default=0,
+                        help='The number of PyTorch intra-op threads (0: PyTorch default).')
+    parser.add_argument('--num_interop_threads',
+                        type=int,
+                        default=0,
+                        help='The number of PyTorch inter-op threads (0: PyTorch default).')
+    parser.add_argument('--profile',
+                        type=str,
+                        default='',
+                        help='A throughput profile written by main_autotune.py, it sets batch_size, num_workers '
+                             'and the thread counts.')
     parser.add_argument('--lr',
                         type=float,
                         default=0.0002,
@@ -153,10 +243,222 @@ def create_parser():
         default=0.8,
         help='The ratio between the train and the test dataset')
 
+    # Training sampler
+    parser.add_argument('--sampler',
+                        type=str,
+                        default='sequential',
+                        choices=['sequential', 'curriculum'],
+                        help='The order of the training files: fixed, or the SNR curriculum with hard-example oversampling.')
+    parser.add_argument('--curriculum_iters',
+                        type=int,
+                        default=20000,
+                        help='The iteration at which the curriculum reaches the lowest SNR.')
+    parser.add_argument('--curriculum_acc_threshold',
+                        type=float,
+                        default=0.9,
+                        help='The running accuracy at which an SNR bucket lets the curriculum move on early.')
+    parser.add_argument('--hard_example_ratio',
+                        type=float,
+                        default=0.5,
+                        help='The share of the sampling weight given by the last loss of a sample (0 for uniform).')
+    parser.add_argument('--sampler_plan_iters',
+                        type=int,
+                        default=200,
+                        help='The number of batches the curriculum sampler plans at once.')
+    parser.add_argument('--target_ser',
+                        nargs='+',
+                        default=[],
+                        type=float,
+                        help='The SER to reach, one value or one per SNR in snr_list, for the time-to-target report.')
+    parser.add_argument('--target_eval_every',
+                        type=int,
+                        default=1000,
+                        help='The number of iterations between the time-to-target evaluations.')
+    parser.add_argument('--target_eval_batches',
+                        type=int,
+                        default=0,
+                        help='The number of test batches per time-to-target evaluation, 0 for all.')
+
+    # Hyperparameter sweep
+    parser.add_argument('--sweep',
+                        nargs='+',
+                        default=[],
+                        type=str,
+                        help='The swept options as name=value1,value2 (e.g. lr=0.0002,0.0005 lstm_dim=200,400), '
+                             'the elements of list options separated by ":" (e.g. snr_list=-10:-5,0:5).')
+    parser.add_argument('--sweep_parallel',
+                        type=int,
+                        default=0,
+                        help='The number of trials run at once, each on its own core set (0: as many as cores allow).')
+    parser.add_argument('--sweep_report_every',
+                        type=int,
+                        default=1000,
+                        help='The number of iterations between the loss reports compared across trials.')
+    parser.add_argument('--sweep_grace_reports',
+                        type=int,
+                        default=2,
+                        help='The number of loss reports before a trial can be stopped for being worse than the median.')
+
+    # Structured pruning
+    parser.add_argument('--prune_target',
+                        type=float,
+                        default=0.0,
+                        help='The final fraction of conv channels and fc neurons removed during training (0: off).')
+    parser.add_argument('--prune_start',
+                        type=int,
+                        default=10000,
+                        help='The iteration of the first pruning step.')
+    parser.add_argument('--prune_end',
+                        type=int,
+                        default=50000,
+                        help='The iteration at which opts.prune_target is reached.')
+    parser.add_argument('--prune_every',
+                        type=int,
+                        default=5000,
+                        help='The number of iterations between pruning steps.')
+    parser.add_argument('--prune_eval_batches',
+                        type=int,
+                        default=20,
+                        help='The number of test batches for the SER of every sparsity level.')
+    parser.add_argument('--prune_latency_repeats',
+                        type=int,
+                        default=10,
+                        help='The number of timed inference batches for the latency of every sparsity level.')
+
+    # Throughput autotuning
+    parser.add_argument('--autotune_mode',
+                        type=str,
+                        default='train',
+                        choices=['train', 'inference'],
+                        help='Tune the training step (forward and backward) or inference only.')
+    parser.add_argument('--autotune_batch_sizes',
+                        nargs='+',
+                        default=[8, 16, 32, 64],
+                        type=int,
+                        help='The batch sizes tried by the autotuner.')
+    parser.add_argument('--autotune_threads',
+                        nargs='+',
+                        default=[],
+                        type=int,
+                        help='The intra-op thread counts tried by the autotuner (default: 1, 2, 4, ... cores).')
+    parser.add_argument('--autotune_interop_threads',
+                        nargs='+',
+                        default=[1, 2, 4],
+                        type=int,
+                        help='The inter-op thread counts tried by the autotuner.')
+    parser.add_argument('--autotune_workers',
+                        nargs='+',
+                        default=[0, 1, 2, 4],
+                        type=int,
+                        help='The DataLoader worker counts tried by the autotuner.')
+    parser.add_argument('--autotune_batches',
+                        type=int,
+                        default=10,
+                        help='The number of timed batches per autotuner setting.')
+    parser.add_argument('--autotune_warmup',
+                        type=int,
+                        default=2,
+                        help='The number of untimed batches before the timed ones.')
+    parser.add_argument('--autotune_timeout',
+                        type=float,
+                        default=600,
+                        help='The seconds after which an autotuner setting is stopped and counted as failed.')
+    parser.add_argument('--autotune_output',
+                        type=str,
+                        default='',
+                        help='Where to write the profile (default: [root_path]/[dir_comment]_profile.json).')
+
+    # Multi-student distillation
+    parser.add_argument('--students',
+                        nargs='+',
+                        default=[],
+                        type=str,
+                        help='Distill one student per spec in a single pass, each spec as name=value,name=value '
+                             '(e.g. lstm_dim=200,fc1_dim=300 mask_head=tcn), "" for the defaults. The elements '
+                             'of list options are separated by ":".')
+
+    # Budgeted training
+    parser.add_argument('--stop_metric',
+                        type=str,
+                        default='ser',
+                        choices=['ser', 'loss'],
+                        help='The value checked for a plateau: the SER on stop_eval_batches validation batches, or the '
+                             'running mean of the training loss.')
+    parser.add_argument('--stop_patience',
+                        type=int,
+                        default=0,
+                        help='The number of checks without improvement after which training stops (0: off).')
+    parser.add_argument('--stop_min_delta',
+                        type=float,
+                        default=0.01,
+                        help='The relative decrease of the checked value that counts as an improvement.')
+    parser.add_argument('--stop_check_every',
+                        type=int,
+                        default=1000,
+                        help='The number of iterations between plateau checks.')
+    parser.add_argument('--stop_eval_batches',
+                        type=int,
+                        default=20,
+                        help='The number of validation batches of the SER plateau check.')
+    parser.add_argument('--max_train_time',
+                        type=float,
+                        default=0,
+                        help='The wall-clock budget of the training loop in seconds (0: off).')
+    parser.add_argument('--max_train_iters',
+                        type=int,
+                        default=0,
+                        help='The iteration budget, below train_iters (0: off).')
+
+    # Continuous training
+    parser.add_argument('--watch_every',
+                        type=int,
+                        default=500,
+                        help='The number of iterations between polls of data_dir for new files (main_continuous.py).')
+    parser.add_argument('--watch_settle',
+                        type=float,
+                        default=2.0,
+                        help='The seconds a new file must be unmodified before it is used.')
+    parser.add_argument('--keep_checkpoints',
+                        type=int,
+                        default=0,
+                        help='Also save [iteration]_*.pkl checkpoints and keep the newest ones (0: off).')
+
+    # Read-ahead
+    parser.add_argument('--read_ahead',
+                        type=int,
+                        default=0,
+                        help='The number of files read ahead of the loaders in sampler order by a thread pool, '
+                             'for high-latency storage (0: off, files are read by the DataLoader workers).')
+    parser.add_argument('--read_ahead_threads',
+                        type=int,
+                        default=16,
+                        help='The number of concurrent file reads of each read-ahead loader.')
+    parser.add_argument('--read_ahead_mb',
+                        type=int,
+                        default=256,
+                        help='The MB of file bytes each read-ahead loader may buffer.')
+
+    # Validation during training
+    parser.add_argument('--validate_every',
+                        type=int,
+                        default=0,
+                        help='The number of iterations between background validations (0: off).')
+    parser.add_argument('--validation_batches',
+                        type=int,
+                        default=20,
+                        help='The number of validation batches the background validation scores.')
+    parser.add_argument('--validation_ratio',
+                        type=float,
+                        default=0.1,
+                        help='The fraction of the training files held out, by file name, as the validation split '
+                             'the weights are selected on (only with --validate_every or the SER budget check).')
+
     parser.add_argument('--checkpoint_dir',
                         type=str,
                         default='checkpoints')
     parser.add_argument('--dir_comment', type=str, default='sf_125k')
+    parser.add_argument('--compare_dir_comment', type=str, default='',
+                        help='The dir_comment of a second run to compare against in the benchmark scripts.')
     parser.add_argument('--sample_dir', type=str, default='samples')
     parser.add_argument('--testing_dir', type=str, default='testing')
     # parser.add_argument('--load', type=str, default='pre_trained')
@@ -165,4 +467,208 @@ def create_parser():
     parser.add_argument('--sample_every', type=int, default=10000)
     parser.add_argument('--checkpoint_every', type=int, default=5000)
 
+    # Test results
+    parser.add_argument('--results_topk',
+                        type=int,
+                        default=0,
+                        help='The number of top logits (float16) kept per test symbol, 0 to keep none.')
+    parser.add_argument('--results_chunk_rows',
+                        type=int,
+                        default=65536,
+                        help='The number of rows per memory-mapped results chunk.')
+    parser.add_argument('--results_db',
+                        type=str,
+                        default='results.db',
+                        help='The SQLite results store (relative to evaluations_dir) every test evaluation is added to, '
+                             'empty to disable.')
+    parser.add_argument('--results_ingest',
+                        type=str,
+                        nargs='*',
+                        default=[],
+                        help='[dir_comment]_[sf]_[bw]_results directories of a ResultsWriter for main_results.py to add '
+                             'to the store, as the run dir_comment at the checkpoint a training run with the same --load, '
+                             '--load_iters and --train_iters stores its results under.')
+    parser.add_argument('--results_run',
+                        type=str,
+                        default='%',
+                        help='The SQL LIKE pattern of the run names main_results.py reports.')
+
+    # Packet decoding
+    parser.add_argument('--packet_topk',
+                        type=int,
+                        default=3,
+                        help='The number of candidates returned per packet symbol.')
+    parser.add_argument('--lora_cr',
+                        type=int,
+                        default=1,
+                        choices=[1, 2, 3, 4],
+                        help='The coding rate of the packet payload (1:4/5 2:4/6 3:4/7 4:4/8).')
+    parser.add_argument('--lora_ldro',
+                        action='store_true',
+                        default=False,
+                        help='Choose whether the packets use low data rate optimization.')
+    parser.add_argument('--implicit_header',
+                        action='store_true',
+                        default=False,
+                        help='Choose whether the packets are sent without the explicit header.')
+
+    # Packet detection
+    parser.add_argument('--iq_file',
+                        type=str,
+                        default='',
+                        help='The raw capture of interleaved float32 I/Q samples.')
+    parser.add_argument('--iq_offset',
+                        type=int,
+                        default=0,
+                        help='The sample of the capture where the first symbol starts.')
+    parser.add_argument('--iq_stride',
+                        type=int,
+                        default=0,
+                        help='The samples between consecutive symbol windows of the capture (0: one symbol).')
+    parser.add_argument('--iq_chunk_symbols',
+                        type=int,
+                        default=4096,
+                        help='The number of symbol windows per chunk read by one reader.')
+    parser.add_argument('--detect_block_size',
+                        type=int,
+                        default=2 ** 22,
+                        help='The number of samples read from the capture per block.')
+    parser.add_argument('--detect_fft_size',
+                        type=int,
+                        default=2 ** 15,
+                        help='The FFT size of the overlap-save preamble correlation.')
+    parser.add_argument('--detect_preamble_len',
+                        type=int,
+                        default=6,
+                        help='The number of consecutive preamble chirps required for a detection.')
+    parser.add_argument('--detect_threshold',
+                        type=float,
+                        default=0.2,
+                        help='The normalized correlation (0-1) every preamble chirp has to reach.')
+    parser.add_argument('--detect_power_threshold',
+                        type=float,
+                        default=0.0,
+                        help='The mean power below which a correlation frame is skipped.')
+
+    # Cascaded demodulation
+    parser.add_argument('--cascade_threshold',
+                        type=float,
+                        default=2.0,
+                        help='The dechirp peak-to-second-peak ratio below which a symbol is sent to the neural path.')
+
+    # Bulk offline demodulation
+    parser.add_argument('--input_dir',
+                        type=str,
+                        default='',
+                        help='The directory of .mat symbols to demodulate (default: root_path/data_dir).')
+    parser.add_argument('--bulk_output',
+                        type=str,
+                        default='',
+                        help='The directory of the prediction files (default: root_path/[dir_comment]_predictions).')
+    parser.add_argument('--bulk_workers',
+                        type=int,
+                        default=0,
+                        help='The number of inference processes, each on its own cores (0: one per core).')
+    parser.add_argument('--bulk_readers',
+                        type=int,
+                        default=4,
+                        help='The number of file reader threads per inference process.')
+    parser.add_argument('--bulk_batch_size',
+                        type=int,
+                        default=512,
+                        help='The number of symbols per inference batch.')
+    parser.add_argument('--optimize_inference',
+                        action='store_true',
+                        default=False,
+                        help='Choose whether to fold BatchNorm and padding into the convolutions for inference.')
+    parser.add_argument('--bulk_scaling',
+                        type=int,
+                        default=0,
+                        help='Only measure the throughput for 1, 2, 4, ... workers on this many symbols.')
+
+    # Student -> teacher early exit
+    parser.add_argument('--early_exit_score',
+                        type=str,
+                        default='margin',
+                        choices=['margin', 'entropy'],
+                        help='The student confidence: softmax margin or one minus normalized entropy.')
+    parser.add_argument('--early_exit_threshold',
+                        type=float,
+                        default=0.5,
+                        help='The student confidence below which a symbol is escalated to the teacher.')
+    parser.add_argument('--early_exit_target_ser',
+                        type=float,
+                        default=-1,
+                        help='Calibrate the threshold on the test split for this SER (negative to skip).')
+
     return parser
+
+
+def cast_option(raw_opts, name, value, source):
+    """Casts the text value of option name, given in source (e.g. '--sweep'), to the type of
+       its default in raw_opts. The elements of list options are separated by ':' and cast to
+       the type of the default elements. Raises ValueError for unknown options and for list
+       options without default elements to take the type from.
+    """
+    if not hasattr(raw_opts, name):
+        raise ValueError('Unknown option in {}: {}'.format(source, name))
+    default = getattr(raw_opts, name)
+    if isinstance(default, bool):
+        return value.lower() in ['1', 'true', 'yes']
+    if isinstance(default, list):
+        if not default:
+            raise ValueError('The list option {} in {} has no default to take the element type from'.format(
+                name, source))
+        return [type(default[0])(element) for element in value.split(':')]
+    if default is None:
+        return value
+    return type(default)(value)
+
+
+def prepare_opts(opts, student=False, overrides=None):
+    """Derives the model dimensions and the evaluation directories from the parsed arguments.
+       overrides (name -> value) are applied after the --profile settings, before anything is
+       derived. Raises ValueError for input options the models cannot take (student: the
+       options are for StudentMaskCNNModel, which only takes the STFT input).
+    """
+    if opts.server:
+        opts.root_path = '/srv/node/sdb1/lcn/mobisys2021_server'
+
+    if opts.profile:
+        with open(opts.profile) as profile:
+            for name, value in json.load(profile)['settings'].items():
+                setattr(opts, name, value)
+
+    for name, value in (overrides or {}).items():
+        setattr(opts, name, value)
+
+    opts.n_classes = 2 ** opts.sf
+    opts.stft_nfft = opts.n_classes * opts.fs // opts.bw
+
+    opts.stft_window = opts.n_classes // 2
+    opts.stft_overlap = opts.stft_window // 2
+    opts.conv_dim_lstm = opts.n_classes * opts.fs // opts.bw
+    opts.freq_size = opts.n_classes
+
+    if opts.input_mode == 'dechirp':
+        if student:
+            raise ValueError('The student models only take the STFT input, not --input_mode dechirp')
+        if opts.stft_nfft % opts.dechirp_windows != 0:
+            raise ValueError('--dechirp_windows {} does not divide the {} samples of a symbol'.format(
+                opts.dechirp_windows, opts.stft_nfft))
+
+    opts.evaluations_path = os.path.join(opts.root_path, opts.evaluations_dir)
+
+    opts.sample_dir = os.path.join(opts.evaluations_path, opts.dir_comment + "_" + opts.sample_dir)
+
+    opts.checkpoint_dir = os.path.join(opts.evaluations_path, opts.dir_comment + "_" + opts.checkpoint_dir)
+
+    opts.testing_dir = os.path.join(opts.evaluations_path, opts.dir_comment + "_" + opts.testing_dir)
+
+    if opts.results_db:
+        opts.results_db = os.path.join(opts.evaluations_path, opts.results_db)
+
+    if opts.load:
+        opts.sample_dir += ("_" + opts.load)
+        opts.testing_dir += ("_" + opts.load)
+    return opts
@@ -0,0 +1,103 @@
+# curriculum_sampler.py
+
+import numpy as np
+from torch.utils.data import Sampler
+
+
+class CurriculumSampler(Sampler):
+    """Batch sampler for the training loaders that weights the SNR buckets on a
+       curriculum from high to low SNR and oversamples the symbols whose last
+       classification loss was high.
+       * One instance is shared by the X and Y training loaders, both iterate the
+         same planned batches so the noisy and groundtruth symbols stay paired.
+       * A plan covers opts.sampler_plan_iters batches, training_loop re-plans
+         whenever it recreates the loader iterators.
+       * The curriculum pace is the larger of iteration / opts.curriculum_iters and
+         the share of leading buckets whose running accuracy has reached
+         opts.curriculum_acc_threshold, buckets behind the pace are damped.
+    """
+
+    ACCURACY_DECAY = 0.98
+
+    def __init__(self, opts, files_list):
+        self.opts = opts
+        self.index = {name[:-4]: i for i, name in enumerate(files_list)}
+        self.bucket = np.array([opts.snr_list.index(int(name.split('_')[1])) for name in files_list])
+        self.bucket_count = np.bincount(self.bucket, minlength=len(opts.snr_list))
+
+        # rank 0 for the highest SNR, 1 for the lowest
+        num_buckets = len(opts.snr_list)
+        self.order = np.argsort(-np.array(opts.snr_list))
+        self.rank = np.zeros(num_buckets)
+        self.rank[self.order] = np.arange(num_buckets) / max(num_buckets - 1, 1)
+
+        self.loss = np.full(len(files_list), np.log(opts.n_classes))
+        self.accuracy = np.zeros(num_buckets)
+        self.pace = 0.0
+        self.bucket_share = np.zeros(num_buckets)
+        self.batches = []
+        self.plan(0)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+    def plan(self, iteration):
+        """Draws the next opts.sampler_plan_iters batches from the current bucket
+           weights and sample losses.
+        """
+        opts = self.opts
+        passed = self.accuracy[self.order] >= opts.curriculum_acc_threshold
+        unlocked = np.argmin(passed) if not passed.all() else len(passed)
+        self.pace = min(1.0, max(iteration / max(opts.curriculum_iters, 1),
+                                 unlocked / max(len(passed) - 1, 1)))
+        bucket_weight = np.exp(-np.maximum(self.rank - self.pace, 0) / 0.1)
+        bucket_weight[self.bucket_count == 0] = 0
+
+        loss_sum = np.bincount(self.bucket, weights=self.loss, minlength=len(bucket_weight))
+        loss_mean = loss_sum / np.maximum(self.bucket_count, 1)
+        hardness = self.loss / np.maximum(loss_mean[self.bucket], 1e-12)
+        prob = bucket_weight[self.bucket] / self.bucket_count[self.bucket] * \
+            ((1 - opts.hard_example_ratio) + opts.hard_example_ratio * hardness)
+        prob /= prob.sum()
+        self.bucket_share = np.bincount(self.bucket, weights=prob, minlength=len(bucket_weight))
+
+        indices = np.random.choice(len(prob), opts.sampler_plan_iters * opts.batch_size, p=prob)
+        self.batches = indices.reshape(opts.sampler_plan_iters, opts.batch_size).tolist()
+
+    def extend(self, files_list):
+        """Adds new training files (continuous training), they start with the loss of a
+           uniform guess and are drawn from the next plan on.
+        """
+        self.index.update((name[:-4], len(self.bucket) + i) for i, name in enumerate(files_list))
+        bucket = np.array([self.opts.snr_list.index(int(name.split('_')[1])) for name in files_list], dtype=int)
+        self.bucket = np.concatenate([self.bucket, bucket])
+        self.bucket_count = np.bincount(self.bucket, minlength=len(self.opts.snr_list))
+        self.loss = np.concatenate([self.loss, np.full(len(files_list), np.log(self.opts.n_classes))])
+
+    def update(self, names, losses, correct):
+        """Records the per-symbol losses and correctness of a training batch.
+        """
+        indices = np.array([self.index[name] for name in names])
+        self.loss[indices] = losses
+        bucket = self.bucket[indices]
+        count = np.bincount(bucket, minlength=len(self.accuracy))
+        right = np.bincount(bucket, weights=np.asarray(correct, dtype=float), minlength=len(self.accuracy))
+        seen = count > 0
+        rate = 1 - self.ACCURACY_DECAY ** count[seen]
+        self.accuracy[seen] += rate * (right[seen] / count[seen] - self.accuracy[seen])
+
+    def report(self):
+        """Prints the running accuracy and sampling share of every SNR bucket.
+        """
+        print('=' * 80)
+        print('Curriculum pace: {:.3f}'.format(self.pace).center(80))
+        print('-' * 80)
+        print('{:>8} | {:>8} | {:>16} | {:>14}'.format('SNR', 'files', 'running accuracy', 'sampling share'))
+        for bucket in self.order:
+            print('{:>8d} | {:>8d} | {:>16.4f} | {:>14.4f}'.format(
+                self.opts.snr_list[bucket], int(self.bucket_count[bucket]),
+                self.accuracy[bucket], self.bucket_share[bucket]))
+        print('=' * 80)
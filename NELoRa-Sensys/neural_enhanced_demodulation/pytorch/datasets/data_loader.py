@@ -9,10 +9,11 @@ import torch.nn.functional as F
 from torchvision import datasets
 from torchvision import transforms
 
-import scipy.io as scio
-import numpy as np
 from PIL import Image
 
+from datasets.mat_reader import load_complex
+from datasets.read_ahead import ReadAhead, ReadAheadLoader
+
 
 class lora_dataset(data.Dataset):
     'Characterizes a dataset for PyTorch'
@@ -26,33 +27,66 @@ class lora_dataset(data.Dataset):
         self.data_lists = files_list
         self.groundtruth = groundtruth
         self.groundtruth_code = opts.groundtruth_code
+        self.read_ahead = None
 
     def __len__(self):
         'Denotes the total number of samples'
 
         return len(self.data_lists)
 
-    def __getitem__(self, index):
-        'Generates one sample of data'
+    def data_file_path(self, index):
+        'The path of the file of sample index'
         data_file_name = self.data_lists[index]
         if self.groundtruth:
             data_file_name = data_file_name.split("_")
             data_file_name[1] = self.groundtruth_code
             data_file_name = ('_').join(data_file_name)
-        data_file_per = os.path.join(self.data_dir, data_file_name)
+        return os.path.join(self.data_dir, data_file_name)
 
-        lora_img = np.array(
-            scio.loadmat(data_file_per)[self.featrue_name].tolist())
-        lora_img = np.squeeze(lora_img)
-        data_per = torch.tensor(lora_img, dtype=torch.cfloat)
+    def __getitem__(self, index):
+        'Generates one sample of data'
+        data_file_per = self.data_file_path(index)
+
+        stream = self.read_ahead.read(data_file_per) if self.read_ahead is not None else None
+        data_per = torch.from_numpy(load_complex(data_file_per, self.featrue_name, stream))
 
-        label_per = data_file_name[:-4]
+        label_per = os.path.basename(data_file_per)[:-4]
         return data_per, label_per
 
 
+class lora_memory_dataset(data.Dataset):
+    'A lora_dataset decoded once into one (shareable) tensor of symbols'
+
+    def __init__(self, opts, files_list, groundtruth=False):
+        'Reads every file of files_list with opts.num_workers DataLoader workers'
+        loader = DataLoader(dataset=lora_dataset(opts, files_list, None, groundtruth),
+                            batch_size=256,
+                            shuffle=False,
+                            num_workers=opts.num_workers)
+        symbols, self.names = [], []
+        for data_per, label_per in loader:
+            symbols.append(data_per)
+            self.names += list(label_per)
+        self.symbols = torch.cat(symbols) if symbols else torch.zeros(0, dtype=torch.cfloat)
+
+    def share_memory_(self):
+        'Moves the symbols to shared memory so forked processes do not copy them'
+        self.symbols.share_memory_()
+        return self
+
+    def __len__(self):
+        'Denotes the total number of samples'
+        return len(self.names)
+
+    def __getitem__(self, index):
+        'Generates one sample of data'
+        return self.symbols[index], self.names[index]
+
+
 # receive the csi feature map derived by the ray model as the input
-def lora_loader(opts, files_train, files_test, groundtruth):
-    """Creates training and test data loaders.
+def lora_loader(opts, files_train, files_test, groundtruth, train_sampler=None):
+    """Creates training and test data loaders. A train_sampler (batch sampler) replaces
+       the fixed order of the training files, pass the same one for X and Y.
     """
     transform = transforms.Compose([
         transforms.ToTensor(),
@@ -60,13 +94,51 @@ def lora_loader(opts, files_train, files_test, groundtruth):
 
     training_dataset = lora_dataset(opts, files_train, transform, groundtruth)
     testing_dataset = lora_dataset(opts, files_test, transform, groundtruth)
+    if opts.read_ahead > 0:
+        training_dataset.read_ahead = ReadAhead(opts)
+        testing_dataset.read_ahead = ReadAhead(opts)
+    return dataset_loader(opts, training_dataset, testing_dataset, train_sampler)
+
+
+def dataset_loader(opts, training_dataset, testing_dataset, train_sampler=None, num_workers=None):
+    """Creates training and test data loaders over existing datasets. Datasets with a
+       ReadAhead get a ReadAheadLoader, which loads in the main process.
+    """
+    if num_workers is None:
+        num_workers = opts.num_workers
+
+    def loader_class(dataset):
+        return ReadAheadLoader if getattr(dataset, 'read_ahead', None) is not None else DataLoader
 
-    training_dloader = DataLoader(dataset=training_dataset,
-                                  batch_size=opts.batch_size,
-                                  shuffle=False,
-                                  num_workers=opts.num_workers)
-    testing_dloader = DataLoader(dataset=testing_dataset,
-                                 batch_size=opts.batch_size,
-                                 shuffle=False,
-                                 num_workers=opts.num_workers)
+    if train_sampler is None:
+        training_dloader = loader_class(training_dataset)(dataset=training_dataset,
+                                                          batch_size=opts.batch_size,
+                                                          shuffle=False,
+                                                          num_workers=num_workers)
+    else:
+        training_dloader = loader_class(training_dataset)(dataset=training_dataset,
+                                                          batch_sampler=train_sampler,
+                                                          num_workers=num_workers)
+    testing_dloader = testing_loader(opts, testing_dataset, num_workers)
     return training_dloader, testing_dloader
+
+
+def testing_loader(opts, testing_dataset, num_workers=None):
+    """Creates a data loader that reads testing_dataset once in order.
+    """
+    if num_workers is None:
+        num_workers = opts.num_workers
+    loader_class = ReadAheadLoader if getattr(testing_dataset, 'read_ahead', None) is not None else DataLoader
+    return loader_class(dataset=testing_dataset,
+                        batch_size=opts.batch_size,
+                        shuffle=False,
+                        num_workers=num_workers)
+
+
+def validation_loader(opts, files_validation):
+    """Creates the data loader of the noisy symbols of the validation split.
+    """
+    validation_dataset = lora_dataset(opts, files_validation)
+    if opts.read_ahead > 0:
+        validation_dataset.read_ahead = ReadAhead(opts)
+    return testing_loader(opts, validation_dataset)
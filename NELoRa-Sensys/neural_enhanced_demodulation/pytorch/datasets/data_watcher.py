@@ -0,0 +1,146 @@
+# data_watcher.py
+
+import hashlib
+import os
+import time
+
+import numpy as np
+from torch.utils.data import Sampler
+
+
+def stable_split(name, ratio_bt_train_and_test):
+    """Returns True if the file name belongs to the training split. The split only depends
+       on the name, so a file keeps its side across polls and restarts.
+    """
+    position = int(hashlib.md5(name.encode('utf-8')).hexdigest()[:8], 16) / float(2 ** 32)
+    return position < ratio_bt_train_and_test
+
+
+def held_out(name, validation_ratio):
+    """Returns True if the training file name belongs to the validation split. The name is
+       hashed apart from stable_split, so the split draws from the whole training split.
+    """
+    return stable_split(name + '/validation', validation_ratio)
+
+
+class DataWatcher(object):
+    """Picks up the symbol files that arrive in opts.data_dir while training runs.
+       * files_train and files_test are grown in place: the lora_dataset objects built
+         on them (X and Y loaders) see the new files the next time their loaders are
+         iterated, and the train files are also passed to sampler.extend.
+       * A poll lists the directory only if its mtime changed, and only the names not seen
+         before are filtered (snr, sf, bw and instance lists) and split by stable_split.
+       * A new file is taken once it is opts.watch_settle seconds old and its groundtruth
+         file (opts.groundtruth_code) exists, until then it is checked again every poll.
+       * With validation, the training files that held_out selects go to files_validation
+         instead of files_train.
+    """
+
+    def __init__(self, opts, validation=False):
+        self.opts = opts
+        self.validation = validation
+        self.data_src = os.path.join(opts.root_path, opts.data_dir)
+        self.files_train = []
+        self.files_test = []
+        self.files_validation = []
+        self.sampler = None
+        self.names = set()
+        self.pending = set()
+        self.mtime = None
+        self.added = [0, 0]
+
+    def accepts(self, name):
+        fields = name[:-4].split('_')
+        return name.endswith('.mat') and len(fields) >= 6 and \
+            int(fields[1]) in self.opts.snr_list and int(fields[2]) in self.opts.sf_list and \
+            int(fields[3]) in self.opts.bw_list and int(fields[4]) in self.opts.instance_list
+
+    def groundtruth_name(self, name):
+        fields = name.split('_')
+        fields[1] = self.opts.groundtruth_code
+        return '_'.join(fields)
+
+    def poll(self):
+        """Adds the files that arrived since the last poll, returns the number added.
+        """
+        mtime = os.stat(self.data_src).st_mtime
+        # a file created within the mtime granularity of the last listing may not have changed it
+        if mtime != self.mtime or time.time() - mtime < 2:
+            self.mtime = mtime
+            new_names = set(os.listdir(self.data_src)) - self.names
+            self.names |= new_names
+            self.pending |= set(name for name in new_names if self.accepts(name))
+        if not self.pending:
+            return 0
+
+        settled = time.time() - self.opts.watch_settle
+        ready = sorted(name for name in self.pending if self.groundtruth_name(name) in self.names and
+                       os.stat(os.path.join(self.data_src, name)).st_mtime < settled)
+        self.pending.difference_update(ready)
+        new_train = [name for name in ready if stable_split(name, self.opts.ratio_bt_train_and_test)]
+        new_test = [name for name in ready if not stable_split(name, self.opts.ratio_bt_train_and_test)]
+        if self.validation:
+            self.files_validation.extend(name for name in new_train if held_out(name, self.opts.validation_ratio))
+            new_train = [name for name in new_train if not held_out(name, self.opts.validation_ratio)]
+        self.files_train.extend(new_train)
+        self.files_test.extend(new_test)
+        if self.sampler is not None and new_train:
+            self.sampler.extend(new_train)
+        self.added[0] += len(new_train)
+        self.added[1] += len(new_test)
+        return len(ready)
+
+    def wait_for(self, num_train, num_test, num_validation=0):
+        """Polls until there are at least num_train training, num_test test and num_validation
+           validation files.
+        """
+        while True:
+            self.poll()
+            if len(self.files_train) >= num_train and len(self.files_test) >= num_test and \
+                    len(self.files_validation) >= num_validation:
+                self.added = [0, 0]
+                return
+            print('Waiting for data in {}: {} train, {} test, {} validation files'.format(
+                self.data_src, len(self.files_train), len(self.files_test), len(self.files_validation)))
+            time.sleep(max(self.opts.watch_settle, 1))
+
+    def report(self, iteration):
+        print('Iteration [{:5d}] | data: {} train (+{}), {} test (+{}) files, {} pending'.format(
+            iteration, len(self.files_train), self.added[0], len(self.files_test), self.added[1],
+            len(self.pending)))
+        self.added = [0, 0]
+
+
+class StreamSampler(Sampler):
+    """Batch sampler over a growing file list: plan() shuffles all files known so far into
+       full batches. One instance is shared by the X and Y training loaders so the noisy
+       and groundtruth symbols stay paired.
+    """
+
+    def __init__(self, opts, files_list):
+        self.opts = opts
+        self.files_list = files_list
+        self.batches = []
+        self.plan(0)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+    def plan(self, iteration):
+        num_batches = len(self.files_list) // self.opts.batch_size
+        order = np.random.permutation(len(self.files_list))[:num_batches * self.opts.batch_size]
+        self.batches = order.reshape(num_batches, self.opts.batch_size).tolist()
+
+    def extend(self, files):
+        """The files are already in files_list, they are drawn from the next plan on.
+        """
+        pass
+
+    def update(self, names, losses, correct):
+        pass
+
+    def report(self):
+        print('Stream sampler: {} files, {} batches per pass'.format(len(self.files_list), len(self.batches)))
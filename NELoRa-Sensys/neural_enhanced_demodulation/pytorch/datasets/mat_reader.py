@@ -0,0 +1,113 @@
+# mat_reader.py
+# Reader for the MAT v5 files of one complex variable written by the MATLAB scripts
+# (uncompressed or compressed), falling back to scipy.io.loadmat for anything else.
+
+import io
+import struct
+import zlib
+
+import numpy as np
+import scipy.io as scio
+
+MI_MATRIX = 14
+MI_COMPRESSED = 15
+MX_COMPLEX_FLAG = 0x800
+MI_DTYPES = {1: '<i1', 2: '<u1', 3: '<i2', 4: '<u2', 5: '<i4', 6: '<u4', 7: '<f4', 9: '<f8', 12: '<i8', 13: '<u8'}
+
+# (stream length, matrix offset) -> layout of the last file read with that key, see parse_layout
+LAYOUTS = {}
+
+
+def read_element(stream, offset):
+    """Returns the type, payload offset, payload size and the offset of the next element of
+       the data element at offset (regular or small data element format).
+    """
+    data_type, num_bytes = struct.unpack_from('<II', stream, offset)
+    if data_type >> 16:
+        return data_type & 0xffff, offset + 4, data_type >> 16, offset + 8
+    return data_type, offset + 8, num_bytes, offset + 8 + (num_bytes + 7) // 8 * 8
+
+
+def parse_layout(stream, offset, variable_name):
+    """Parses the complex numeric miMATRIX at offset of stream, the only element up to the
+       end of stream. Returns its layout: the dimensions, the dtype, offset and count of the
+       real and imaginary parts, and the tag bytes (everything but the payloads) that any
+       file of the same layout repeats. Returns None for any other content.
+    """
+    data_type, start, num_bytes, end = read_element(stream, offset)
+    if data_type != MI_MATRIX or end != len(stream):
+        return None
+    flags_type, flags_offset, _, position = read_element(stream, start)
+    flags = struct.unpack_from('<I', stream, flags_offset)[0]
+    if flags_type != 6 or not flags & MX_COMPLEX_FLAG or not 6 <= flags & 0xff <= 15:
+        return None
+    dims_type, dims_offset, dims_bytes, position = read_element(stream, position)
+    dims = np.frombuffer(stream, '<i4', dims_bytes // 4, dims_offset)
+    _, name_offset, name_bytes, position = read_element(stream, position)
+    if bytes(stream[name_offset:name_offset + name_bytes]).decode('ascii', 'replace') != variable_name:
+        return None
+
+    parts, tags = [], [(offset, position)]
+    for _ in range(2):
+        part_type, part_offset, part_bytes, next_position = read_element(stream, position)
+        if part_type not in MI_DTYPES:
+            return None
+        dtype = np.dtype(MI_DTYPES[part_type])
+        if part_bytes != int(np.prod(dims)) * dtype.itemsize:
+            return None
+        parts.append((dtype, part_offset, part_bytes // dtype.itemsize))
+        tags.append((position, part_offset))
+        position = next_position
+    if position != len(stream):
+        return None
+    return {'dims': tuple(int(dim) for dim in dims), 'parts': parts,
+            'tags': [(begin, bytes(stream[begin:stop])) for begin, stop in tags]}
+
+
+def matches(stream, layout):
+    return all(stream[begin:begin + len(tag)] == tag for begin, tag in layout['tags'])
+
+
+def decode(stream, layout):
+    """Decodes the payload of stream with layout into a squeezed complex64 array.
+    """
+    (real_dtype, real_offset, count), (imag_dtype, imag_offset, _) = layout['parts']
+    values = np.empty(count, dtype=np.complex64)
+    values.real = np.frombuffer(stream, real_dtype, count, real_offset)
+    values.imag = np.frombuffer(stream, imag_dtype, count, imag_offset)
+    return np.squeeze(values.reshape(layout['dims'], order='F'))
+
+
+def load_complex(path, variable_name, stream=None):
+    """Returns the complex variable variable_name of the MAT file at path (or of its bytes
+       stream, if already read) as a squeezed complex64 array. The header of a layout is
+       parsed once: later files of the same length only have their tag bytes compared
+       before the payload is decoded with np.frombuffer. Files that are not a little-endian
+       MAT v5 file of one complex numeric variable are read with scipy.io.loadmat.
+    """
+    if stream is None:
+        with open(path, 'rb') as mat_file:
+            stream = mat_file.read()
+    raw = stream
+    if len(stream) > 136 and stream[126:128] == b'IM' and stream[124:126] == b'\x00\x01':
+        data_type, start, num_bytes, end = read_element(stream, 128)
+        if data_type == MI_COMPRESSED and start + num_bytes <= len(stream):
+            try:
+                stream, offset = zlib.decompress(stream[start:start + num_bytes]), 0
+            except zlib.error:
+                stream = None
+        else:
+            offset = 128
+        if stream is not None:
+            key = (len(stream), offset)
+            layout = LAYOUTS.get(key)
+            if layout is None or not matches(stream, layout):
+                try:
+                    layout = parse_layout(stream, offset, variable_name)
+                except struct.error:
+                    layout = None
+                if layout is not None:
+                    LAYOUTS[key] = layout
+            if layout is not None:
+                return decode(stream, layout)
+    return np.squeeze(scio.loadmat(io.BytesIO(raw))[variable_name]).astype(np.complex64)
@@ -0,0 +1,134 @@
+# read_ahead.py
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from torch.utils.data import DataLoader
+
+
+class ReadAhead(object):
+    """Reads the files of a dataset ahead of their use from a pool of
+       opts.read_ahead_threads threads, so the latency of a slow (network) filesystem
+       is paid by many concurrent reads instead of one blocking read per symbol.
+       * schedule(paths) gives the order in which read(path) will be called; up to
+         opts.read_ahead files of it are read ahead, with at most opts.read_ahead_mb MB
+         of raw file bytes read or in flight (estimated from the mean file size).
+       * read(path) returns the bytes of path and tops the buffer up again. If the
+         calls leave the scheduled order, the buffer is dropped and path is read
+         directly (a miss).
+       * The time read() blocks is the stall time, report() prints it with the read
+         throughput.
+    """
+
+    def __init__(self, opts):
+        self.depth = opts.read_ahead
+        self.max_bytes = opts.read_ahead_mb * 2 ** 20
+        self.pool = ThreadPoolExecutor(max_workers=opts.read_ahead_threads)
+        self.lock = threading.Lock()
+        self.upcoming = deque()
+        self.buffer = deque()
+        self.reserved = 0
+        self.file_size = 0
+        self.bytes_read = 0
+        self.files_read = 0
+        self.stall_time = 0.0
+        self.counts = {'ready': 0, 'waited': 0, 'missed': 0}
+        self.start_time = None
+
+    def read_file(self, path):
+        with open(path, 'rb') as mat_file:
+            stream = mat_file.read()
+        with self.lock:
+            self.bytes_read += len(stream)
+            self.files_read += 1
+        return stream
+
+    def schedule(self, paths):
+        """Replaces the upcoming order with paths. Reads already issued for the head of
+           paths are kept, the others are dropped.
+        """
+        if self.start_time is None:
+            self.start_time = time.time()
+        paths = deque(paths)
+        kept = deque()
+        while self.buffer and paths and self.buffer[0][0] == paths[0]:
+            kept.append(self.buffer.popleft())
+            paths.popleft()
+        self.clear()
+        self.buffer = kept
+        self.reserved = sum(reserved for _, _, reserved in kept)
+        self.upcoming = paths
+        self.fill()
+
+    def clear(self):
+        for _, future, _ in self.buffer:
+            future.cancel()
+        self.buffer.clear()
+        self.upcoming.clear()
+        self.reserved = 0
+
+    def fill(self):
+        while self.upcoming and len(self.buffer) < self.depth and \
+                (not self.buffer or self.reserved + self.file_size <= self.max_bytes):
+            path = self.upcoming.popleft()
+            self.buffer.append((path, self.pool.submit(self.read_file, path), self.file_size))
+            self.reserved += self.file_size
+
+    def read(self, path):
+        """Returns the bytes of the file at path.
+        """
+        start_time = time.time()
+        if self.buffer and self.buffer[0][0] == path:
+            _, future, reserved = self.buffer.popleft()
+            self.reserved -= reserved
+            self.counts['ready' if future.done() else 'waited'] += 1
+            stream = future.result()
+        else:
+            self.clear()
+            self.counts['missed'] += 1
+            stream = self.read_file(path)
+        self.stall_time += time.time() - start_time
+        with self.lock:
+            self.file_size = self.bytes_read // max(self.files_read, 1)
+        self.fill()
+        return stream
+
+    def report(self, name):
+        elapsed = time.time() - self.start_time if self.start_time is not None else 0.0
+        print('Read-ahead {:>8} | {:7d} files | {:9.1f} MB | {:8.1f} MB/s | stall {:7.1f} s ({:5.1f}%) | '
+              'ready {} waited {} missed {}'.format(
+                  name, self.files_read, self.bytes_read / 2 ** 20, self.bytes_read / 2 ** 20 / max(elapsed, 1e-9),
+                  self.stall_time, 100.0 * self.stall_time / max(elapsed, 1e-9),
+                  self.counts['ready'], self.counts['waited'], self.counts['missed']))
+
+    def close(self):
+        self.clear()
+        self.pool.shutdown(wait=False)
+
+
+class ReadAheadLoader(DataLoader):
+    """DataLoader over a lora_dataset with a ReadAhead: every iterator first schedules the
+       files of all the batches of its batch sampler (which must repeat the same batches
+       until it is re-planned, as the samplers of this repo do). It loads in the main
+       process, the forked workers of a DataLoader would not share the read-ahead buffer.
+    """
+
+    def __init__(self, dataset, **kwargs):
+        kwargs['num_workers'] = 0
+        super(ReadAheadLoader, self).__init__(dataset, **kwargs)
+
+    def __iter__(self):
+        self.dataset.read_ahead.schedule(self.dataset.data_file_path(index)
+                                         for batch in self.batch_sampler for index in batch)
+        return super(ReadAheadLoader, self).__iter__()
+
+
+def report_read_ahead(loaders):
+    """Prints the read-ahead statistics of the named loaders {name: loader} that have one.
+    """
+    for name, loader in loaders.items():
+        read_ahead = getattr(loader.dataset, 'read_ahead', None)
+        if read_ahead is not None:
+            read_ahead.report(name)
@@ -0,0 +1,163 @@
+# early_exit.py
+
+from __future__ import print_function
+import math
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from utils import to_var, signal_to_network_input, parse_file_names
+
+
+def confidence_score(labels_estimated, score_type):
+    """Confidence of the classifier outputs in [0, 1]: the softmax margin between the
+       two best classes, or one minus the normalized softmax entropy.
+    """
+    prob = F.softmax(labels_estimated, dim=1)
+    if score_type == 'margin':
+        top2 = torch.topk(prob, 2, dim=1)[0]
+        return top2[:, 0] - top2[:, 1]
+    entropy = -torch.sum(prob * torch.log(prob.clamp(min=1e-12)), dim=1)
+    return 1 - entropy / math.log(prob.shape[1])
+
+
+class EarlyExitDemodulator(object):
+    """Runs the distilled student first and escalates only the symbols whose
+       confidence is below opts.early_exit_threshold to the teacher pair.
+    """
+
+    def __init__(self, mask_CNN_student, C_XtoY_student, mask_CNN_teacher, C_XtoY_teacher, opts):
+        self.student = (mask_CNN_student.eval(), C_XtoY_student.eval())
+        self.teacher = (mask_CNN_teacher.eval(), C_XtoY_teacher.eval())
+        self.opts = opts
+
+    def demodulate(self, symbols, threshold=None):
+        """Returns the decoded codes of symbols [B, nsamp] and the mask of the escalated symbols.
+        """
+        if threshold is None:
+            threshold = self.opts.early_exit_threshold
+        with torch.no_grad():
+            spectrum = signal_to_network_input(symbols, self.opts)
+            labels_estimated = self.student[1](self.student[0](spectrum))
+            escalated = confidence_score(labels_estimated, self.opts.early_exit_score) < threshold
+            if escalated.any():
+                labels_estimated[escalated] = self.teacher[1](self.teacher[0](spectrum[escalated]))
+        return torch.max(labels_estimated, 1)[1], escalated
+
+
+def collect_scores(testing_dataloader_X, demodulator, opts):
+    """Runs student and teacher over the whole test split once. Returns per-symbol
+       snr, student confidence, student and teacher correctness, and the time per
+       symbol of each model pair.
+    """
+    records = {'snr': [], 'confidence': [], 'student_right': [], 'teacher_right': []}
+    elapsed = {'student': 0.0, 'teacher': 0.0}
+    for iteration, (images_X_test, name_X_test) in enumerate(testing_dataloader_X):
+        _, snr_X_test_mapping, _, labels_X_test_mapping = parse_file_names(name_X_test)
+        images_X_test = to_var(images_X_test)
+        labels_X_test = to_var(torch.tensor(labels_X_test_mapping))
+
+        with torch.no_grad():
+            spectrum = signal_to_network_input(images_X_test, opts)
+            start_time = time.time()
+            labels_student = demodulator.student[1](demodulator.student[0](spectrum))
+            elapsed['student'] += time.time() - start_time
+            start_time = time.time()
+            labels_teacher = demodulator.teacher[1](demodulator.teacher[0](spectrum))
+            elapsed['teacher'] += time.time() - start_time
+
+        records['snr'].append(np.array(snr_X_test_mapping))
+        records['confidence'].append(confidence_score(labels_student, opts.early_exit_score).cpu().numpy())
+        records['student_right'].append((torch.max(labels_student, 1)[1] == labels_X_test).cpu().numpy())
+        records['teacher_right'].append((torch.max(labels_teacher, 1)[1] == labels_X_test).cpu().numpy())
+        if iteration % opts.log_step == 0:
+            print('Calibration Iteration [{:5d}/{:5d}]'.format(iteration, len(testing_dataloader_X)))
+
+    records = {key: np.concatenate(value) for key, value in records.items()}
+    num_symbols = len(records['snr'])
+    time_per_symbol = {key: value / num_symbols for key, value in elapsed.items()}
+    return records, time_per_symbol
+
+
+def calibrate_threshold(records, time_per_symbol, target_ser, num_points=20):
+    """Chooses the lowest threshold whose early-exit SER on the records is at most
+       target_ser, and prints the throughput / accuracy trade-off.
+    """
+    order = np.argsort(records['confidence'])
+    confidence = records['confidence'][order]
+    student_wrong = 1 - records['student_right'][order]
+    teacher_wrong = 1 - records['teacher_right'][order]
+    num_symbols = len(confidence)
+
+    # escalating the k least confident symbols: teacher errors on those, student errors on the rest
+    errors = np.concatenate(([0], np.cumsum(teacher_wrong))) + \
+        np.concatenate((np.cumsum(student_wrong[::-1])[::-1], [0]))
+    ser = errors / num_symbols
+    escalated = np.arange(num_symbols + 1) / num_symbols
+    throughput = 1 / (time_per_symbol['student'] + escalated * time_per_symbol['teacher'])
+    thresholds = np.concatenate((confidence, [np.inf]))
+    thresholds[1:num_symbols] = (confidence[:-1] + confidence[1:]) / 2
+    thresholds[0] = -np.inf
+
+    print('=' * 80)
+    print('Early exit calibration, target SER {:.4f}'.format(target_ser).center(80))
+    print('-' * 80)
+    print('{:>12} | {:>10} | {:>10} | {:>16}'.format('threshold', 'escalated', 'SER', 'symbols/s'))
+    for k in np.unique(np.linspace(0, num_symbols, num_points + 1).astype(int)):
+        print('{:>12.4f} | {:>10.3f} | {:>10.4f} | {:>16.1f}'.format(
+            thresholds[k], escalated[k], ser[k], throughput[k]))
+    print('-' * 80)
+    print('Student only: SER {:.4f}, {:.1f} symbols/s | Teacher only: SER {:.4f}, {:.1f} symbols/s'.format(
+        student_wrong.mean(), 1 / time_per_symbol['student'],
+        teacher_wrong.mean(), 1 / time_per_symbol['teacher']))
+
+    reachable = np.nonzero(ser <= target_ser)[0]
+    if len(reachable) == 0:
+        k = int(np.argmin(ser))
+        print('Target SER not reachable, using the threshold of the lowest SER {:.4f}'.format(ser[k]))
+    else:
+        k = int(reachable[0])
+    print('Chosen threshold: {:.4f} | escalated: {:.3f} | SER: {:.4f} | {:.1f} symbols/s'.format(
+        thresholds[k], escalated[k], ser[k], throughput[k]))
+    print('=' * 80)
+    return float(thresholds[k])
+
+
+def evaluate_early_exit(testing_dataloader_X, demodulator, opts):
+    """Runs the early-exit mode over the test split and prints the measured per-SNR SER,
+       escalated fraction and throughput.
+    """
+    right = np.zeros(len(opts.snr_list))
+    escalated_count = np.zeros(len(opts.snr_list))
+    count = np.zeros(len(opts.snr_list))
+    elapsed = 0.0
+    for images_X_test, name_X_test in testing_dataloader_X:
+        _, snr_X_test_mapping, _, labels_X_test_mapping = parse_file_names(name_X_test)
+        images_X_test = to_var(images_X_test)
+        labels_X_test = to_var(torch.tensor(labels_X_test_mapping))
+        snr_index = np.array([opts.snr_list.index(snr) for snr in snr_X_test_mapping])
+
+        start_time = time.time()
+        codes, escalated = demodulator.demodulate(images_X_test)
+        elapsed += time.time() - start_time
+
+        np.add.at(right, snr_index, (codes == labels_X_test).cpu().numpy())
+        np.add.at(escalated_count, snr_index, escalated.cpu().numpy())
+        np.add.at(count, snr_index, 1)
+
+    print('=' * 80)
+    print('Early exit, threshold {:.4f}'.format(opts.early_exit_threshold).center(80))
+    print('-' * 80)
+    print('{:>8} | {:>8} | {:>10} | {:>10}'.format('SNR', 'count', 'SER', 'escalated'))
+    for snr_index, snr in enumerate(opts.snr_list):
+        if count[snr_index] == 0:
+            continue
+        print('{:>8d} | {:>8d} | {:>10.4f} | {:>10.3f}'.format(
+            snr, int(count[snr_index]), 1 - right[snr_index] / count[snr_index],
+            escalated_count[snr_index] / count[snr_index]))
+    print('-' * 80)
+    print('SER: {:.4f} | escalated: {:.3f} | {:.1f} symbols/s'.format(
+        1 - right.sum() / count.sum(), escalated_count.sum() / count.sum(), count.sum() / elapsed))
+    print('=' * 80)
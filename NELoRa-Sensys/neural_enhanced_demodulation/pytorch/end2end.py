@@ -19,8 +19,18 @@ import scipy.io
 
 import cv2
 # Local imports
-from utils import to_var, to_data, spec_to_network_input
-from models.model_components import maskCNNModel, classificationHybridModel, StudentMaskCNNModel
+from utils import to_var, to_data, signal_to_network_input, parse_file_names, inference_mode
+from results_writer import ResultsWriter
+from results_store import open_store, checkpoint_name
+from time_to_target import TimeToTarget
+from training_budget import TrainingBudget, budget_enabled
+from async_validation import AsyncValidator
+from pruning_schedule import PruningSchedule
+from datasets.curriculum_sampler import CurriculumSampler
+from datasets.data_watcher import StreamSampler
+from datasets.read_ahead import report_read_ahead
+from models.model_components import StudentMaskCNNModel, create_classifier, create_mask_model
+from models.pruning import match_pruned_shapes
 import torch.autograd.profiler as profiler
 import time
 
@@ -46,11 +56,9 @@ def create_model(opts):
     """Builds the generators and discriminators.
     """
 
-    maskCNN = maskCNNModel(opts)
+    maskCNN = create_mask_model(opts)
 
-    C_XtoY = classificationHybridModel(conv_dim_in=opts.y_image_channel,
-                                       conv_dim_out=opts.n_classes,
-                                       conv_dim_lstm=opts.conv_dim_lstm)
+    C_XtoY = create_classifier(opts)
 
     if torch.cuda.is_available():
         maskCNN.cuda()
@@ -75,21 +83,42 @@ def checkpoint(iteration, mask_CNN, C_XtoY, opts):
 
     torch.save(C_XtoY.state_dict(), C_XtoY_path)
 
-def checkpoint_student(iteration, mask_CNN, C_XtoY, opts):
+
+def rolling_checkpoint(iteration, mask_CNN, C_XtoY, opts, saved):
+    """Saves [iteration]_maskCNN.pkl / [iteration]_C_XtoY.pkl and deletes the oldest
+       iterations of saved (the ones of this run) beyond opts.keep_checkpoints.
+    """
+    for suffix, model in [('_maskCNN.pkl', mask_CNN), ('_C_XtoY.pkl', C_XtoY)]:
+        torch.save(model.state_dict(), os.path.join(opts.checkpoint_dir, str(iteration) + suffix))
+    saved.append(iteration)
+    while len(saved) > opts.keep_checkpoints:
+        old_iteration = saved.pop(0)
+        for suffix in ['_maskCNN.pkl', '_C_XtoY.pkl']:
+            os.remove(os.path.join(opts.checkpoint_dir, str(old_iteration) + suffix))
+
+def checkpoint_student(iteration, mask_CNN, C_XtoY, opts, prefix='student'):
     """Saves the parameters of both generators G_YtoX, G_XtoY and discriminators D_X, D_Y.
     """
 
     # mask_CNN_path = os.path.join(opts.checkpoint_dir, str(iteration) + '_maskCNN.pkl')
-    mask_CNN_path = os.path.join(opts.checkpoint_dir, 'student' + '_maskCNN.pkl')
+    mask_CNN_path = os.path.join(opts.checkpoint_dir, prefix + '_maskCNN.pkl')
     
     torch.save(mask_CNN.state_dict(), mask_CNN_path)
 
     # C_XtoY_path = os.path.join(opts.checkpoint_dir, str(iteration) + '_C_XtoY.pkl')
-    C_XtoY_path = os.path.join(opts.checkpoint_dir, 'student' + '_C_XtoY.pkl')
+    C_XtoY_path = os.path.join(opts.checkpoint_dir, prefix + '_C_XtoY.pkl')
 
 
     torch.save(C_XtoY.state_dict(), C_XtoY_path)
 
+def load_or_create_model(opts):
+    """Loads the checkpoint of opts.load_iters, or builds models with random weights if
+       there is no such checkpoint (--load defaults to 'load', so it is always set).
+    """
+    if opts.load and os.path.exists(os.path.join(opts.checkpoint_dir, str(opts.load_iters) + '_maskCNN.pkl')):
+        return load_checkpoint(opts)
+    return create_model(opts)
+
 def load_checkpoint(opts):
     """Loads the generator and discriminator models from checkpoints.
     """
@@ -97,20 +126,20 @@ def load_checkpoint(opts):
     maskCNN_path = os.path.join(opts.checkpoint_dir, str(opts.load_iters) + '_maskCNN.pkl')
     # import pdb
     
-    maskCNN = maskCNNModel(opts)
+    maskCNN = create_mask_model(opts)
 
-    maskCNN.load_state_dict(torch.load(
-        maskCNN_path, map_location=lambda storage, loc: storage),
+    state_dict = torch.load(maskCNN_path, map_location=lambda storage, loc: storage)
+    match_pruned_shapes(maskCNN, state_dict)
+    maskCNN.load_state_dict(state_dict,
         strict=False)
 
     C_XtoY_path = os.path.join(opts.checkpoint_dir, str(opts.load_iters) + '_C_XtoY.pkl')
     print(C_XtoY_path)
-    C_XtoY = classificationHybridModel(conv_dim_in=opts.x_image_channel,
-                                       conv_dim_out=opts.n_classes,
-                                       conv_dim_lstm=opts.conv_dim_lstm)
+    C_XtoY = create_classifier(opts)
 
-    C_XtoY.load_state_dict(torch.load(
-        C_XtoY_path, map_location=lambda storage, loc: storage),
+    state_dict = torch.load(C_XtoY_path, map_location=lambda storage, loc: storage)
+    match_pruned_shapes(C_XtoY, state_dict)
+    C_XtoY.load_state_dict(state_dict,
         strict=False)
 
     if torch.cuda.is_available():
@@ -128,18 +157,44 @@ def load_teacher_model(opts):
     maskCNN_path = os.path.join(opts.checkpoint_dir, str(opts.load_iters) + '_maskCNN.pkl')
     # import pdb
     
-    maskCNN = maskCNNModel(opts)
+    maskCNN = create_mask_model(opts)
 
-    maskCNN.load_state_dict(torch.load(
-        maskCNN_path, map_location=lambda storage, loc: storage),
+    state_dict = torch.load(maskCNN_path, map_location=lambda storage, loc: storage)
+    match_pruned_shapes(maskCNN, state_dict)
+    maskCNN.load_state_dict(state_dict,
         strict=False)
 
     # C_XtoY_path = os.path.join(opts.checkpoint_dir, 'fuck' + '_C_XtoY.pkl')
     C_XtoY_path = os.path.join(opts.checkpoint_dir, str(opts.load_iters) + '_C_XtoY.pkl')
     # print(C_XtoY_path)
-    C_XtoY = classificationHybridModel(conv_dim_in=opts.x_image_channel,
-                                       conv_dim_out=opts.n_classes,
-                                       conv_dim_lstm=opts.conv_dim_lstm)
+    C_XtoY = create_classifier(opts)
+
+    state_dict = torch.load(C_XtoY_path, map_location=lambda storage, loc: storage)
+    match_pruned_shapes(C_XtoY, state_dict)
+    C_XtoY.load_state_dict(state_dict,
+        strict=False)
+
+    if torch.cuda.is_available():
+        maskCNN.cuda()
+        C_XtoY.cuda()
+        print('Models moved to GPU.')
+    
+    return maskCNN, C_XtoY
+
+def load_student_model(opts, prefix='student'):
+    """Loads the distilled student models saved by checkpoint_student.
+    """
+
+    maskCNN_path = os.path.join(opts.checkpoint_dir, prefix + '_maskCNN.pkl')
+
+    maskCNN = StudentMaskCNNModel(opts)
+
+    maskCNN.load_state_dict(torch.load(
+        maskCNN_path, map_location=lambda storage, loc: storage),
+        strict=False)
+
+    C_XtoY_path = os.path.join(opts.checkpoint_dir, prefix + '_C_XtoY.pkl')
+    C_XtoY = create_classifier(opts)
 
     C_XtoY.load_state_dict(torch.load(
         C_XtoY_path, map_location=lambda storage, loc: storage),
@@ -149,9 +204,37 @@ def load_teacher_model(opts):
         maskCNN.cuda()
         C_XtoY.cuda()
         print('Models moved to GPU.')
-    
+
     return maskCNN, C_XtoY
 
+def evaluate_ser(testing_dataloader_X, mask_CNN, C_XtoY, opts, max_batches=None):
+    """Evaluates the models in eval mode under inference_mode over the test split.
+       Returns the per-SNR SER and symbol counts, aligned with opts.snr_list.
+    """
+    modes = (mask_CNN.training, C_XtoY.training)
+    mask_CNN.eval()
+    C_XtoY.eval()
+
+    right = np.zeros(len(opts.snr_list))
+    count = np.zeros(len(opts.snr_list), dtype=int)
+    with inference_mode():
+        for iteration, (images_X_test, name_X_test) in enumerate(testing_dataloader_X):
+            if max_batches is not None and iteration >= max_batches:
+                break
+            _, snr_X_test_mapping, _, labels_X_test_mapping = parse_file_names(name_X_test)
+            images_X_test_spectrum = signal_to_network_input(to_var(images_X_test), opts)
+            labels_X_estimated = C_XtoY(mask_CNN(images_X_test_spectrum))
+            _, labels_X_test_estimated = torch.max(labels_X_estimated, 1)
+
+            snr_index = np.array([opts.snr_list.index(snr) for snr in snr_X_test_mapping])
+            test_right_case = to_data(labels_X_test_estimated) == np.array(labels_X_test_mapping)
+            np.add.at(right, snr_index, test_right_case)
+            np.add.at(count, snr_index, 1)
+
+    mask_CNN.train(modes[0])
+    C_XtoY.train(modes[1])
+    return 1 - right / np.maximum(count, 1), count
+
 def merge_images(sources, targets, batch_size, image_channel):
     """Creates a grid consisting of pairs of columns, where the first column in
     each pair contains images source images and the second column in each pair
@@ -223,20 +306,53 @@ def save_samples_separate(iteration, fixed_Y, fixed_X, mask_CNN, opts,
     # print('Saved {}'.format(path))
 
 
+def validation_enabled(opts):
+    """Returns True if the training selects weights on the validation split, which then has
+    to be held out of the training files (utils.split_validation): the background validation
+    and the SER check of the TrainingBudget.
+    """
+    return opts.validate_every > 0 or (budget_enabled(opts) and opts.stop_metric == 'ser')
+
+
 def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
-                  testing_dataloader_Y, opts):
+                  testing_dataloader_Y, opts, monitor=None, watcher=None, validation_dataloader_X=None):
     """Runs the training loop.
-        * Saves checkpoint every opts.checkpoint_every iterations
+        * Saves checkpoint every opts.checkpoint_every iterations, and keeps the last
+          opts.keep_checkpoints of them by iteration if set
         * Saves generated samples every opts.sample_every iterations
+        * Calls monitor(iteration, G_Y_loss, G_Image_loss, G_Class_loss) every
+          iteration if given, and stops training early when it returns True
+        * Prunes channels and neurons on the schedule of PruningSchedule if opts.prune_target > 0
+        * Polls a DataWatcher every opts.watch_every iterations if given (continuous
+          training) and restarts the loaders on the grown file lists when files arrived
+        * Validates in the background on validation_dataloader_X if opts.validate_every > 0
+        * Stops on a plateau or a time / iteration budget (TrainingBudget) if enabled,
+          and tests the best weights it kept, selected on validation_dataloader_X
+        * Returns the per-SNR accuracy and symbol counts of the test split
     """
     loss_spec = torch.nn.MSELoss(reduction='mean')
-    loss_class = nn.CrossEntropyLoss()
+    loss_class = nn.CrossEntropyLoss(reduction='none')
     # Create generators and discriminators
     if opts.load:
         mask_CNN, C_XtoY = load_checkpoint(opts)
     else:
         mask_CNN, C_XtoY = create_model(opts)
 
+    sampler = training_dataloader_X.batch_sampler
+    if not isinstance(sampler, (CurriculumSampler, StreamSampler)):
+        sampler = None
+    loaders = {'train X': training_dataloader_X, 'train Y': training_dataloader_Y,
+               'test X': testing_dataloader_X, 'test Y': testing_dataloader_Y}
+    if validation_enabled(opts):
+        if validation_dataloader_X is None:
+            raise ValueError('The validation needs the loader of the split held out of the training files')
+        loaders['val X'] = validation_dataloader_X
+    time_to_target = TimeToTarget(opts) if opts.target_ser else None
+    validator = AsyncValidator(validation_dataloader_X, opts) if opts.validate_every > 0 else None
+
+    pruner = PruningSchedule(mask_CNN, C_XtoY, testing_dataloader_X, opts) if opts.prune_target > 0 else None
+    budget = TrainingBudget(validation_dataloader_X, opts) if budget_enabled(opts) else None
+
     g_params = list(mask_CNN.parameters()) + list(C_XtoY.parameters())
     g_optimizer = optim.Adam(g_params, opts.lr, [opts.beta1, opts.beta2])
 
@@ -254,21 +370,29 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
     fixed_Y, name_Y_fixed = test_iter_Y.next()
     fixed_Y = to_var(fixed_Y)
     # print("Fixed_X {}".format(fixed_X.shape))
-    fixed_X_spectrum_raw = torch.stft(input=fixed_X, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
-                                      win_length=opts.stft_window, pad_mode='constant')
-    fixed_X_spectrum = spec_to_network_input(fixed_X_spectrum_raw, opts)
+    fixed_X_spectrum = signal_to_network_input(fixed_X, opts)
     # print("Fixed {}".format(fixed_X_spectrum.shape))
 
-    fixed_Y_spectrum_raw = torch.stft(input=fixed_Y, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
-                                      win_length=opts.stft_window, pad_mode='constant')
-    fixed_Y_spectrum = spec_to_network_input(fixed_Y_spectrum_raw, opts)
+    fixed_Y_spectrum = signal_to_network_input(fixed_Y, opts)
 
     iter_per_epoch = min(len(iter_X), len(iter_Y))
+    rolling_checkpoints = []
 
+    iteration = 0
     for iteration in range(1, opts.train_iters + 1):
-        if iteration % iter_per_epoch == 0:
+        restart = iteration % iter_per_epoch == 0
+        if watcher is not None and iteration % opts.watch_every == 0 and watcher.poll():
+            # the loader iterators (and their workers) hold the file lists of when they started
+            watcher.report(iteration)
+            restart = True
+            if validator is not None:
+                validator.refresh(validation_dataloader_X)
+        if restart:
+            if sampler is not None:
+                sampler.plan(iteration)
             iter_X = iter(training_dataloader_X)
             iter_Y = iter(training_dataloader_Y)
+            iter_per_epoch = min(len(iter_X), len(iter_Y))
 
         images_X, name_X = iter_X.next()
         labels_X_mapping = list(
@@ -285,14 +409,9 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
         #            TRAIN THE GENERATOR
         # ============================================
 
-        images_X_spectrum_raw = torch.stft(input=images_X, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
+        images_X_spectrum = signal_to_network_input(images_X, opts)
 
-                                           win_length=opts.stft_window, pad_mode='constant');
-        images_X_spectrum = spec_to_network_input(images_X_spectrum_raw, opts)
-
-        images_Y_spectrum_raw = torch.stft(input=images_Y, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
-                                           win_length=opts.stft_window, pad_mode='constant');
-        images_Y_spectrum = spec_to_network_input(images_Y_spectrum_raw, opts)
+        images_Y_spectrum = signal_to_network_input(images_Y, opts)
         #########################################
         ##    FILL THIS IN: X--Y               ##
         #########################################
@@ -302,7 +421,8 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
         # 2. Compute the generator loss based on domain Y
         g_y_pix_loss = loss_spec(fake_Y_spectrum, images_Y_spectrum)
         labels_X_estimated = C_XtoY(fake_Y_spectrum)
-        g_y_class_loss = loss_class(labels_X_estimated, labels_X)
+        g_y_class_losses = loss_class(labels_X_estimated, labels_X)
+        g_y_class_loss = g_y_class_losses.mean()
         g_optimizer.zero_grad()
         G_Image_loss = opts.scaling_for_imaging_loss * g_y_pix_loss
         G_Class_loss = opts.scaling_for_classification_loss * g_y_class_loss
@@ -310,6 +430,13 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
         G_Y_loss.backward()
         g_optimizer.step()
 
+        if sampler is not None:
+            sampler.update(name_X, to_data(g_y_class_losses),
+                           to_data(torch.max(labels_X_estimated, 1)[1]) == np.array(labels_X_mapping))
+        if monitor is not None and monitor(iteration, G_Y_loss.item(), G_Image_loss.item(), G_Class_loss.item()):
+            print('Training stopped by the monitor at iteration {}'.format(iteration))
+            break
+
         # Print the log info
         if iteration % opts.log_step == 0:
             print(
@@ -320,7 +447,7 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
                             G_Class_loss.item()))
 
         # Save the generated samples
-        if (iteration % opts.sample_every == 0) and (not opts.server):
+        if (iteration % opts.sample_every == 0) and (not opts.server) and opts.input_mode == 'stft':
             # save_samples(iteration, fixed_Y_spectrum, fixed_X_spectrum, mask_CNN, opts)
             save_samples_separate(iteration, fixed_Y_spectrum, fixed_X_spectrum,
                                   mask_CNN, opts, name_X_fixed, name_Y_fixed, opts.sample_dir)
@@ -328,6 +455,39 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
         # Save the model parameters
         if iteration % opts.checkpoint_every == 0:
             checkpoint(iteration, mask_CNN, C_XtoY, opts)
+            if opts.keep_checkpoints > 0:
+                rolling_checkpoint(iteration, mask_CNN, C_XtoY, opts, rolling_checkpoints)
+            if sampler is not None:
+                sampler.report()
+            report_read_ahead(loaders)
+
+        if validator is not None and iteration % opts.validate_every == 0:
+            validator.submit(iteration, mask_CNN, C_XtoY)
+
+        if time_to_target is not None and iteration % opts.target_eval_every == 0:
+            start_time = time.time()
+            ser, count = evaluate_ser(testing_dataloader_X, mask_CNN, C_XtoY, opts,
+                                      opts.target_eval_batches or None)
+            time_to_target.update(iteration, ser, count, time.time() - start_time)
+
+        if pruner is not None:
+            pruner.step(iteration, g_optimizer)
+
+        if budget is not None and budget.step(iteration, G_Y_loss.item(), mask_CNN, C_XtoY):
+            print('Training stopped by the {} at iteration {}'.format(budget.reason, iteration))
+            break
+
+    if sampler is not None:
+        sampler.report()
+    if time_to_target is not None:
+        time_to_target.report()
+    if validator is not None:
+        validator.close()
+    if pruner is not None:
+        pruner.report(iteration)
+    if budget is not None:
+        mask_CNN, C_XtoY = budget.finish(iteration, mask_CNN, C_XtoY)
+        budget.report(iteration)
 
     test_iter_X = iter(testing_dataloader_X)
     test_iter_Y = iter(testing_dataloader_Y)
@@ -336,10 +496,14 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
     error_matrix = np.zeros([len(opts.snr_list), 1], dtype=float)
     error_matrix_count = np.zeros([len(opts.snr_list), 1], dtype=int)
 
-    error_matrix_info = []
+    results_writer = ResultsWriter(
+        opts.root_path + '/' + opts.dir_comment + '_' + str(opts.sf) + '_' + str(opts.bw) + '_results',
+        opts.results_topk, opts.results_chunk_rows)
+    results_store = open_store(opts)
+    if results_store is not None:
+        run_id = results_store.begin_run(opts.dir_comment, checkpoint_name(opts), opts.sf, opts.bw)
 
     # iter_per_epoch_test = 500
-    saved_data = {}
     for iteration in range(iter_per_epoch_test):
         images_X_test, name_X_test = test_iter_X.next()
 
@@ -361,26 +525,17 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
         images_Y_test, labels_Y_test = test_iter_Y.next()
         images_Y_test = to_var(images_Y_test)
 
-        images_X_test_spectrum_raw = torch.stft(input=images_X_test, n_fft=opts.stft_nfft,
-                                                hop_length=opts.stft_overlap, win_length=opts.stft_window,
-                                                pad_mode='constant');
-        images_X_test_spectrum = spec_to_network_input(images_X_test_spectrum_raw, opts)
+        images_X_test_spectrum = signal_to_network_input(images_X_test, opts)
 
-        images_Y_test_spectrum_raw = torch.stft(input=images_Y_test, n_fft=opts.stft_nfft,
-                                                hop_length=opts.stft_overlap, win_length=opts.stft_window,
-                                                pad_mode='constant');
-        images_Y_test_spectrum = spec_to_network_input(images_Y_test_spectrum_raw, opts)
+        images_Y_test_spectrum = signal_to_network_input(images_Y_test, opts)
         fake_Y_test_spectrum = mask_CNN(images_X_test_spectrum)
         labels_X_estimated = C_XtoY(fake_Y_test_spectrum)
-        saved_sample = to_data(labels_X_estimated)
-
-        for i, label in enumerate(to_data(labels_X_test)):
-            if label not in saved_data.keys():
-                saved_data[label] = []
-                saved_data[label].append(saved_sample[i])
-            else:
-                saved_data[label].append(saved_sample[i])
         _, labels_X_test_estimated = torch.max(labels_X_estimated, 1)
+        results_writer.append(instance_X_test_mapping, code_X_test_mapping, snr_X_test_mapping,
+                              labels_X_test_estimated, labels_X_test, labels_X_estimated)
+        if results_store is not None:
+            results_store.append(run_id, instance_X_test_mapping, code_X_test_mapping, snr_X_test_mapping,
+                                 labels_X_test_estimated, labels_X_test)
 
         test_right_case = (labels_X_test_estimated == labels_X_test)
         test_right_case = to_data(test_right_case)
@@ -390,33 +545,33 @@ def training_loop(training_dataloader_X, training_dataloader_Y, testing_dataload
                 snr_index = opts.snr_list.index(snr_X_test_mapping[batch_index])
                 error_matrix[snr_index] += test_right_case[batch_index]
                 error_matrix_count[snr_index] += 1
-                error_matrix_info.append([instance_X_test_mapping[batch_index], code_X_test_mapping[batch_index],
-                                            snr_X_test_mapping[batch_index],
-                                            labels_X_test_estimated[batch_index].cpu().data.int(),
-                                            labels_X_test[batch_index].cpu().data.int()])
             except:
                 print("Something else went wrong")
         if iteration % opts.log_step == 0:
             print('Testing Iteration [{:5d}/{:5d}]'
                   .format(iteration, iter_per_epoch_test))
     error_matrix = np.divide(error_matrix, error_matrix_count)
-    error_matrix_info = np.array(error_matrix_info)
+    results_writer.close()
+    if results_store is not None:
+        results_store.finish_run(run_id)
+        results_store.close()
     scipy.io.savemat(
         opts.root_path + '/' + opts.dir_comment + '_' + str(opts.sf) + '_' + str(opts.bw) + '.mat',
         dict(error_matrix=error_matrix,
-             error_matrix_count=error_matrix_count,
-             error_matrix_info=error_matrix_info))
-
-    with open('test.npy', 'wb') as f:
-        np.save(f, saved_data)
-        f.close()
+             error_matrix_count=error_matrix_count))
+    report_read_ahead(loaders)
+    return error_matrix, error_matrix_count
 
 def TS_train(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
-                  testing_dataloader_Y, opts):
+                  testing_dataloader_Y, opts, validation_dataloader_X=None):
     """Runs the training loop.
         * Saves checkpoint every opts.checkpoint_every iterations
         * Saves generated samples every opts.sample_every iterations
+        * Stops on a plateau or a time / iteration budget (TrainingBudget) if enabled,
+          and tests the best student weights it kept, selected on validation_dataloader_X
     """
+    if validation_enabled(opts) and validation_dataloader_X is None:
+        raise ValueError('The validation needs the loader of the split held out of the training files')
     distill_criterion = nn.CrossEntropyLoss()
     clf_criterion = nn.CrossEntropyLoss()
     loss_spec_student = torch.nn.MSELoss(reduction='mean')
@@ -464,17 +619,15 @@ def TS_train(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
     fixed_Y, name_Y_fixed = test_iter_Y.next()
     fixed_Y = to_var(fixed_Y)
     # print("Fixed_X {}".format(fixed_X.shape))
-    fixed_X_spectrum_raw = torch.stft(input=fixed_X, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
-                                      win_length=opts.stft_window, pad_mode='constant')
-    fixed_X_spectrum = spec_to_network_input(fixed_X_spectrum_raw, opts)
+    fixed_X_spectrum = signal_to_network_input(fixed_X, opts)
     # print("Fixed {}".format(fixed_X_spectrum.shape))
 
-    fixed_Y_spectrum_raw = torch.stft(input=fixed_Y, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
-                                      win_length=opts.stft_window, pad_mode='constant')
-    fixed_Y_spectrum = spec_to_network_input(fixed_Y_spectrum_raw, opts)
+    fixed_Y_spectrum = signal_to_network_input(fixed_Y, opts)
 
     iter_per_epoch = min(len(iter_X), len(iter_Y))
+    budget = TrainingBudget(validation_dataloader_X, opts, 'student_budget_best') if budget_enabled(opts) else None
 
+    iteration = 0
     for iteration in range(1, opts.train_iters + 1):
         if iteration % iter_per_epoch == 0:
             iter_X = iter(training_dataloader_X)
@@ -495,14 +648,9 @@ def TS_train(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
         #            TRAIN THE GENERATOR
         # ============================================
 
-        images_X_spectrum_raw = torch.stft(input=images_X, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
-
-                                           win_length=opts.stft_window, pad_mode='constant')
-        images_X_spectrum = spec_to_network_input(images_X_spectrum_raw, opts) # shape: [16, 2, 128, 33]
+        images_X_spectrum = signal_to_network_input(images_X, opts)
 
-        images_Y_spectrum_raw = torch.stft(input=images_Y, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
-                                           win_length=opts.stft_window, pad_mode='constant')
-        images_Y_spectrum = spec_to_network_input(images_Y_spectrum_raw, opts)
+        images_Y_spectrum = signal_to_network_input(images_Y, opts)
         #########################################
         ##    FILL THIS IN: X--Y               ##
         #########################################
@@ -549,6 +697,14 @@ def TS_train(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
         if iteration % opts.checkpoint_every == 0:
             checkpoint_student(iteration, mask_CNN_student, C_XtoY_student, opts)
 
+        if budget is not None and budget.step(iteration, G_Y_loss.item(), mask_CNN_student, C_XtoY_student):
+            print('Training stopped by the {} at iteration {}'.format(budget.reason, iteration))
+            break
+
+    if budget is not None:
+        mask_CNN_student, C_XtoY_student = budget.finish(iteration, mask_CNN_student, C_XtoY_student)
+        budget.report(iteration)
+
     test_iter_X = iter(testing_dataloader_X)
     test_iter_Y = iter(testing_dataloader_Y)
     iter_per_epoch_test = min(len(test_iter_X), len(test_iter_Y))
@@ -556,10 +712,14 @@ def TS_train(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
     error_matrix = np.zeros([len(opts.snr_list), 1], dtype=float)
     error_matrix_count = np.zeros([len(opts.snr_list), 1], dtype=int)
 
-    error_matrix_info = []
+    results_writer = ResultsWriter(
+        opts.root_path + '/' + opts.dir_comment + '_student_' + str(opts.bw) + '_results',
+        opts.results_topk, opts.results_chunk_rows)
+    results_store = open_store(opts)
+    if results_store is not None:
+        run_id = results_store.begin_run(opts.dir_comment + '_student', checkpoint_name(opts), opts.sf, opts.bw)
 
     # iter_per_epoch_test = 500
-    saved_data = {}
     for iteration in range(iter_per_epoch_test):
         images_X_test, name_X_test = test_iter_X.next()
 
@@ -581,26 +741,17 @@ def TS_train(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
         images_Y_test, labels_Y_test = test_iter_Y.next()
         images_Y_test = to_var(images_Y_test)
 
-        images_X_test_spectrum_raw = torch.stft(input=images_X_test, n_fft=opts.stft_nfft,
-                                                hop_length=opts.stft_overlap, win_length=opts.stft_window,
-                                                pad_mode='constant')
-        images_X_test_spectrum = spec_to_network_input(images_X_test_spectrum_raw, opts)
+        images_X_test_spectrum = signal_to_network_input(images_X_test, opts)
 
-        images_Y_test_spectrum_raw = torch.stft(input=images_Y_test, n_fft=opts.stft_nfft,
-                                                hop_length=opts.stft_overlap, win_length=opts.stft_window,
-                                                pad_mode='constant')
-        images_Y_test_spectrum = spec_to_network_input(images_Y_test_spectrum_raw, opts)
+        images_Y_test_spectrum = signal_to_network_input(images_Y_test, opts)
         fake_Y_test_spectrum = mask_CNN_student(images_X_test_spectrum)
         labels_X_estimated = C_XtoY_student(fake_Y_test_spectrum)
-        saved_sample = to_data(labels_X_estimated)
-
-        for i, label in enumerate(to_data(labels_X_test)):
-            if label not in saved_data.keys():
-                saved_data[label] = []
-                saved_data[label].append(saved_sample[i])
-            else:
-                saved_data[label].append(saved_sample[i])
         _, labels_X_test_estimated = torch.max(labels_X_estimated, 1)
+        results_writer.append(instance_X_test_mapping, code_X_test_mapping, snr_X_test_mapping,
+                              labels_X_test_estimated, labels_X_test, labels_X_estimated)
+        if results_store is not None:
+            results_store.append(run_id, instance_X_test_mapping, code_X_test_mapping, snr_X_test_mapping,
+                                 labels_X_test_estimated, labels_X_test)
 
         test_right_case = (labels_X_test_estimated == labels_X_test)
         test_right_case = to_data(test_right_case)
@@ -610,23 +761,19 @@ def TS_train(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
                 snr_index = opts.snr_list.index(snr_X_test_mapping[batch_index])
                 error_matrix[snr_index] += test_right_case[batch_index]
                 error_matrix_count[snr_index] += 1
-                error_matrix_info.append([instance_X_test_mapping[batch_index], code_X_test_mapping[batch_index],
-                                            snr_X_test_mapping[batch_index],
-                                            labels_X_test_estimated[batch_index].cpu().data.int(),
-                                            labels_X_test[batch_index].cpu().data.int()])
             except:
                 print("Something else went wrong")
         if iteration % opts.log_step == 0:
             print('Testing Iteration [{:5d}/{:5d}]'
                   .format(iteration, iter_per_epoch_test))
     error_matrix = np.divide(error_matrix, error_matrix_count)
-    error_matrix_info = np.array(error_matrix_info)
+    results_writer.close()
+    if results_store is not None:
+        results_store.finish_run(run_id)
+        results_store.close()
     scipy.io.savemat(
         opts.root_path + '/' + opts.dir_comment + '_student_' + str(opts.bw) + '.mat',
         dict(error_matrix=error_matrix,
-             error_matrix_count=error_matrix_count,
-             error_matrix_info=error_matrix_info))
-
-    with open('test.npy', 'wb') as f:
-        np.save(f, saved_data)
-        f.close()
+             error_matrix_count=error_matrix_count))
+    report_read_ahead({'train X': training_dataloader_X, 'train Y': training_dataloader_Y,
+                       'test X': testing_dataloader_X, 'test Y': testing_dataloader_Y})
@@ -0,0 +1,142 @@
+# iq_reader.py
+# Zero-copy Python counterpart of io_read_iq.m / io_read_line.m for raw captures of
+# interleaved float32 I/Q samples (gr_complex).
+
+from __future__ import print_function
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils import data
+
+import config
+import end2end
+from utils import print_opts, signal_to_network_input, inference_mode
+
+
+class IQFile(object):
+    """Memory map of a raw capture as complex64. Reads never copy, the map is opened
+       copy-on-write so the views can be handed to torch.from_numpy without touching
+       the file. A trailing odd float is ignored like in io_read_iq.m.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        num_samples = os.path.getsize(path) // np.dtype(np.complex64).itemsize
+        if num_samples == 0:
+            self.samples = np.zeros(0, dtype=np.complex64)
+        else:
+            self.samples = np.memmap(path, dtype=np.complex64, mode='c', shape=(num_samples,))
+
+    def __len__(self):
+        return len(self.samples)
+
+    def read(self, start, count):
+        """Returns a view of count samples from start, like io_read_line.m.
+        """
+        return self.samples[start:start + count]
+
+    def windows(self, nsamp, stride=None, start=0, count=None):
+        """Returns a [num_windows, nsamp] view of the windows starting at start, start + stride, ...
+           (stride defaults to nsamp, a smaller stride gives overlapping windows).
+        """
+        stride = stride or nsamp
+        available = max(len(self.samples) - start - nsamp, -1) // stride + 1
+        num_windows = available if count is None else min(count, available)
+        base = self.samples[start:]
+        itemsize = self.samples.itemsize
+        return np.lib.stride_tricks.as_strided(base, shape=(max(num_windows, 0), nsamp),
+                                               strides=(stride * itemsize, itemsize))
+
+    def chunks(self, chunk_size, overlap=0, num_readers=1, reader=0, start=0):
+        """Yields (start, view) chunks of chunk_size samples from start on that overlap by
+           overlap samples, dealt round-robin so that reader (of num_readers threads or
+           workers) gets every num_readers-th chunk.
+        """
+        step = chunk_size - overlap
+        for index, chunk_start in enumerate(range(start, max(len(self.samples) - overlap, start + 1), step)):
+            if index % num_readers == reader:
+                yield chunk_start, self.samples[chunk_start:chunk_start + chunk_size]
+
+
+def window_name(path, start):
+    """Name of the window at sample start, passed along like the file names of lora_dataset.
+    """
+    return '{}_{}'.format(os.path.splitext(os.path.basename(path))[0], start)
+
+
+class IQSymbolDataset(data.Dataset):
+    'Symbol windows of a raw capture, as (complex64 tensor, name) like lora_dataset'
+
+    def __init__(self, path, nsamp, stride=None, start=0, count=None):
+        'Initialization'
+        self.iq = IQFile(path)
+        self.start = start
+        self.stride = stride or nsamp
+        self.symbols = self.iq.windows(nsamp, self.stride, start, count)
+
+    def __len__(self):
+        'Denotes the total number of samples'
+        return len(self.symbols)
+
+    def __getitem__(self, index):
+        'Generates one sample of data'
+        return torch.from_numpy(self.symbols[index]), window_name(self.iq.path, self.start + index * self.stride)
+
+
+class IQChunkDataset(data.IterableDataset):
+    'Symbol windows of a raw capture read chunk by chunk, the chunks are split across the DataLoader workers'
+
+    def __init__(self, path, nsamp, stride=None, start=0, chunk_symbols=4096):
+        'Initialization'
+        self.path = path
+        self.nsamp = nsamp
+        self.stride = stride or nsamp
+        self.start = start
+        self.chunk_symbols = chunk_symbols
+
+    def __iter__(self):
+        iq = IQFile(self.path)
+        worker_info = data.get_worker_info()
+        num_readers, reader = (1, 0) if worker_info is None else (worker_info.num_workers, worker_info.id)
+        chunk_size = (self.chunk_symbols - 1) * self.stride + self.nsamp
+        overlap = chunk_size - self.chunk_symbols * self.stride
+        for chunk_start, _ in iq.chunks(chunk_size, overlap, num_readers, reader, self.start):
+            symbols = iq.windows(self.nsamp, self.stride, chunk_start, self.chunk_symbols)
+            for index in range(len(symbols)):
+                yield torch.from_numpy(symbols[index]), window_name(self.path, chunk_start + index * self.stride)
+
+
+def main(opts):
+    """Demodulates the consecutive symbols of opts.iq_file from opts.iq_offset with the trained models.
+    """
+    dataset = IQChunkDataset(opts.iq_file, opts.stft_nfft, opts.iq_stride, opts.iq_offset, opts.iq_chunk_symbols)
+    loader = data.DataLoader(dataset, batch_size=opts.batch_size, num_workers=opts.num_workers)
+    mask_CNN, C_XtoY = end2end.load_checkpoint(opts)
+    mask_CNN.eval()
+    C_XtoY.eval()
+
+    num_symbols = 0
+    start_time = time.time()
+    with inference_mode():
+        for symbols, names in loader:
+            if torch.cuda.is_available():
+                symbols = symbols.cuda()
+            _, codes = torch.max(C_XtoY(mask_CNN(signal_to_network_input(symbols, opts))), 1)
+            # with several workers the chunks, not the symbols, come in file order
+            for name, code in zip(names, codes.tolist()):
+                print('{} | {:>5d}'.format(name, code))
+            num_symbols += len(names)
+    elapsed = time.time() - start_time
+    print('Demodulated {} symbols in {:.2f} s ({:.1f} symbols/s)'.format(num_symbols, elapsed, num_symbols / elapsed))
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,25 @@
+"""Searches the batch size, PyTorch threads and DataLoader workers with the highest throughput."""
+from __future__ import print_function
+from utils import generate_dataset, print_opts
+import config
+import autotune
+
+
+def main(opts):
+    """Lists the data and tunes the throughput of the training (or inference) pipeline on it.
+    """
+    [files_train, files_test
+     ] = generate_dataset(opts.root_path, opts.data_dir, opts.ratio_bt_train_and_test,
+                          opts.code_list, opts.snr_list, opts.bw_list, opts.sf_list,
+                          opts.instance_list, opts.sorting_type)
+    autotune.autotune(opts, files_train, files_test)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
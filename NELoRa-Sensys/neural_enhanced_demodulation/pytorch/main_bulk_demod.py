@@ -0,0 +1,41 @@
+"""Demodulates a directory of .mat symbols with a trained model on all cores."""
+from __future__ import print_function
+import os
+from utils import print_opts
+import config
+import end2end
+import bulk_demod
+from models.inference_optimization import optimize_for_inference
+
+
+def main(opts):
+    """Loads the trained models and writes the predicted code of every symbol under opts.input_dir.
+    """
+    input_dir = opts.input_dir or os.path.join(opts.root_path, opts.data_dir)
+    output_dir = opts.bulk_output or os.path.join(opts.root_path, opts.dir_comment + '_predictions')
+    paths = bulk_demod.list_symbol_files(input_dir)
+    print('Found {} symbols in {}'.format(len(paths), input_dir))
+
+    if opts.bulk_workers > 0:
+        num_workers = opts.bulk_workers
+    else:
+        num_workers = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    mask_CNN, C_XtoY = end2end.load_checkpoint(opts)
+    if opts.optimize_inference:
+        mask_CNN, C_XtoY = optimize_for_inference(mask_CNN), optimize_for_inference(C_XtoY)
+    if opts.bulk_scaling > 0:
+        bulk_demod.report_scaling(paths[:opts.bulk_scaling], mask_CNN, C_XtoY, opts, num_workers, output_dir)
+    else:
+        stats, elapsed = bulk_demod.run_bulk(paths, mask_CNN, C_XtoY, opts, num_workers, output_dir)
+        bulk_demod.report_bulk(stats, elapsed)
+        print('Predictions written to {}'.format(output_dir))
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
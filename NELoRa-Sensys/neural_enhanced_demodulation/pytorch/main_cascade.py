@@ -0,0 +1,30 @@
+"""Evaluates the cascaded dechirp / neural demodulator against the all-neural path."""
+from __future__ import print_function
+from utils import generate_dataset, print_opts
+import config
+import datasets.data_loader as data_loader
+import end2end
+import cascade
+
+
+def main(opts):
+    """Loads the test data and the trained models, and compares the cascade with the all-neural path.
+    """
+    [files_train, files_test
+     ] = generate_dataset(opts.root_path, opts.data_dir, opts.ratio_bt_train_and_test,
+                          opts.code_list, opts.snr_list, opts.bw_list, opts.sf_list,
+                          opts.instance_list, opts.sorting_type)
+    _, testing_dataloader_X = data_loader.lora_loader(opts, files_train, files_test, False)
+
+    mask_CNN, C_XtoY = end2end.load_checkpoint(opts)
+    cascade.evaluate_cascade(testing_dataloader_X, mask_CNN, C_XtoY, opts)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
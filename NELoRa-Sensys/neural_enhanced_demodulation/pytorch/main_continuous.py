@@ -0,0 +1,56 @@
+"""Trains continuously on data_dir: files that arrive while training runs are added to the
+train/test split and to the sampler without restarting."""
+from __future__ import print_function
+from utils import create_dir, set_gpu, set_threads, print_opts
+import config
+import datasets.data_loader as data_loader
+from datasets.curriculum_sampler import CurriculumSampler
+from datasets.data_watcher import DataWatcher, StreamSampler
+import end2end
+
+
+def main(opts):
+    """Waits for one batch of training and test files (and one validation file if the training
+    validates), then runs the training loop with a DataWatcher polling data_dir every
+    opts.watch_every iterations.
+    """
+    set_threads(opts)
+    validation = end2end.validation_enabled(opts)
+    watcher = DataWatcher(opts, validation)
+    watcher.wait_for(opts.batch_size, 1, 1 if validation else 0)
+    print("length of training and testing data is {},{}".format(len(watcher.files_train), len(watcher.files_test)))
+
+    if opts.sampler == 'curriculum':
+        train_sampler = CurriculumSampler(opts, watcher.files_train)
+    else:
+        train_sampler = StreamSampler(opts, watcher.files_train)
+    watcher.sampler = train_sampler
+
+    # the datasets keep the watcher's lists, which it grows in place
+    training_dataloader_X, testing_dataloader_X = data_loader.lora_loader(
+        opts, watcher.files_train, watcher.files_test, False, train_sampler)
+    training_dataloader_Y, testing_dataloader_Y = data_loader.lora_loader(
+        opts, watcher.files_train, watcher.files_test, True, train_sampler)
+
+    validation_dataloader_X = data_loader.validation_loader(opts, watcher.files_validation) if validation else None
+
+    create_dir(opts.checkpoint_dir)
+    if not opts.server:
+        create_dir(opts.sample_dir)
+        create_dir(opts.testing_dir)
+
+    set_gpu(opts.free_gpu_id)
+
+    end2end.training_loop(training_dataloader_X, training_dataloader_Y, testing_dataloader_X,
+                          testing_dataloader_Y, opts, watcher=watcher,
+                          validation_dataloader_X=validation_dataloader_X)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
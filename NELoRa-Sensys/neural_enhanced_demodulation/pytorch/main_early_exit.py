@@ -0,0 +1,40 @@
+"""Evaluates the confidence-gated student -> teacher early-exit inference."""
+from __future__ import print_function
+from utils import generate_dataset, print_opts
+import config
+import datasets.data_loader as data_loader
+import end2end
+import early_exit
+
+
+def main(opts):
+    """Loads the test data, the teacher and the distilled student, optionally calibrates
+    the threshold for opts.early_exit_target_ser, and evaluates the early-exit mode.
+    """
+    [files_train, files_test
+     ] = generate_dataset(opts.root_path, opts.data_dir, opts.ratio_bt_train_and_test,
+                          opts.code_list, opts.snr_list, opts.bw_list, opts.sf_list,
+                          opts.instance_list, opts.sorting_type)
+    _, testing_dataloader_X = data_loader.lora_loader(opts, files_train, files_test, False)
+
+    mask_CNN_teacher, C_XtoY_teacher = end2end.load_teacher_model(opts)
+    mask_CNN_student, C_XtoY_student = end2end.load_student_model(opts)
+    demodulator = early_exit.EarlyExitDemodulator(mask_CNN_student, C_XtoY_student,
+                                                  mask_CNN_teacher, C_XtoY_teacher, opts)
+
+    if opts.early_exit_target_ser >= 0:
+        records, time_per_symbol = early_exit.collect_scores(testing_dataloader_X, demodulator, opts)
+        opts.early_exit_threshold = early_exit.calibrate_threshold(records, time_per_symbol,
+                                                                   opts.early_exit_target_ser)
+
+    early_exit.evaluate_early_exit(testing_dataloader_X, demodulator, opts)
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts, student=True)
+
+    print_opts(opts)
+
+    main(opts)
@@ -0,0 +1,74 @@
+"""Adds ResultsWriter directories to the results store and reports the SER by SNR and by
+instance of the stored runs matching --results_run."""
+from __future__ import print_function
+import os
+import time
+
+from utils import print_opts
+from results_store import open_store, checkpoint_name
+import config
+
+
+def ingest(store, results_dir, opts):
+    """Adds results_dir, named [dir_comment]_[sf]_[bw]_results or [dir_comment]_student_[bw]_results,
+    to store as the run dir_comment (dir_comment_student) at checkpoint checkpoint_name(opts), the
+    name the training run stored it under (pass its --load, --load_iters and --train_iters), so
+    that ingesting the results of a run stored live replaces it.
+    """
+    fields = os.path.basename(os.path.normpath(results_dir)).split('_')[:-1]
+    sf = opts.sf if fields[-2] == 'student' else int(fields[-2])
+    run = '_'.join(fields[:-1] if fields[-2] == 'student' else fields[:-2])
+    checkpoint = checkpoint_name(opts)
+    store.ingest_results(results_dir, run, checkpoint, sf, int(fields[-1]))
+    print('Stored {} as run {} at checkpoint {}'.format(results_dir, run, checkpoint))
+
+
+def main(opts):
+    store = open_store(opts)
+    if store is None:
+        print('The results store is disabled (--results_db is empty)')
+        return
+    for results_dir in opts.results_ingest:
+        ingest(store, results_dir, opts)
+
+    start_time = time.time()
+    ser, count = store.ser_by_snr(opts.snr_list, opts.results_run)
+    snr_time = time.time() - start_time
+    start_time = time.time()
+    by_instance = store.ser_by_instance(opts.results_run)
+    instance_time = time.time() - start_time
+
+    print('=' * 80)
+    print('SER per SNR, runs matching {}'.format(opts.results_run).center(80))
+    print('-' * 80)
+    print(' | '.join(['{:>30}'.format('run@checkpoint'), '{:>8}'.format('symbols')] +
+                     ['{:>8}'.format(snr) for snr in opts.snr_list]))
+    for name in ser:
+        print(' | '.join(['{:>30}'.format(name), '{:>8d}'.format(int(count[name].sum()))] +
+                         ['{:>8.4f}'.format(value) if count[name][snr_index] else '{:>8}'.format('-')
+                          for snr_index, value in enumerate(ser[name])]))
+    print('=' * 80)
+    instances = sorted(set(instance for table in by_instance.values() for instance in table))
+    print('=' * 80)
+    print('SER per instance'.center(80))
+    print('-' * 80)
+    print(' | '.join(['{:>30}'.format('run@checkpoint')] + ['{:>8}'.format(instance) for instance in instances]))
+    for (run, checkpoint), table in by_instance.items():
+        print(' | '.join(['{:>30}'.format('{}@{}'.format(run, checkpoint))] +
+                         ['{:>8.4f}'.format(table[instance][0]) if instance in table else '{:>8}'.format('-')
+                          for instance in instances]))
+    print('-' * 80)
+    print('{} runs in {}, queries: SER by SNR {:.1f} ms, SER by instance {:.1f} ms'.format(
+        len(store.runs()), opts.results_db, snr_time * 1000, instance_time * 1000))
+    print('=' * 80)
+    store.close()
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+    config.prepare_opts(opts)
+
+    print_opts(opts)
+
+    main(opts)
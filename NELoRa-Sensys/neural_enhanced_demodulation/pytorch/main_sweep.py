@@ -0,0 +1,16 @@
+"""Runs a parallel hyperparameter sweep over one in-memory copy of the dataset."""
+from __future__ import print_function
+from copy import deepcopy
+from utils import print_opts
+import config
+import sweep
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    raw_opts = parser.parse_args()
+    opts = config.prepare_opts(deepcopy(raw_opts))
+
+    print_opts(opts)
+
+    sweep.run_sweep(raw_opts)
@@ -0,0 +1,91 @@
+# inference_optimization.py
+
+from copy import deepcopy
+
+import torch
+import torch.nn as nn
+
+from models.model_components import StudentMaskCNNModel
+
+
+def fold_batch_norm(conv, bn):
+    """Returns a Conv2d computing bn(conv(x)) with the running statistics of bn.
+    """
+    fused = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size, conv.stride,
+                      conv.padding, conv.dilation, conv.groups, bias=True)
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    if bn.affine:
+        scale = scale * bn.weight
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    bias = (bias - bn.running_mean) * scale
+    if bn.affine:
+        bias = bias + bn.bias
+    fused.weight.data.copy_(conv.weight * scale.view(-1, 1, 1, 1))
+    fused.bias.data.copy_(bias)
+    return fused
+
+
+def fold_zero_pad(pad, conv):
+    """Returns a Conv2d with the padding of pad (ZeroPad2d) as its own padding, or None
+       if pad is not symmetric or conv already pads.
+    """
+    left, right, top, bottom = pad.padding
+    if left != right or top != bottom or tuple(conv.padding) != (0, 0) or conv.padding_mode != 'zeros':
+        return None
+    fused = deepcopy(conv)
+    fused.padding = (top, left)
+    return fused
+
+
+def fuse_layers(layers):
+    """Fuses a list of layers for inference: ZeroPad2d + Conv2d into a padded Conv2d,
+       Conv2d + BatchNorm2d into one Conv2d, drops Dropout and Identity and makes ReLU in-place.
+    """
+    padded = []
+    for layer in layers:
+        if isinstance(layer, nn.Conv2d) and padded and isinstance(padded[-1], nn.ZeroPad2d):
+            fused = fold_zero_pad(padded[-1], layer)
+            if fused is not None:
+                padded[-1] = fused
+                continue
+        padded.append(layer)
+
+    fused_layers = []
+    for layer in padded:
+        if isinstance(layer, nn.BatchNorm2d) and fused_layers and isinstance(fused_layers[-1], nn.Conv2d):
+            fused_layers[-1] = fold_batch_norm(fused_layers[-1], layer)
+        elif isinstance(layer, (nn.Dropout, nn.Identity)):
+            continue
+        elif isinstance(layer, nn.ReLU):
+            fused_layers.append(nn.ReLU(inplace=True))
+        else:
+            fused_layers.append(layer)
+    return fused_layers
+
+
+def optimize_for_inference(model):
+    """Returns an eval-only copy of model (maskCNNModel, StudentMaskCNNModel or a
+       classifier) with fuse_layers applied to its conv stack and its Dropout layers
+       removed. The outputs match model.eval() up to float rounding, the copy must not be
+       trained because the BatchNorm statistics are frozen into the conv weights.
+    """
+    optimized = deepcopy(model).eval()
+    if isinstance(getattr(optimized, 'conv', None), nn.Sequential):
+        layers = list(optimized.conv)
+        if isinstance(optimized, StudentMaskCNNModel):
+            # the student ends its conv stack with the padding of self.conv2d + self.BN
+            fused = fuse_layers(layers + [optimized.conv2d, optimized.BN])
+            if isinstance(fused[-1], nn.Conv2d) and len(fused) == len(fuse_layers(layers + [optimized.conv2d])):
+                optimized.conv = nn.Sequential(*fused[:-1])
+                optimized.conv2d = fused[-1]
+                optimized.BN = nn.Identity()
+            else:
+                optimized.conv = nn.Sequential(*fuse_layers(layers))
+        else:
+            optimized.conv = nn.Sequential(*fuse_layers(layers))
+    for name, module in list(optimized.named_children()):
+        if isinstance(module, nn.Dropout):
+            setattr(optimized, name, nn.Identity())
+    for param in optimized.parameters():
+        param.requires_grad_(False)
+    return optimized
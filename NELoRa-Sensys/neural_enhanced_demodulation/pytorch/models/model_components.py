@@ -1,9 +1,65 @@
 # models.py
 
+import inspect
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import time
+from torch.utils.checkpoint import checkpoint, checkpoint_sequential
+
+from chirp_utils import bins_to_codes
+
+# use_reentrant only exists (and is expected) from torch 1.11 on
+CHECKPOINT_KWARGS = {'use_reentrant': True} if 'use_reentrant' in inspect.signature(checkpoint_sequential).parameters else {}
+
+
+def keep_batch_norm_stats(module):
+    """Wraps module so that the backward recompute of reentrant checkpointing (a run with
+       grad enabled after a checkpointed run without) leaves the running statistics of its
+       BatchNorm layers as they were: they are updated once per step, as without
+       checkpointing. Runs that are not checkpointed, like the last segment of
+       checkpoint_sequential, update them as usual.
+    """
+    layers = module.modules() if isinstance(module, nn.Module) else []
+    batch_norms = [layer for layer in layers if isinstance(layer, nn.modules.batchnorm._BatchNorm)]
+    if not batch_norms:
+        return module
+
+    pending = []
+
+    def run(x):
+        if not torch.is_grad_enabled():
+            pending.append(True)
+            return module(x)
+        if not pending:
+            return module(x)
+        pending.pop()
+        # the recompute updates copies, the buffers themselves may be saved for backward
+        saved = [dict(layer.named_buffers(recurse=False)) for layer in batch_norms]
+        for layer, buffers in zip(batch_norms, saved):
+            for name, buffer in buffers.items():
+                setattr(layer, name, buffer.clone())
+        out = module(x)
+        for layer, buffers in zip(batch_norms, saved):
+            for name, buffer in buffers.items():
+                setattr(layer, name, buffer)
+        return out
+    return run
+
+
+def checkpointed(function, x, segments=None):
+    """Runs function (an nn.Sequential if segments is given) on x keeping only the
+       segment inputs for backward, the rest is recomputed without updating the BatchNorm
+       statistics again. Reentrant checkpointing gives no parameter gradients for an
+       input that does not require grad (like the spectrum), so such an input is turned
+       into a leaf that does.
+    """
+    if not x.requires_grad:
+        x = x.detach().requires_grad_()
+    if segments is None:
+        return checkpoint(keep_batch_norm_stats(function), x, **CHECKPOINT_KWARGS)
+    return checkpoint_sequential([keep_batch_norm_stats(layer) for layer in function], segments, x,
+                                 **CHECKPOINT_KWARGS)
 
 
 class classificationHybridModel(nn.Module):
@@ -27,9 +83,16 @@ class classificationHybridModel(nn.Module):
         self.act = nn.ReLU()
 
     def forward(self, x):
-        out = self.act(self.conv1(x))
-        out = self.pool1(out)
-        out = out.view(out.size(0), -1)
+        if not x.is_contiguous() and x.transpose(2, 3).is_contiguous():
+            # time-major input (spec_to_network_input): convolve it as stored with the
+            # transposed kernel and only transpose the small pooled map back
+            out = F.conv2d(x.transpose(2, 3), self.conv1.weight.transpose(2, 3), self.conv1.bias,
+                           self.conv1.stride[::-1], self.conv1.padding[::-1])
+            out = self.pool1(self.act(out)).transpose(2, 3)
+        else:
+            out = self.act(self.conv1(x))
+            out = self.pool1(out)
+        out = out.reshape(out.size(0), -1)
 
         out = self.act(self.dense(out))
         out = self.drop2(out)
@@ -39,6 +102,136 @@ class classificationHybridModel(nn.Module):
         out = self.fcn2(out)
         return out
 
+def low_rank_linear(in_features, out_features, rank):
+    """Linear(in_features, out_features) factorized through rank features.
+    """
+    return nn.Sequential(nn.Linear(in_features, rank, bias=False), nn.Linear(rank, out_features))
+
+
+class FactorizedClassificationModel(classificationHybridModel):
+    """classificationHybridModel with every fully connected layer factorized through
+       rank features. The dense layer alone is 4 * conv_dim_lstm x 4 * conv_dim_out, about
+       2 billion weights at SF12, the factorized layers grow linearly with 2^sf instead.
+    """
+
+    def __init__(self, conv_dim_in=2, conv_dim_out=128, conv_dim_lstm=1024, rank=256):
+        # the full size layers of classificationHybridModel.__init__ are never built
+        nn.Module.__init__(self)
+
+        self.out_size = conv_dim_out
+        self.conv1 = nn.Conv2d(conv_dim_in, 16, (3, 3), stride=(2, 2), padding=(1, 1))
+        self.pool1 = nn.MaxPool2d((2, 2), stride=(2, 2))
+        self.dense = low_rank_linear(conv_dim_lstm * 4, conv_dim_out * 4, rank)
+        self.fcn1 = low_rank_linear(conv_dim_out * 4, conv_dim_out * 2, rank)
+        self.fcn2 = low_rank_linear(conv_dim_out * 2, conv_dim_out, rank)
+        self.softmax = nn.Softmax(dim=1)
+
+        self.drop1 = nn.Dropout(0.2)
+        self.drop2 = nn.Dropout(0.5)
+        self.act = nn.ReLU()
+
+
+def create_classifier(opts):
+    """Builds the classifier selected by opts.classifier (DechirpClassifier for the
+       dechirp input mode).
+    """
+    if opts.input_mode == 'dechirp':
+        return DechirpClassifier(opts)
+    if opts.classifier == 'factorized':
+        return FactorizedClassificationModel(conv_dim_in=opts.y_image_channel,
+                                             conv_dim_out=opts.n_classes,
+                                             conv_dim_lstm=opts.conv_dim_lstm,
+                                             rank=opts.classifier_rank)
+    return classificationHybridModel(conv_dim_in=opts.y_image_channel,
+                                     conv_dim_out=opts.n_classes,
+                                     conv_dim_lstm=opts.conv_dim_lstm)
+
+
+class ProjectedMaskHead(nn.Module):
+    """Projects the conv_dim_lstm (8 * 2^sf) features of every frame to proj_dim before
+       the temporal layer, so that the LSTM / TCN weights do not grow with 2^sf.
+    """
+
+    def __init__(self, input_dim, proj_dim, head):
+        super(ProjectedMaskHead, self).__init__()
+        self.proj = nn.Linear(input_dim, proj_dim)
+        self.head = head
+
+    def forward(self, x):
+        return self.head(self.proj(x))
+
+
+class TemporalConvHead(nn.Module):
+    """Dilated temporal convolutions over the time frames, a parallel alternative to the
+       bidirectional LSTM of the mask models. Dilations 1, 2, 4, 8 with kernel 3 see 31
+       frames, about the whole symbol. The blocks are depthwise-separable so the head
+       stays smaller than the LSTM. Returns (output, None) like nn.LSTM so it drops in
+       for it, the output has the same 2 * lstm_dim features as the bidirectional LSTM.
+    """
+
+    def __init__(self, input_dim, lstm_dim, dilations=(1, 2, 4, 8)):
+        super(TemporalConvHead, self).__init__()
+        hidden_dim = 2 * lstm_dim
+        self.proj = nn.Conv1d(input_dim, hidden_dim, kernel_size=1)
+        self.blocks = nn.ModuleList([
+            nn.Sequential(
+                nn.Conv1d(hidden_dim, hidden_dim, kernel_size=3, dilation=dilation,
+                          padding=dilation, groups=hidden_dim),
+                nn.Conv1d(hidden_dim, hidden_dim, kernel_size=1))
+            for dilation in dilations])
+        self.act = nn.ReLU()
+
+    def forward(self, x):
+        out = self.proj(x.transpose(1, 2))  # [B, T, C] -> [B, C, T]
+        for block in self.blocks:
+            out = out + self.act(block(out))
+        return out.transpose(1, 2), None
+
+
+def apply_mask(out, x):
+    """Applies the mask logits out [B, T, C, F] of the FC layers to the input x [B, C, F, T]
+       without reordering the mask: the product is computed in the time-major layout of x
+       and returned as a [B, C, F, T] view of it.
+    """
+    mask = out.sigmoid_()  # the FC output is not needed for backward
+    masked = x.transpose(2, 3) * mask.transpose(1, 2)  # masked is denoised
+    return masked.transpose(2, 3)
+
+
+def create_mask_head(opts):
+    """Builds the temporal layer of the mask models selected by opts.mask_head, behind
+       a ProjectedMaskHead if opts.lstm_proj_dim is set.
+    """
+    input_dim = opts.lstm_proj_dim if opts.lstm_proj_dim > 0 else opts.conv_dim_lstm
+    if opts.mask_head == 'tcn':
+        head = TemporalConvHead(input_dim, opts.lstm_dim)
+    else:
+        head = nn.LSTM(
+            input_dim,
+            opts.lstm_dim,
+            batch_first=True,
+            bidirectional=True)
+    if opts.lstm_proj_dim > 0:
+        return ProjectedMaskHead(opts.conv_dim_lstm, opts.lstm_proj_dim, head)
+    return head
+
+
+def fold_zero_padding(layers, next_conv=None):
+    """Moves the padding of every symmetric ZeroPad2d of the nn.Sequential layers into the
+       Conv2d that follows it (the next layer, or next_conv after the last one) and replaces
+       the ZeroPad2d by an nn.Identity, so that the state dict keys do not change but no
+       padded copy of the feature map is allocated.
+    """
+    followers = list(layers)[1:] + [next_conv]
+    for index, (layer, conv) in enumerate(zip(list(layers), followers)):
+        if not isinstance(layer, nn.ZeroPad2d) or not isinstance(conv, nn.Conv2d):
+            continue
+        left, right, top, bottom = layer.padding
+        if left == right and top == bottom and tuple(conv.padding) == (0, 0) and conv.padding_mode == 'zeros':
+            conv.padding = (top, left)
+            layers[index] = nn.Identity()
+
+
 class maskCNNModel(nn.Module):
     def __init__(self, opts):
         super(maskCNNModel, self).__init__()
@@ -85,35 +278,48 @@ class maskCNNModel(nn.Module):
             nn.BatchNorm2d(8), nn.ReLU(),
 
         )
+        fold_zero_padding(self.conv)
 
-        self.lstm = nn.LSTM(
-            opts.conv_dim_lstm,
-            opts.lstm_dim,
-            batch_first=True,
-            bidirectional=True)
+        self.lstm = create_mask_head(opts)
 
         self.fc1 = nn.Linear(2 * opts.lstm_dim, opts.fc1_dim)
         self.fc2 = nn.Linear(opts.fc1_dim, opts.freq_size * opts.y_image_channel)
 
+    def temporal(self, out):
+        out, _ = self.lstm(out)
+        return out
+
+    def fc(self, out):
+        out = F.relu(out)
+        out = self.fc1(out)
+        out = F.relu(out)
+        out = self.fc2(out)
+        return out
+
     def forward(self, x):
         # print('=================Teacher input: {}====================='.format(x.shape))
+        memory_saving = self.opts.memory_saving and self.training and torch.is_grad_enabled()
         out = x.transpose(2, 3).contiguous()
-        out = self.conv(out)
+        if memory_saving:
+            # keep only the inputs of opts.checkpoint_segments conv blocks for backward
+            out = checkpointed(self.conv, out, self.opts.checkpoint_segments)
+        else:
+            out = self.conv(out)
         # print('=================Teacher: fmap{}====================='.format(out.shape))
+        # the only reorder left: the channel-major conv output to the time-major LSTM input
         out = out.transpose(1, 2).contiguous()
         out = out.view(out.size(0), out.size(1), -1)
-        out, _ = self.lstm(out)
-        out = F.relu(out)
-        out = self.fc1(out)
-        out = F.relu(out)
-        out = self.fc2(out)
+        if memory_saving:
+            # the bidirectional LSTM needs every frame, so it is recomputed as a whole,
+            # the frame-wise FC layers are recomputed in chunks of opts.time_chunk frames
+            out = checkpointed(self.temporal, out)
+            out = torch.cat([checkpointed(self.fc, chunk) for chunk in out.split(self.opts.time_chunk, dim=1)], 1)
+        else:
+            out = self.temporal(out)
+            out = self.fc(out)
 
         out = out.view(out.size(0), out.size(1), self.opts.y_image_channel, -1)
-        out = torch.sigmoid(out)
-        out = out.transpose(1, 2).contiguous()
-        out = out.transpose(2, 3).contiguous()
-        masked = out * x  # out is mask, masked is denoised
-        return masked
+        return apply_mask(out, x)
 
 class StudentMaskCNNModel(nn.Module):
     def __init__(self, opts):
@@ -161,17 +367,14 @@ class StudentMaskCNNModel(nn.Module):
             # nn.BatchNorm2d(8), nn.ReLU(),
         )
 
-        self.lstm = nn.LSTM(
-            opts.conv_dim_lstm,
-            opts.lstm_dim,
-            batch_first=True,
-            bidirectional=True)
+        self.lstm = create_mask_head(opts)
 
         self.fc1 = nn.Linear(2 * opts.lstm_dim, opts.fc1_dim)
         self.fc2 = nn.Linear(opts.fc1_dim, opts.freq_size * opts.y_image_channel)
 
         self.BN = nn.BatchNorm2d(8)
         self.conv2d = nn.Conv2d(64, 8, kernel_size=(7, 1), dilation=(1, 1))
+        fold_zero_padding(self.conv, self.conv2d)
 
     def forward(self, x):
         # print('=================Student input: {}====================='.format(x.shape))
@@ -189,8 +392,58 @@ class StudentMaskCNNModel(nn.Module):
         out = self.fc2(out)
 
         out = out.view(out.size(0), out.size(1), self.opts.y_image_channel, -1)
-        out = torch.sigmoid(out)
-        out = out.transpose(1, 2).contiguous()
-        out = out.transpose(2, 3).contiguous()
-        masked = out * x  # out is mask, masked is denoised
-        return masked
+        return apply_mask(out, x)
+
+
+def circular_conv_block(in_channels, out_channels, dilation=1):
+    """Conv1d over the FFT bins with circular padding (the bins of the dechirped FFT wrap
+       around), BatchNorm and ReLU.
+    """
+    return [nn.Conv1d(in_channels, out_channels, kernel_size=5, padding=2 * dilation, dilation=dilation,
+                      padding_mode='circular'),
+            nn.BatchNorm1d(out_channels), nn.ReLU()]
+
+
+class DechirpMaskModel(nn.Module):
+    """Mask model for the dechirped FFT input of dechirp_to_network_input [B, C, 2^sf]:
+       dilated circular convolutions over the bins predict a [0, 1] mask of the input.
+    """
+
+    def __init__(self, opts):
+        super(DechirpMaskModel, self).__init__()
+        self.opts = opts
+        channels = 4 * opts.dechirp_windows
+        layers = circular_conv_block(channels, opts.dechirp_channels)
+        for dilation in [2, 4, 8]:
+            layers += circular_conv_block(opts.dechirp_channels, opts.dechirp_channels, dilation)
+        self.conv = nn.Sequential(*layers)
+        self.mask = nn.Conv1d(opts.dechirp_channels, channels, kernel_size=1)
+
+    def forward(self, x):
+        out = torch.sigmoid(self.mask(self.conv(x)))
+        return out * x  # out is mask, the product is denoised
+
+
+class DechirpClassifier(nn.Module):
+    """Classifier for the dechirped FFT input: circular convolutions score every bin and
+       the scores of the bins are the logits of their codes (bins_to_codes), so that the
+       argmax is the dechirp decision on the learned features.
+    """
+
+    def __init__(self, opts):
+        super(DechirpClassifier, self).__init__()
+        channels = 4 * opts.dechirp_windows
+        self.conv = nn.Sequential(*(circular_conv_block(channels, opts.dechirp_channels) +
+                                    circular_conv_block(opts.dechirp_channels, opts.dechirp_channels, 2)))
+        self.score = nn.Conv1d(opts.dechirp_channels, 1, kernel_size=1)
+
+    def forward(self, x):
+        return bins_to_codes(self.score(self.conv(x)).squeeze(1))
+
+
+def create_mask_model(opts):
+    """Builds the mask model for opts.input_mode.
+    """
+    if opts.input_mode == 'dechirp':
+        return DechirpMaskModel(opts)
+    return maskCNNModel(opts)
@@ -0,0 +1,112 @@
+# pruning.py
+
+import torch
+import torch.nn as nn
+
+
+def prunable_groups(model):
+    """Returns the (name, producer, batch_norm, consumer) groups of model whose units can
+       be removed: the output channels of a Conv2d of model.conv together with its
+       BatchNorm2d and the input channels of the next Conv2d, and the output neurons of a
+       Linear together with the inputs of the Linear it feeds (fc1 -> fc2 of the mask
+       models, dense -> fcn1 -> fcn2 of classificationHybridModel). name is the name of
+       the producer in the state dict.
+    """
+    names = dict((module, name) for name, module in model.named_modules())
+    groups = []
+    if isinstance(getattr(model, 'conv', None), nn.Sequential):
+        layers = list(model.conv)
+        convs = [index for index, layer in enumerate(layers) if isinstance(layer, nn.Conv2d)]
+        for start, end in zip(convs[:-1], convs[1:]):
+            batch_norms = [layer for layer in layers[start:end] if isinstance(layer, nn.BatchNorm2d)]
+            if layers[start].groups == 1 and layers[end].groups == 1:
+                groups.append((names[layers[start]], layers[start], batch_norms[0] if batch_norms else None,
+                               layers[end]))
+    for producer, consumer in [('fc1', 'fc2'), ('dense', 'fcn1'), ('fcn1', 'fcn2')]:
+        producer, consumer = getattr(model, producer, None), getattr(model, consumer, None)
+        if isinstance(producer, nn.Linear) and isinstance(consumer, nn.Linear):
+            groups.append((names[producer], producer, None, consumer))
+    return groups
+
+
+def unit_importance(producer, batch_norm):
+    """L1 norm of the weights of every output unit, scaled by the BatchNorm gain that follows.
+    """
+    importance = producer.weight.detach().abs().flatten(1).sum(1)
+    if batch_norm is not None:
+        scale = torch.rsqrt(batch_norm.running_var + batch_norm.eps)
+        if batch_norm.affine:
+            scale = scale * batch_norm.weight.detach().abs()
+        importance = importance * scale
+    return importance
+
+
+def shrink_tensor(module, name, dim, keep, optimizer=None):
+    """Replaces the parameter or buffer name of module by its entries keep along dim. A
+       new parameter takes the place of the old one in optimizer, with its optimizer state
+       (e.g. the Adam moments) shrunk the same way.
+    """
+    tensor = getattr(module, name)
+    if tensor is None:
+        return
+    if not isinstance(tensor, nn.Parameter):
+        setattr(module, name, tensor.index_select(dim, keep))
+        return
+
+    param = nn.Parameter(tensor.detach().index_select(dim, keep), requires_grad=tensor.requires_grad)
+    setattr(module, name, param)
+    if optimizer is not None:
+        for param_group in optimizer.param_groups:
+            param_group['params'] = [param if p is tensor else p for p in param_group['params']]
+        if tensor in optimizer.state:
+            state = optimizer.state.pop(tensor)
+            optimizer.state[param] = dict(
+                (key, value.index_select(dim, keep) if torch.is_tensor(value) and value.shape == tensor.shape
+                 else value) for key, value in state.items())
+
+
+def prune_group(group, keep, optimizer=None):
+    """Keeps only the output units keep (sorted indices) of the producer of group, the
+       layers are rebuilt smaller in place.
+    """
+    _, producer, batch_norm, consumer = group
+    keep = keep.to(producer.weight.device)
+    shrink_tensor(producer, 'weight', 0, keep, optimizer)
+    shrink_tensor(producer, 'bias', 0, keep, optimizer)
+    if isinstance(producer, nn.Conv2d):
+        producer.out_channels = len(keep)
+    else:
+        producer.out_features = len(keep)
+
+    if batch_norm is not None:
+        for name in ['weight', 'bias', 'running_mean', 'running_var']:
+            shrink_tensor(batch_norm, name, 0, keep, optimizer)
+        batch_norm.num_features = len(keep)
+
+    shrink_tensor(consumer, 'weight', 1, keep, optimizer)
+    if isinstance(consumer, nn.Conv2d):
+        consumer.in_channels = len(keep)
+    else:
+        consumer.in_features = len(keep)
+
+
+def prune_smallest(group, num_units, optimizer=None):
+    """Keeps the num_units output units of group with the largest unit_importance.
+    """
+    _, producer, batch_norm, _ = group
+    importance = unit_importance(producer, batch_norm)
+    if num_units >= len(importance):
+        return
+    keep = torch.sort(torch.topk(importance, num_units)[1])[0]
+    prune_group(group, keep, optimizer)
+
+
+def match_pruned_shapes(model, state_dict):
+    """Shrinks a freshly built model to the unit counts of a pruned state_dict so that it
+       can be loaded, the weights themselves come from load_state_dict.
+    """
+    for group in prunable_groups(model):
+        key = group[0] + '.weight'
+        if key in state_dict and state_dict[key].shape[0] < group[1].weight.shape[0]:
+            prune_group(group, torch.arange(state_dict[key].shape[0]))
+    return model
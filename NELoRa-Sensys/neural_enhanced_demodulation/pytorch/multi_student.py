@@ -0,0 +1,201 @@
+# multi_student.py
+
+from __future__ import print_function
+from copy import deepcopy
+import time
+
+import numpy as np
+import scipy.io
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+import config
+import end2end
+from models.model_components import StudentMaskCNNModel, create_classifier
+from utils import create_dir, to_var, to_data, signal_to_network_input, parse_file_names, print_ser_table, inference_mode
+
+
+def parse_students(raw_opts, opts):
+    """Turns the name=value,name=value specs of --students into one options namespace per
+       student, casting the values with config.cast_option. The overrides are applied to
+       the parsed arguments raw_opts before config.prepare_opts, so that the options derived
+       from them (e.g. checkpoint_dir from dir_comment) follow. Raises ValueError for
+       overrides that change the input dimensions, the students share the teacher input.
+    """
+    students_opts = []
+    for spec in raw_opts.students:
+        overrides = {}
+        for override in filter(None, spec.split(',')):
+            name, _, value = override.partition('=')
+            overrides[name] = config.cast_option(raw_opts, name, value, '--students')
+        student_opts = config.prepare_opts(deepcopy(raw_opts), student=True, overrides=overrides)
+        for name in ['n_classes', 'stft_nfft', 'freq_size']:
+            if getattr(student_opts, name) != getattr(opts, name):
+                raise ValueError('--students "{}" changes {} of the teacher input'.format(spec, name))
+        create_dir(student_opts.checkpoint_dir)
+        students_opts.append(student_opts)
+    return students_opts
+
+
+def load_matching(model, state_dict):
+    """Copies the entries of state_dict whose name and shape exist in model, so that
+       students smaller than the teacher keep the teacher weights they can use.
+    """
+    model_dict = model.state_dict()
+    model_dict.update({k: v for k, v in state_dict.items()
+                       if k in model_dict and v.shape == model_dict[k].shape})
+    model.load_state_dict(model_dict)
+    return model
+
+
+class Student(object):
+    """One student configuration: its models, optimizer, checkpoint prefix and timings.
+    """
+
+    def __init__(self, index, opts, mask_CNN_teacher, C_XtoY_teacher):
+        self.name = 'student{}'.format(index)
+        self.opts = opts
+        self.mask_CNN = load_matching(StudentMaskCNNModel(opts), mask_CNN_teacher.state_dict())
+        self.C_XtoY = load_matching(create_classifier(opts), C_XtoY_teacher.state_dict())
+        if torch.cuda.is_available():
+            self.mask_CNN.cuda()
+            self.C_XtoY.cuda()
+        g_params = list(self.mask_CNN.parameters()) + list(self.C_XtoY.parameters())
+        self.optimizer = optim.Adam(g_params, opts.lr, [opts.beta1, opts.beta2])
+        self.num_params = sum(param.numel() for param in g_params)
+        self.step_time = 0.0
+
+
+def distill_students(training_dataloader_X, training_dataloader_Y, testing_dataloader_X, opts, raw_opts):
+    """Distills the --students configurations of StudentMaskCNNModel from the teacher at
+       once, with the losses of TS_train. Every batch is loaded, transformed and passed
+       through the teacher once, then each student takes its own optimizer step. raw_opts are
+       the parsed arguments the --students overrides apply to.
+       * Every opts.checkpoint_every iterations student[k] is saved with checkpoint_student
+         as student[k]_maskCNN.pkl / student[k]_C_XtoY.pkl in its own checkpoint_dir
+         (load_student_model(student_opts, 'student[k]')).
+       * At the end the students are tested on the same test batches and their per-SNR SER is
+         printed and saved to [dir_comment]_students_[bw].mat.
+    """
+    loss_spec_student = torch.nn.MSELoss(reduction='mean')
+    loss_class_student = nn.CrossEntropyLoss()
+    loss_spec_regular = torch.nn.MSELoss(reduction='mean')
+    loss_class_regular = nn.CrossEntropyLoss()
+
+    mask_CNN_teacher, C_XtoY_teacher = end2end.load_teacher_model(opts)
+    for param in list(mask_CNN_teacher.parameters()) + list(C_XtoY_teacher.parameters()):
+        param.requires_grad_(False)
+    students = [Student(index, student_opts, mask_CNN_teacher, C_XtoY_teacher)
+                for index, student_opts in enumerate(parse_students(raw_opts, opts))]
+
+    iter_X = iter(training_dataloader_X)
+    iter_Y = iter(training_dataloader_Y)
+    iter_per_epoch = min(len(iter_X), len(iter_Y))
+    shared_time = 0.0
+
+    for iteration in range(1, opts.train_iters + 1):
+        start_time = time.time()
+        if iteration % iter_per_epoch == 0:
+            iter_X = iter(training_dataloader_X)
+            iter_Y = iter(training_dataloader_Y)
+
+        images_X, name_X = next(iter_X)
+        labels_X = to_var(torch.tensor(parse_file_names(name_X)[3]))
+        images_Y, _ = next(iter_Y)
+        images_X_spectrum = signal_to_network_input(to_var(images_X), opts)
+        images_Y_spectrum = signal_to_network_input(to_var(images_Y), opts)
+
+        # the teacher is frozen, its outputs are only targets
+        with torch.no_grad():
+            fake_Y_spectrum_teacher = mask_CNN_teacher(images_X_spectrum)
+            labels_X_teacher = C_XtoY_teacher(fake_Y_spectrum_teacher)
+        shared_time += time.time() - start_time
+
+        for student in students:
+            start_time = time.time()
+            fake_Y_spectrum_student = student.mask_CNN(images_X_spectrum)
+            g_y_pix_loss_student = loss_spec_regular(fake_Y_spectrum_student, images_Y_spectrum)
+            labels_X_estimated_student = student.C_XtoY(fake_Y_spectrum_student)
+            g_y_class_loss_student = loss_class_regular(labels_X_estimated_student, labels_X)
+
+            g_y_pix_loss_distill = loss_spec_student(fake_Y_spectrum_student, fake_Y_spectrum_teacher)
+            g_y_class_loss_distill = loss_class_student(labels_X_estimated_student, labels_X_teacher)
+
+            student.optimizer.zero_grad()
+            G_Image_loss = opts.scaling_for_imaging_loss * g_y_pix_loss_student
+            G_Class_loss = opts.scaling_for_classification_loss * g_y_class_loss_student
+            G_Y_loss = G_Image_loss + G_Class_loss + g_y_pix_loss_distill + g_y_class_loss_distill * 0
+            G_Y_loss.backward()
+            student.optimizer.step()
+            student.step_time += time.time() - start_time
+
+            if iteration % opts.log_step == 0:
+                print(
+                    'Iteration [{:5d}/{:5d}] {:>10} | G_Y_loss: {:6.4f}| G_Image_loss: {:6.4f}| G_Class_loss: {:6.4f} | GDist_Image_loss: {:6.4f}'
+                        .format(iteration, opts.train_iters, student.name,
+                                G_Y_loss.item(),
+                                G_Image_loss.item(),
+                                G_Class_loss.item(),
+                                g_y_pix_loss_distill.item()))
+
+            if iteration % opts.checkpoint_every == 0:
+                end2end.checkpoint_student(iteration, student.mask_CNN, student.C_XtoY, student.opts, student.name)
+
+    for student in students:
+        end2end.checkpoint_student(opts.train_iters, student.mask_CNN, student.C_XtoY, student.opts, student.name)
+    report_students(students, shared_time, opts)
+
+    ser_columns, count = evaluate_students(testing_dataloader_X, students, opts)
+    print_ser_table('Student SER, {} students'.format(len(students)), ser_columns, count, opts.snr_list)
+    scipy.io.savemat(
+        opts.root_path + '/' + opts.dir_comment + '_students_' + str(opts.bw) + '.mat',
+        dict(students=np.array(opts.students, dtype=object),
+             error_matrix=np.stack([ser_columns[student.name] for student in students], axis=1),
+             error_matrix_count=count))
+    return students
+
+
+def evaluate_students(testing_dataloader_X, students, opts):
+    """Like end2end.evaluate_ser for all students at once: the test batches are read and
+       transformed once. Returns a dict name -> per-SNR SER and the symbol counts.
+    """
+    for student in students:
+        student.mask_CNN.eval()
+        student.C_XtoY.eval()
+
+    right = np.zeros([len(students), len(opts.snr_list)])
+    count = np.zeros(len(opts.snr_list), dtype=int)
+    with inference_mode():
+        for images_X_test, name_X_test in testing_dataloader_X:
+            _, snr_X_test_mapping, _, labels_X_test_mapping = parse_file_names(name_X_test)
+            images_X_test_spectrum = signal_to_network_input(to_var(images_X_test), opts)
+            snr_index = np.array([opts.snr_list.index(snr) for snr in snr_X_test_mapping])
+            np.add.at(count, snr_index, 1)
+            for index, student in enumerate(students):
+                _, labels_X_test_estimated = torch.max(student.C_XtoY(student.mask_CNN(images_X_test_spectrum)), 1)
+                test_right_case = to_data(labels_X_test_estimated) == np.array(labels_X_test_mapping)
+                np.add.at(right[index], snr_index, test_right_case)
+
+    ser = 1 - right / np.maximum(count, 1)
+    return dict((student.name, ser[index]) for index, student in enumerate(students)), count
+
+
+def report_students(students, shared_time, opts):
+    """Prints the size of every student and how the training time split between the shared
+       data/teacher pass and the student steps.
+    """
+    print('=' * 80)
+    print('Multi-student distillation, {} iterations'.format(opts.train_iters).center(80))
+    print('-' * 80)
+    print('{:>10} | {:>12} | {:>12} | {:>12} | {}'.format('student', 'parameters', 'step (s)', 'ms/iter', 'options'))
+    for student, spec in zip(students, opts.students):
+        print('{:>10} | {:>12d} | {:>12.2f} | {:>12.1f} | {}'.format(
+            student.name, student.num_params, student.step_time,
+            1000 * student.step_time / max(opts.train_iters, 1), spec or '(defaults)'))
+    print('-' * 80)
+    students_time = sum(student.step_time for student in students)
+    print('Shared data + teacher pass: {:.2f} s, student steps: {:.2f} s'.format(shared_time, students_time))
+    print('Separate runs would repeat the shared pass: {:.2f} s instead of {:.2f} s'.format(
+        len(students) * shared_time + students_time, shared_time + students_time))
+    print('=' * 80)
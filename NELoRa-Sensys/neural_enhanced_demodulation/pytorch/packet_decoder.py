@@ -0,0 +1,140 @@
+# packet_decoder.py
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from utils import to_var, signal_to_network_input
+
+# A synchronized packet: 8 preamble upchirps, 2 sync symbols and 2.25 downchirps
+# before the first data symbol (see symbol_generation/frame_decoder.m).
+HEADER_SYMBOLS = 12.25
+# The explicit header block is always sent with reduced rate and CR 4/8.
+HEADER_BLOCK = 8
+
+
+def gray_coding(symbols, sf, ldro=False):
+    """Maps demodulated symbols [P, N] to interleaved bit words (LoRaPHY.gray_coding).
+       The first 8 symbols are the reduced-rate header block.
+    """
+    din = np.array(symbols, dtype=np.int64)
+    din[:, :HEADER_BLOCK] = din[:, :HEADER_BLOCK] // 4
+    if ldro:
+        din[:, HEADER_BLOCK:] = din[:, HEADER_BLOCK:] // 4
+    else:
+        din[:, HEADER_BLOCK:] = np.mod(din[:, HEADER_BLOCK:] - 1, 2 ** sf)
+    return np.bitwise_xor(din, din >> 1)
+
+
+def diag_deinterleave(symbols, ppm):
+    """Diagonal deinterleaving of blocks [..., rdd] of ppm-bit words into
+       codewords [..., ppm] of rdd bits each (LoRaPHY.diag_deinterleave).
+    """
+    rdd = symbols.shape[-1]
+    # bits[..., x, j]: bit j (msb first) of symbol x
+    bits = (symbols[..., :, None] >> np.arange(ppm - 1, -1, -1)) & 1
+    # circularly shift row x left by x
+    shift = (np.arange(ppm)[None, :] + np.arange(rdd)[:, None]) % ppm
+    bits = np.take_along_axis(bits, np.broadcast_to(shift, bits.shape), axis=-1)
+    # column j read lsb first gives codeword j, codewords come out in reverse order
+    codewords = np.sum(bits << np.arange(rdd)[:, None], axis=-2)
+    return codewords[..., ::-1]
+
+
+def hamming_decode(codewords, rdd):
+    """Returns the data nibbles (bits 1-4) of rdd-bit codewords. For CR 4/7 and 4/8
+       single bit errors are corrected with the parity bits 5-7, which LoRa computes as
+       d0^d1^d2, d1^d2^d3 and d0^d1^d3 (LoRaPHY.hamming_decode).
+    """
+    codewords = np.array(codewords, dtype=np.int64)
+    if rdd >= 7:
+        bits = [(codewords >> pos) & 1 for pos in range(7)]
+        syndrome = ((bits[6] ^ bits[0] ^ bits[1] ^ bits[3]) << 2
+                    | (bits[4] ^ bits[0] ^ bits[1] ^ bits[2]) << 1
+                    | (bits[5] ^ bits[1] ^ bits[2] ^ bits[3]))
+        # syndrome of a single flipped data bit -> the bit to flip back
+        parity_fix = np.array([0, 0, 0, 4, 0, 8, 1, 2])
+        codewords = codewords ^ parity_fix[syndrome]
+    return codewords & 0xF
+
+
+def decode_symbols(symbols, sf, cr, ldro=False):
+    """Runs gray coding, deinterleaving and Hamming decoding over whole packets.
+       symbols: [P, N] demodulated symbol values of P packets.
+       Returns the nibbles [P, M] of every packet; dewhitening and CRC are left to the caller.
+    """
+    symbols_g = gray_coding(symbols, sf, ldro)
+    num_packets = symbols_g.shape[0]
+
+    header = diag_deinterleave(symbols_g[:, :HEADER_BLOCK], sf - 2)
+    nibbles = [hamming_decode(header, HEADER_BLOCK)]
+
+    rdd = cr + 4
+    num_blocks = (symbols_g.shape[1] - HEADER_BLOCK) // rdd
+    if num_blocks > 0:
+        blocks = symbols_g[:, HEADER_BLOCK:HEADER_BLOCK + num_blocks * rdd]
+        blocks = blocks.reshape(num_packets, num_blocks, rdd)
+        codewords = diag_deinterleave(blocks, sf - 2 * int(ldro))
+        nibbles.append(hamming_decode(codewords, rdd).reshape(num_packets, -1))
+    return np.concatenate(nibbles, axis=1)
+
+
+def parse_header(nibbles):
+    """Reads payload length, CRC flag and coding rate from the explicit header nibbles.
+    """
+    return dict(payload_len=nibbles[:, 0] * 16 + nibbles[:, 1],
+                crc=nibbles[:, 2] & 1,
+                cr=nibbles[:, 2] >> 1)
+
+
+class PacketDecoder(object):
+    """Demodulates every data symbol of a batch of synchronized packets with one
+       call of mask_CNN + C_XtoY, then decodes all packets at once.
+    """
+
+    def __init__(self, mask_CNN, C_XtoY, opts):
+        self.mask_CNN = mask_CNN.eval()
+        self.C_XtoY = C_XtoY.eval()
+        self.opts = opts
+        self.nsamp = opts.n_classes * opts.fs // opts.bw
+        self.data_start = int(round(HEADER_SYMBOLS * self.nsamp))
+
+    def split_symbols(self, packets, num_symbols=None):
+        """Cuts the data symbols out of packets [P, L], returns [P, N, nsamp].
+        """
+        if num_symbols is None:
+            num_symbols = (packets.shape[1] - self.data_start) // self.nsamp
+        data = packets[:, self.data_start:self.data_start + num_symbols * self.nsamp]
+        return data.reshape(packets.shape[0], num_symbols, self.nsamp)
+
+    def demodulate(self, symbols):
+        """Classifies symbols [S, nsamp] in a single batch.
+           Returns the top-k candidates and their softmax confidences, each [S, k].
+        """
+        opts = self.opts
+        with torch.no_grad():
+            symbols_spectrum = signal_to_network_input(to_var(symbols), opts)
+            labels_estimated = self.C_XtoY(self.mask_CNN(symbols_spectrum))
+            confidences, candidates = torch.topk(F.softmax(labels_estimated, dim=1), opts.packet_topk, dim=1)
+        return candidates.cpu(), confidences.cpu()
+
+    def decode(self, packets, num_symbols=None):
+        """Decodes synchronized packets [P, L] (or a single packet [L]).
+        """
+        packets = torch.as_tensor(packets, dtype=torch.cfloat)
+        if packets.dim() == 1:
+            packets = packets.unsqueeze(0)
+        symbols = self.split_symbols(packets, num_symbols)
+        num_packets, num_symbols = symbols.shape[0], symbols.shape[1]
+
+        candidates, confidences = self.demodulate(symbols.reshape(-1, self.nsamp))
+        candidates = candidates.view(num_packets, num_symbols, -1).numpy()
+        confidences = confidences.view(num_packets, num_symbols, -1).numpy()
+
+        result = dict(symbols=candidates[:, :, 0], candidates=candidates, confidences=confidences)
+        if num_symbols >= HEADER_BLOCK:
+            nibbles = decode_symbols(result['symbols'], self.opts.sf, self.opts.lora_cr, self.opts.lora_ldro)
+            result['nibbles'] = nibbles
+            if not self.opts.implicit_header:
+                result['header'] = parse_header(nibbles)
+        return result
@@ -0,0 +1,172 @@
+# preamble_detector.py
+# Streaming packet detection over long IQ captures, replacing the serial window
+# loops of symbol_generation/frame_detect.m, frame_detect2.m and frame_sync.m.
+
+from __future__ import print_function
+import time
+
+import numpy as np
+import torch
+
+import config
+from chirp_utils import gen_symbol, comp_alias
+from iq_reader import IQFile
+
+
+class PreambleDetector(object):
+    """Finds LoRa preambles in a capture that is fed block by block.
+       * Every block is correlated with the base upchirp by overlap-save, all
+         FFT frames of a block in one batched FFT. Frames below the power threshold
+         are gated out and never transformed.
+       * A packet starts where the normalized correlation peaks on all of
+         detect_preamble_len consecutive chirps.
+       * The CFO and time offset are refined on the up/down chirps of the
+         preamble as in frame_sync.m.
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.nsamp = opts.fs * 2 ** opts.sf // opts.bw
+        self.nfft = opts.detect_fft_size
+        self.step = self.nfft - self.nsamp + 1
+        if self.step <= 0:
+            raise ValueError('detect_fft_size must be larger than a chirp ({} samples)'.format(self.nsamp))
+
+        upchirp = gen_symbol(0, False, opts.sf, opts.bw, opts.fs)
+        self.filter_fft = torch.fft.fft(torch.flip(torch.conj(upchirp), [0]), n=self.nfft)
+        self.upchirp = upchirp
+        # frame_sync.m: upchirp preamble in window 5, downchirp SFD in window 11
+        self.frame_len = 12 * self.nsamp
+        self.reset()
+
+    def reset(self):
+        """Clears the streaming state to start on a new capture.
+        """
+        self.position = 0
+        self.history = torch.zeros(self.nsamp - 1, dtype=torch.cfloat)
+        self.corr_carry = torch.zeros(0)
+        self.corr_start = -(self.nsamp - 1)
+        self.next_allowed = 0
+
+    def correlate(self, block):
+        """Returns the normalized correlation of the upchirp with every window start
+           in [position - nsamp + 1, position + len(block) - nsamp + 1).
+        """
+        M = self.nsamp
+        num_out = block.shape[0]
+        num_frames = -(-num_out // self.step)
+        ext = torch.cat((self.history, block,
+                         torch.zeros(num_frames * self.step - num_out, dtype=torch.cfloat)))
+        frames = ext.unfold(0, self.nfft, self.step)
+
+        power = torch.abs(ext) ** 2
+        energy = torch.cumsum(torch.cat((torch.zeros(1, dtype=torch.double), power.double())), 0)
+        window_energy = (energy[M:M + num_out] - energy[:num_out]).float()
+
+        # energy gate: frames below the power threshold are never transformed
+        active = power.unfold(0, self.nfft, self.step).mean(dim=1) > self.opts.detect_power_threshold
+        corr = torch.zeros(num_frames, self.step)
+        if active.any():
+            spectrum = torch.fft.fft(frames[active], dim=-1) * self.filter_fft
+            corr[active] = torch.abs(torch.fft.ifft(spectrum, dim=-1)[:, M - 1:])
+        corr = corr.view(-1)[:num_out]
+        ncorr = corr / torch.sqrt(window_energy * M).clamp(min=1e-12)
+
+        self.history = ext[num_out:num_out + M - 1].clone()
+        return ncorr
+
+    def sync(self, frame):
+        """Estimates the time offset (samples) and CFO (Hz) of a frame starting
+           at the detected preamble, as in frame_sync.m. A positive time offset
+           means the frame starts that many samples before the detected preamble.
+        """
+        opts = self.opts
+        nsamp = self.nsamp
+        nfft = nsamp * 10
+        over_rate = opts.fs / opts.bw
+
+        up_pre = frame[5 * nsamp:6 * nsamp]
+        down_pre = frame[11 * nsamp:12 * nsamp]
+        rz = torch.fft.fft(up_pre * torch.conj(self.upchirp), n=nfft)
+        rz, _ = comp_alias(rz, over_rate)
+        up_freq = torch.argmax(torch.abs(rz)).item() / nfft * opts.fs
+        rz = torch.fft.fft(down_pre * self.upchirp, n=nfft)
+        rz, _ = comp_alias(rz, over_rate)
+        down_freq = torch.argmax(torch.abs(rz)).item() / nfft * opts.fs
+
+        f_offset = (up_freq + down_freq) / 2
+        if abs(f_offset) > 0.4 * opts.bw:
+            f_offset = f_offset + opts.bw / 2 if f_offset < 0 else f_offset - opts.bw / 2
+        t_offset = int(round((up_freq - f_offset) / opts.bw * nsamp))
+        if t_offset > nsamp / 2:
+            t_offset -= nsamp
+        return t_offset, f_offset
+
+    def process(self, block):
+        """Feeds the next block of the capture, returns the coarse starts of the
+           preambles that are complete so far.
+        """
+        M = self.nsamp
+        span = (self.opts.detect_preamble_len - 1) * M
+        ncorr = torch.cat((self.corr_carry, self.correlate(torch.as_tensor(block, dtype=torch.cfloat))))
+        self.position += len(block)
+
+        # score[g] = min correlation at g, g + nsamp, ..., g + span
+        num_scores = ncorr.shape[0] - span - M
+        starts = []
+        if num_scores > 0:
+            score = torch.stack([ncorr[k * M:k * M + num_scores + M]
+                                 for k in range(self.opts.detect_preamble_len)]).min(dim=0)[0]
+            candidates = torch.nonzero(score[:num_scores] > self.opts.detect_threshold).view(-1).tolist()
+            for index in candidates:
+                if self.corr_start + index < self.next_allowed:
+                    continue
+                peak = self.corr_start + index + torch.argmax(score[index:index + M]).item()
+                starts.append(max(peak, 0))
+                self.next_allowed = peak + self.frame_len
+            ncorr = ncorr[num_scores:]
+            self.corr_start += num_scores
+        self.corr_carry = ncorr
+        return starts
+
+    def detect(self, iq):
+        """Detects all packets of a 1-d complex capture (array or memmap).
+           Returns the packet start offsets and CFO estimates.
+        """
+        self.reset()
+        block_size = self.opts.detect_block_size
+        coarse = []
+        for block_start in range(0, len(iq), block_size):
+            block = np.array(iq[block_start:block_start + block_size], dtype=np.complex64)
+            coarse += self.process(torch.from_numpy(block))
+
+        starts, cfos = [], []
+        for start in coarse:
+            frame = np.array(iq[start:start + self.frame_len], dtype=np.complex64)
+            if len(frame) < self.frame_len:
+                continue
+            t_offset, f_offset = self.sync(torch.from_numpy(frame))
+            starts.append(start - t_offset)
+            cfos.append(f_offset)
+        return np.array(starts, dtype=np.int64), np.array(cfos)
+
+
+def open_iq(path):
+    """Memory-maps a capture of interleaved float32 I/Q (gr_complex), like io_read_iq.m.
+    """
+    return IQFile(path).samples
+
+
+if __name__ == "__main__":
+    parser = config.create_parser()
+    opts = parser.parse_args()
+
+    iq = open_iq(opts.iq_file)
+    detector = PreambleDetector(opts)
+    start_time = time.time()
+    starts, cfos = detector.detect(iq)
+    elapsed = time.time() - start_time
+    print('Detected {} packets in {} samples ({:.2f} s, {:.1f} Msamples/s)'
+          .format(len(starts), len(iq), elapsed, len(iq) / elapsed / 1e6))
+    for start, cfo in zip(starts, cfos):
+        print('{:>12d} | cfo: {:10.1f} Hz'.format(start, cfo))
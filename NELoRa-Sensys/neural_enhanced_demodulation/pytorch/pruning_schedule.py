@@ -0,0 +1,126 @@
+# pruning_schedule.py
+
+from __future__ import print_function
+import time
+
+import numpy as np
+import scipy.io
+import torch
+
+import end2end
+from models.pruning import prunable_groups, prune_smallest
+from utils import to_var, signal_to_network_input, print_ser_table, inference_mode
+
+
+class PruningSchedule(object):
+    """Gradual structured magnitude pruning of mask_CNN and C_XtoY during training.
+       * The pruned fraction of every group of prunable_groups (conv channels, fc neurons)
+         follows s(t) = opts.prune_target * (1 - (1 - p) ** 3), p going from 0 at
+         opts.prune_start to 1 at opts.prune_end, and is updated every opts.prune_every
+         iterations. The units with the smallest weight norm are removed and the layers are
+         rebuilt smaller in place, together with their Adam state.
+       * Before every pruning step, and at the end, the current level (fine-tuned since the
+         previous step) is measured: the parameters, the inference latency of one test
+         batch and the per-SNR SER on the first opts.prune_eval_batches test batches. The
+         levels are only reported, nothing is selected on them, so they use the test split.
+    """
+
+    def __init__(self, mask_CNN, C_XtoY, testing_dataloader_X, opts):
+        self.opts = opts
+        self.models = (mask_CNN, C_XtoY)
+        self.units = dict((group[0] + name, group[1].weight.shape[0])
+                          for name, model in zip(['/mask', '/classifier'], self.models)
+                          for group in prunable_groups(model))
+        self.subset = []
+        for batch_index, batch in enumerate(testing_dataloader_X):
+            if batch_index >= opts.prune_eval_batches:
+                break
+            self.subset.append(batch)
+        self.sparsity = 0.0
+        self.levels = []
+
+    def target_sparsity(self, iteration):
+        progress = (iteration - self.opts.prune_start) / max(self.opts.prune_end - self.opts.prune_start, 1)
+        progress = min(max(progress, 0.0), 1.0)
+        return self.opts.prune_target * (1 - (1 - progress) ** 3)
+
+    def step(self, iteration, optimizer):
+        """Prunes to the scheduled sparsity if iteration is a pruning step. Returns True if
+           units were removed.
+        """
+        if iteration < self.opts.prune_start or iteration > self.opts.prune_end or \
+                (iteration - self.opts.prune_start) % self.opts.prune_every != 0:
+            return False
+        sparsity = self.target_sparsity(iteration)
+        pruned = []
+        for name, model in zip(['/mask', '/classifier'], self.models):
+            for group in prunable_groups(model):
+                num_units = max(1, int(round(self.units[group[0] + name] * (1 - sparsity))))
+                if num_units < group[1].weight.shape[0]:
+                    pruned.append((group, num_units))
+        if not pruned:
+            return False
+
+        self.measure(iteration)
+        for group, num_units in pruned:
+            prune_smallest(group, num_units, optimizer)
+        self.sparsity = sparsity
+        print('Iteration [{:5d}] | pruned to sparsity {:.3f}, {} parameters'.format(
+            iteration, sparsity, self.num_params()))
+        return True
+
+    def num_params(self):
+        return sum(param.numel() for model in self.models for param in model.parameters())
+
+    def latency(self):
+        """Median inference time of one test batch in ms.
+        """
+        mask_CNN, C_XtoY = self.models
+        modes = (mask_CNN.training, C_XtoY.training)
+        mask_CNN.eval()
+        C_XtoY.eval()
+        images_X_spectrum = signal_to_network_input(to_var(self.subset[0][0]), self.opts)
+        times = []
+        with inference_mode():
+            for repeat in range(self.opts.prune_latency_repeats + 1):
+                start_time = time.time()
+                C_XtoY(mask_CNN(images_X_spectrum))
+                if torch.cuda.is_available():
+                    torch.cuda.synchronize()
+                if repeat > 0:
+                    times.append(time.time() - start_time)
+        mask_CNN.train(modes[0])
+        C_XtoY.train(modes[1])
+        return 1000 * np.median(times)
+
+    def measure(self, iteration):
+        ser, count = end2end.evaluate_ser(self.subset, self.models[0], self.models[1], self.opts)
+        self.levels.append((iteration, self.sparsity, self.num_params(), self.latency(), ser, count))
+
+    def report(self, iteration):
+        """Measures the final level and prints and saves all levels to [dir_comment]_pruning.mat.
+        """
+        self.measure(iteration)
+        print('=' * 80)
+        print('Structured pruning, {} eval batches'.format(len(self.subset)).center(80))
+        print('-' * 80)
+        print('{:>10} | {:>10} | {:>12} | {:>12} | {:>10}'.format(
+            'iteration', 'sparsity', 'parameters', 'latency (ms)', 'SER'))
+        for level_iteration, sparsity, num_params, latency, ser, count in self.levels:
+            print('{:>10d} | {:>10.3f} | {:>12d} | {:>12.2f} | {:>10.4f}'.format(
+                level_iteration, sparsity, num_params, latency, np.sum(ser * count) / max(count.sum(), 1)))
+        print('-' * 80)
+        print('Layers: {}'.format(', '.join('{}={}'.format(group[0], group[1].weight.shape[0])
+                                            for model in self.models for group in prunable_groups(model))))
+        print('=' * 80)
+        print_ser_table('Per-SNR SER by sparsity',
+                        dict(('{:.3f}'.format(level[1]), level[4]) for level in self.levels),
+                        self.levels[-1][5], self.opts.snr_list)
+        scipy.io.savemat(
+            self.opts.root_path + '/' + self.opts.dir_comment + '_pruning.mat',
+            dict(iteration=np.array([level[0] for level in self.levels]),
+                 sparsity=np.array([level[1] for level in self.levels]),
+                 parameters=np.array([level[2] for level in self.levels]),
+                 latency_ms=np.array([level[3] for level in self.levels]),
+                 ser=np.stack([level[4] for level in self.levels], axis=1),
+                 count=self.levels[-1][5]))
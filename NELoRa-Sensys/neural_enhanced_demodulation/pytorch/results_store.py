@@ -0,0 +1,173 @@
+# results_store.py
+
+import os
+import sqlite3
+import time
+
+import numpy as np
+import torch
+
+from results_writer import load_results
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS runs (
+           run_id INTEGER PRIMARY KEY, run TEXT, checkpoint TEXT, sf INTEGER, bw INTEGER, created REAL,
+           UNIQUE (run, checkpoint, sf, bw))''',
+    '''CREATE TABLE IF NOT EXISTS symbols (
+           run_id INTEGER, instance INTEGER, code REAL, snr INTEGER, predicted INTEGER, label INTEGER)''',
+    '''CREATE TABLE IF NOT EXISTS counts (
+           run_id INTEGER, snr INTEGER, instance INTEGER, code REAL, symbols INTEGER, errors INTEGER,
+           PRIMARY KEY (run_id, snr, instance, code)) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS runs_run ON runs (run)',
+    'CREATE INDEX IF NOT EXISTS runs_checkpoint ON runs (checkpoint)',
+    'CREATE INDEX IF NOT EXISTS symbols_run_snr ON symbols (run_id, snr)',
+    'CREATE INDEX IF NOT EXISTS symbols_run_instance ON symbols (run_id, instance)',
+    'CREATE INDEX IF NOT EXISTS symbols_run_code ON symbols (run_id, code)',
+    # the primary key of counts orders it by (run_id, snr), the covering indexes below by
+    # (run_id, instance) and (run_id, code): every breakdown is one ordered index scan
+    'CREATE INDEX IF NOT EXISTS counts_instance ON counts (run_id, instance, snr, code, symbols, errors)',
+    'CREATE INDEX IF NOT EXISTS counts_code ON counts (run_id, code, snr, instance, symbols, errors)',
+]
+
+
+def checkpoint_name(opts):
+    """Names the weights evaluated at the end of a training run: the loaded checkpoint
+       iteration plus the iterations trained on top of it.
+    """
+    if opts.load:
+        return '{}+{}'.format(opts.load_iters, opts.train_iters)
+    return str(opts.train_iters)
+
+
+class ResultsStore(object):
+    """SQLite store of the per-symbol test results of many evaluation runs.
+       * symbols keeps every (instance, code, snr, predicted, label) record of a run.
+       * counts keeps the number of symbols and errors per (run, snr, instance, code),
+         built when a run is finished; the SER queries only aggregate this table, so
+         they stay fast with hundreds of runs of millions of symbols.
+       A run is identified by its name (the dir_comment), checkpoint, sf and bw. Storing
+       a run again replaces its previous records.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # runs of a sweep finish concurrently, wait for the write lock of the others
+        self.connection = sqlite3.connect(path, timeout=600)
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def begin_run(self, run, checkpoint, sf, bw):
+        """Deletes the records of a previous evaluation of the run and returns its run_id.
+        """
+        with self.connection:
+            row = self.connection.execute('SELECT run_id FROM runs WHERE run = ? AND checkpoint = ? AND sf = ? AND bw = ?',
+                                          (run, str(checkpoint), sf, bw)).fetchone()
+            if row is not None:
+                self.connection.execute('DELETE FROM symbols WHERE run_id = ?', row)
+                self.connection.execute('DELETE FROM counts WHERE run_id = ?', row)
+                self.connection.execute('DELETE FROM runs WHERE run_id = ?', row)
+            cursor = self.connection.execute('INSERT INTO runs (run, checkpoint, sf, bw, created) VALUES (?, ?, ?, ?, ?)',
+                                             (run, str(checkpoint), sf, bw, time.time()))
+        return cursor.lastrowid
+
+    def append(self, run_id, instance, code, snr, predicted, label):
+        """Appends one batch of results, with the arguments of ResultsWriter.append. Every
+           batch is committed on its own so that the write lock is only held briefly, the
+           SER queries ignore the run until finish_run builds its counts.
+        """
+        columns = []
+        for column in [instance, code, snr, predicted, label]:
+            if torch.is_tensor(column):
+                column = column.detach().cpu().numpy()
+            columns.append(np.asarray(column).tolist())
+        with self.connection:
+            self.connection.executemany('INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)',
+                                        ((run_id,) + row for row in zip(*columns)))
+
+    def finish_run(self, run_id):
+        """Builds the counts of the run and commits it.
+        """
+        with self.connection:
+            self.connection.execute(
+                '''INSERT INTO counts SELECT run_id, snr, instance, code, COUNT(*), SUM(predicted != label)
+                   FROM symbols WHERE run_id = ? GROUP BY snr, instance, code''', (run_id,))
+
+    def ingest_results(self, results_dir, run, checkpoint, sf, bw):
+        """Stores the results written by a ResultsWriter to results_dir as a run.
+        """
+        results = load_results(results_dir, ['instance', 'code', 'snr', 'predicted', 'label'])
+        run_id = self.begin_run(run, checkpoint, sf, bw)
+        self.append(run_id, results['instance'], results['code'], results['snr'], results['predicted'],
+                    results['label'])
+        self.finish_run(run_id)
+        return run_id
+
+    def runs(self, run=None, checkpoint=None):
+        """Returns (run_id, run, checkpoint, sf, bw) of the stored runs, optionally only those
+           whose name and checkpoint match the SQL LIKE patterns run and checkpoint.
+        """
+        where, values = filters([('run LIKE ?', run), ('checkpoint LIKE ?', checkpoint)])
+        return self.connection.execute('SELECT run_id, run, checkpoint, sf, bw FROM runs' + where +
+                                       ' ORDER BY run, checkpoint', values).fetchall()
+
+    def breakdown(self, key, run=None, checkpoint=None, snr=None, instance=None, code=None):
+        """Returns {(run, checkpoint): {value of key: (SER, symbols)}} over the runs matching
+           run and checkpoint (LIKE patterns), key being 'snr', 'instance' or 'code', and the
+           counts restricted to the given snr, instance and code.
+        """
+        assert key in ['snr', 'instance', 'code']
+        run_where, run_values = filters([('run LIKE ?', run), ('checkpoint LIKE ?', checkpoint)])
+        where, values = filters([('snr = ?', snr), ('instance = ?', instance), ('code = ?', code)], ' AND ')
+        rows = self.connection.execute(
+            '''SELECT runs.run, runs.checkpoint, value, errors, symbols FROM (
+                   SELECT run_id, {0} AS value, SUM(errors) AS errors, SUM(symbols) AS symbols FROM counts
+                   WHERE run_id IN (SELECT run_id FROM runs{1}){2} GROUP BY run_id, {0}) JOIN runs USING (run_id)
+               ORDER BY runs.run, runs.checkpoint, value'''.format(key, run_where, where),
+            run_values + values).fetchall()
+        table = {}
+        for run_name, run_checkpoint, value, errors, symbols in rows:
+            table.setdefault((run_name, run_checkpoint), {})[value] = (errors / symbols, symbols)
+        return table
+
+    def ser_by_snr(self, snr_list, run=None, checkpoint=None, instance=None, code=None):
+        """Returns the per-SNR SER and symbol counts of every matching run as two dicts
+           'run@checkpoint' -> array aligned with snr_list (NaN SER where a run has no symbols),
+           the format of print_ser_table.
+        """
+        ser, count = {}, {}
+        for (run_name, run_checkpoint), by_snr in self.breakdown('snr', run, checkpoint, None, instance, code).items():
+            name = '{}@{}'.format(run_name, run_checkpoint)
+            ser[name] = np.array([by_snr.get(snr, (np.nan, 0))[0] for snr in snr_list])
+            count[name] = np.array([by_snr.get(snr, (np.nan, 0))[1] for snr in snr_list])
+        return ser, count
+
+    def ser_by_instance(self, run=None, checkpoint=None, snr=None, code=None):
+        """Returns {(run, checkpoint): {instance: (SER, symbols)}}, optionally at one SNR.
+        """
+        return self.breakdown('instance', run, checkpoint, snr, None, code)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def filters(conditions, keyword=' WHERE '):
+    """Builds the WHERE clause (or the AND clause to extend one) and its values of the
+       (condition, value) pairs whose value is set.
+    """
+    conditions = [(condition, value) for condition, value in conditions if value is not None]
+    if not conditions:
+        return '', []
+    return keyword + ' AND '.join(condition for condition, _ in conditions), [value for _, value in conditions]
+
+
+def open_store(opts):
+    """Returns the ResultsStore at opts.results_db, or None if it is disabled.
+    """
+    if not opts.results_db:
+        return None
+    directory = os.path.dirname(opts.results_db)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    return ResultsStore(opts.results_db)
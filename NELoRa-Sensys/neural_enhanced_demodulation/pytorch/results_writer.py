@@ -0,0 +1,131 @@
+# results_writer.py
+
+import os
+import json
+
+import numpy as np
+import torch
+
+RESULT_COLUMNS = [('instance', np.int16),
+                  ('code', np.float32),
+                  ('snr', np.int8),
+                  ('predicted', np.int16),
+                  ('label', np.int16)]
+
+
+class ResultsWriter(object):
+    """Streams per-symbol test results into memory-mapped .npy chunks.
+       Every column lives in its own fixed-size chunk file, so memory stays constant
+       no matter how large the test set is. An index.json records the row count of
+       each chunk for load_results.
+    """
+
+    def __init__(self, results_dir, topk=0, chunk_rows=65536):
+        self.results_dir = results_dir
+        self.topk = topk
+        self.chunk_rows = chunk_rows
+        self.columns = list(RESULT_COLUMNS)
+        if topk > 0:
+            self.columns += [('topk_logits', np.float16), ('topk_index', np.int16)]
+
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        for name in os.listdir(results_dir):
+            if name.startswith('chunk_') or name == 'index.json':
+                os.remove(os.path.join(results_dir, name))
+
+        self.chunk_sizes = []
+        self.chunk = None
+        self.chunk_fill = 0
+
+    def _chunk_path(self, chunk_index, column):
+        return os.path.join(self.results_dir, 'chunk_{:05d}_{}.npy'.format(chunk_index, column))
+
+    def _open_chunk(self):
+        chunk_index = len(self.chunk_sizes)
+        self.chunk = {}
+        for column, dtype in self.columns:
+            shape = (self.chunk_rows, self.topk) if column.startswith('topk') else (self.chunk_rows,)
+            self.chunk[column] = np.lib.format.open_memmap(self._chunk_path(chunk_index, column),
+                                                           mode='w+', dtype=dtype, shape=shape)
+        self.chunk_sizes.append(0)
+        self.chunk_fill = 0
+
+    def _close_chunk(self):
+        for column in self.chunk:
+            self.chunk[column].flush()
+        self.chunk_sizes[-1] = self.chunk_fill
+        self.chunk = None
+
+    def append(self, instance, code, snr, predicted, label, logits=None):
+        """Appends one batch of results. Tensors are moved to the cpu and converted.
+        """
+        batch = {'instance': instance, 'code': code, 'snr': snr,
+                 'predicted': predicted, 'label': label}
+        for column in batch:
+            if torch.is_tensor(batch[column]):
+                batch[column] = batch[column].detach().cpu().numpy()
+            batch[column] = np.asarray(batch[column])
+        if self.topk > 0:
+            values, indices = torch.topk(logits.detach().float(), self.topk, dim=1)
+            batch['topk_logits'] = values.cpu().numpy()
+            batch['topk_index'] = indices.cpu().numpy()
+
+        num_rows = len(batch['label'])
+        start = 0
+        while start < num_rows:
+            if self.chunk is None or self.chunk_fill == self.chunk_rows:
+                if self.chunk is not None:
+                    self._close_chunk()
+                self._open_chunk()
+            stop = min(num_rows, start + self.chunk_rows - self.chunk_fill)
+            for column in self.chunk:
+                self.chunk[column][self.chunk_fill:self.chunk_fill + stop - start] = batch[column][start:stop]
+            self.chunk_fill += stop - start
+            start = stop
+
+    def close(self):
+        """Flushes the last chunk and writes the index.
+        """
+        if self.chunk is not None:
+            self._close_chunk()
+        index = dict(columns=[[column, np.dtype(dtype).str] for column, dtype in self.columns],
+                     topk=self.topk,
+                     chunk_sizes=self.chunk_sizes)
+        with open(os.path.join(self.results_dir, 'index.json'), 'w') as f:
+            json.dump(index, f)
+
+
+def load_results(results_dir, columns=None):
+    """Loads the columns written by a ResultsWriter as one numpy array per column.
+       The chunks are memory-mapped, only the valid rows are copied out.
+    """
+    with open(os.path.join(results_dir, 'index.json')) as f:
+        index = json.load(f)
+    if columns is None:
+        columns = [column for column, _ in index['columns']]
+
+    results = {}
+    for column in columns:
+        parts = []
+        for chunk_index, chunk_size in enumerate(index['chunk_sizes']):
+            path = os.path.join(results_dir, 'chunk_{:05d}_{}.npy'.format(chunk_index, column))
+            parts.append(np.load(path, mmap_mode='r')[:chunk_size])
+        results[column] = np.concatenate(parts) if parts else np.zeros(0)
+    return results
+
+
+def error_matrix_from_results(results, snr_list):
+    """Computes the per-SNR accuracy and count matrices saved in the evaluation .mat files.
+    """
+    snr = results['snr'].astype(int)
+    valid = np.isin(snr, snr_list)
+    snr_table = np.zeros(256, dtype=int)
+    snr_table[np.asarray(snr_list) + 128] = np.arange(len(snr_list))
+    snr_index = snr_table[snr[valid] + 128]
+    right = (results['predicted'][valid] == results['label'][valid]).astype(float)
+    error_matrix = np.zeros([len(snr_list), 1], dtype=float)
+    error_matrix_count = np.zeros([len(snr_list), 1], dtype=int)
+    np.add.at(error_matrix[:, 0], snr_index, right)
+    np.add.at(error_matrix_count[:, 0], snr_index, 1)
+    return np.divide(error_matrix, error_matrix_count), error_matrix_count
@@ -0,0 +1,220 @@
+# sweep.py
+
+from __future__ import print_function
+from copy import deepcopy
+import itertools
+import os
+import queue
+import sys
+import time
+import traceback
+
+import numpy as np
+import scipy.io
+import torch
+import torch.multiprocessing as mp
+
+import config
+import datasets.data_loader as data_loader
+from datasets.curriculum_sampler import CurriculumSampler
+from utils import generate_dataset, split_validation, create_dir, print_ser_table
+import end2end
+
+
+def parse_sweep(raw_opts, sweep):
+    """Expands the name=value1,value2 specs of --sweep into the list of trial overrides
+       (all combinations), casting the values with config.cast_option.
+    """
+    names, values = [], []
+    for spec in sweep:
+        name, _, choices = spec.partition('=')
+        names.append(name)
+        values.append([config.cast_option(raw_opts, name, value, '--sweep') for value in choices.split(',')])
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def trial_options(raw_opts, trial, overrides):
+    """Returns the options of a trial, with its own dir_comment (checkpoints, samples, results).
+    """
+    opts = deepcopy(raw_opts)
+    for name, value in overrides.items():
+        setattr(opts, name, value)
+    opts.dir_comment = '{}_trial{}'.format(raw_opts.dir_comment, trial)
+    return config.prepare_opts(opts)
+
+
+class TrialMonitor(object):
+    """Collects the loss curve of a trial and applies the median stopping rule: from
+       the opts.sweep_grace_reports-th report on, a trial stops when its mean loss over
+       the last opts.sweep_report_every iterations is worse than the median of at least
+       two other trials at the same iteration. reports is the [trials, reports] array
+       shared by all trials.
+    """
+
+    def __init__(self, trial, reports, opts):
+        self.trial = trial
+        self.reports = reports
+        self.opts = opts
+        self.curve = []
+        self.window = []
+        self.stopped = None
+
+    def __call__(self, iteration, G_Y_loss, G_Image_loss, G_Class_loss):
+        self.curve.append((iteration, G_Y_loss, G_Image_loss, G_Class_loss))
+        self.window.append(G_Y_loss)
+        report_every = self.opts.sweep_report_every
+        if iteration % report_every != 0 or iteration // report_every > self.reports.shape[1]:
+            return False
+
+        report = iteration // report_every - 1
+        loss = np.mean(self.window)
+        self.window = []
+        self.reports[self.trial, report] = loss
+        others = np.delete(self.reports[:, report], self.trial)
+        others = others[~np.isnan(others)]
+        if report + 1 >= self.opts.sweep_grace_reports and len(others) >= 2 and loss > np.median(others):
+            self.stopped = iteration
+            return True
+        return False
+
+
+def run_trial(trial, opts, memory_datasets, reports, cores, results_queue):
+    """Trains one trial on its core set from the shared in-memory datasets and puts its
+       loss curve and per-SNR SER on results_queue. The output goes to a per-trial log.
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+
+    create_dir(opts.checkpoint_dir)
+    if not opts.server:
+        create_dir(opts.sample_dir)
+        create_dir(opts.testing_dir)
+    sys.stdout = open(os.path.join(opts.evaluations_path, opts.dir_comment + '.log'), 'w', buffering=1)
+
+    monitor = TrialMonitor(trial, reports, opts)
+    start_time = time.time()
+    try:
+        train_X, train_Y, test_X, test_Y, validation_X = memory_datasets
+        train_sampler = None
+        if opts.sampler == 'curriculum':
+            train_sampler = CurriculumSampler(opts, [name + '.mat' for name in train_X.names])
+        training_dataloader_X, testing_dataloader_X = data_loader.dataset_loader(
+            opts, train_X, test_X, train_sampler, num_workers=0)
+        training_dataloader_Y, testing_dataloader_Y = data_loader.dataset_loader(
+            opts, train_Y, test_Y, train_sampler, num_workers=0)
+        validation_dataloader_X = None
+        if validation_X is not None:
+            validation_dataloader_X = data_loader.testing_loader(opts, validation_X, num_workers=0)
+        accuracy, count = end2end.training_loop(training_dataloader_X, training_dataloader_Y,
+                                                testing_dataloader_X, testing_dataloader_Y, opts, monitor,
+                                                validation_dataloader_X=validation_dataloader_X)
+        results_queue.put(dict(trial=trial, curve=np.array(monitor.curve), ser=1 - accuracy[:, 0],
+                               count=count[:, 0], stopped=monitor.stopped, elapsed=time.time() - start_time))
+    except Exception:
+        traceback.print_exc()
+        results_queue.put(dict(trial=trial, error=traceback.format_exc().splitlines()[-1]))
+
+
+def run_sweep(raw_opts):
+    """Loads the dataset once into shared memory, then forks the trials of raw_opts.sweep
+       opts.sweep_parallel at a time, each pinned to its own set of cores.
+    """
+    opts = config.prepare_opts(deepcopy(raw_opts))
+    trials = parse_sweep(raw_opts, raw_opts.sweep)
+
+    [files_train, files_test
+     ] = generate_dataset(opts.root_path, opts.data_dir, opts.ratio_bt_train_and_test,
+                          opts.code_list, opts.snr_list, opts.bw_list, opts.sf_list,
+                          opts.instance_list, opts.sorting_type)
+    # one training split for all trials, held out if any of them validates
+    files_validation = None
+    if any(end2end.validation_enabled(trial_options(raw_opts, trial, overrides))
+           for trial, overrides in enumerate(trials)):
+        files_train, files_validation = split_validation(files_train, opts)
+    start_time = time.time()
+    memory_datasets = [data_loader.lora_memory_dataset(opts, files, groundtruth).share_memory_()
+                       for files, groundtruth in [(files_train, False), (files_train, True),
+                                                  (files_test, False), (files_test, True)]]
+    memory_datasets.append(None if files_validation is None else
+                           data_loader.lora_memory_dataset(opts, files_validation).share_memory_())
+    print('Loaded {} symbols into shared memory in {:.1f} s'.format(
+        sum(len(dataset) for dataset in memory_datasets if dataset is not None), time.time() - start_time))
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    parallel = opts.sweep_parallel if opts.sweep_parallel > 0 else len(cores)
+    parallel = max(1, min(parallel, len(trials), len(cores)))
+    core_sets = [[int(core) for core in core_set] for core_set in np.array_split(cores, parallel)]
+
+    context = mp.get_context('fork')
+    num_reports = max(opts.train_iters // opts.sweep_report_every, 1)
+    shared_reports = context.Array('d', len(trials) * num_reports, lock=False)
+    reports = np.frombuffer(shared_reports).reshape(len(trials), num_reports)
+    reports[:] = np.nan
+    results_queue = context.Queue()
+
+    pending = list(range(len(trials)))
+    free_slots = list(range(parallel))
+    running = {}
+    results = {}
+    while pending or running:
+        while pending and free_slots:
+            trial, slot = pending.pop(0), free_slots.pop(0)
+            print('Trial {} on cores {}: {}'.format(trial, core_sets[slot], trials[trial]))
+            process = context.Process(target=run_trial, args=(
+                trial, trial_options(raw_opts, trial, trials[trial]), memory_datasets, reports,
+                core_sets[slot], results_queue))
+            process.start()
+            running[trial] = (process, slot)
+
+        try:
+            result = results_queue.get(timeout=10)
+        except queue.Empty:
+            for trial, (process, slot) in list(running.items()):
+                if not process.is_alive() and process.exitcode != 0:
+                    results[trial] = dict(trial=trial, error='exit code {}'.format(process.exitcode))
+                    running.pop(trial)
+                    free_slots.append(slot)
+            continue
+        results[result['trial']] = result
+        process, slot = running.pop(result['trial'])
+        process.join()
+        free_slots.append(slot)
+        print('Trial {} finished'.format(result['trial']))
+
+    report_sweep(trials, results, opts)
+    return trials, results
+
+
+def report_sweep(trials, results, opts):
+    """Prints the trials with their final loss and SER, the per-SNR SER of every trial,
+       and saves the loss curves and SER to [dir_comment]_sweep.mat.
+    """
+    print('=' * 80)
+    print('Sweep results'.center(80))
+    print('-' * 80)
+    print('{:>5} | {:<30} | {:>9} | {:>8} | {:>8} | {:>8}'.format(
+        'trial', 'options', 'status', 'loss', 'SER', 'time (s)'))
+    ser_columns = {}
+    count = np.zeros(len(opts.snr_list), dtype=int)
+    saved = dict(options=np.array([str(overrides) for overrides in trials], dtype=object))
+    for trial, overrides in enumerate(trials):
+        options = ' '.join('{}={}'.format(name, value) for name, value in overrides.items())[:30]
+        result = results[trial]
+        if 'error' in result:
+            print('{:>5d} | {:<30} | {:>9} | {}'.format(trial, options, 'failed', result['error']))
+            continue
+        status = 'done' if result['stopped'] is None else 'stop@{}'.format(result['stopped'])
+        final_loss = result['curve'][-opts.sweep_report_every:, 1].mean() if len(result['curve']) else np.nan
+        evaluated = result['count'] > 0
+        ser = np.sum(result['ser'][evaluated] * result['count'][evaluated]) / max(result['count'].sum(), 1)
+        print('{:>5d} | {:<30} | {:>9} | {:>8.4f} | {:>8.4f} | {:>8.1f}'.format(
+            trial, options, status, final_loss, ser, result['elapsed']))
+        ser_columns['trial{}'.format(trial)] = result['ser']
+        count = np.maximum(count, result['count'])
+        saved['curve_trial{}'.format(trial)] = result['curve']
+        saved['ser_trial{}'.format(trial)] = result['ser']
+    print('=' * 80)
+    if ser_columns:
+        print_ser_table('SER per SNR of the sweep trials', ser_columns, count, opts.snr_list)
+    scipy.io.savemat(opts.root_path + '/' + opts.dir_comment + '_sweep.mat', saved)
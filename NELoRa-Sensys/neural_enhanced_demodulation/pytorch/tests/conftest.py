@@ -0,0 +1,17 @@
+# conftest.py
+# The modules of this directory import each other as top-level scripts.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+
+def make_opts(args=()):
+    """Parses args like the entry scripts do.
+    """
+    opts = config.create_parser().parse_args(list(args))
+    config.prepare_opts(opts)
+    return opts
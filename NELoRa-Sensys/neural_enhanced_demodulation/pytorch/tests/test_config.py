@@ -0,0 +1,22 @@
+# test_config.py
+
+import pytest
+
+import config
+from sweep import parse_sweep
+
+
+def test_sweep_list_options():
+    raw_opts = config.create_parser().parse_args([])
+    trials = parse_sweep(raw_opts, ['snr_list=-10:-5,0:5', 'lr=0.0002,0.0005'])
+    assert [trial['snr_list'] for trial in trials] == [[-10, -5], [-10, -5], [0, 5], [0, 5]]
+    assert [trial['lr'] for trial in trials] == [0.0002, 0.0005, 0.0002, 0.0005]
+
+
+def test_cast_option_errors():
+    raw_opts = config.create_parser().parse_args([])
+    assert config.cast_option(raw_opts, 'instance_list', '3', '--students') == [3]
+    with pytest.raises(ValueError):
+        config.cast_option(raw_opts, 'no_such_option', '1', '--sweep')
+    with pytest.raises(ValueError):
+        config.cast_option(raw_opts, 'target_ser', '0.1:0.01', '--sweep')
@@ -0,0 +1,25 @@
+# test_front_end.py
+
+import pytest
+import torch
+
+from conftest import make_opts
+from utils import band_limited_stft, stft_flops
+
+
+@pytest.mark.parametrize('sf', [7, 9])
+@pytest.mark.parametrize('oversampling', [2, 8, 16])
+def test_band_limited_stft_matches_kept_bins(sf, oversampling):
+    opts = make_opts(['--sf', str(sf), '--fs', str(125000 * oversampling)])
+    torch.manual_seed(sf)
+    x = torch.randn(2, opts.stft_nfft, dtype=torch.cfloat)
+    raw = torch.stft(input=x, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
+                     win_length=opts.stft_window, pad_mode='constant', return_complex=True)
+    trim_size = opts.freq_size // 2
+    expected = torch.cat((raw[:, :trim_size], raw[:, -trim_size:]), 1)
+    actual = band_limited_stft(x, opts)
+    assert actual.shape == expected.shape
+    assert torch.allclose(actual, expected, rtol=0, atol=1e-6 * expected.abs().max().item())
+    # the chirp-z transform runs from 8x oversampling on, and takes fewer FLOPs there
+    full_flops, zoom_flops = stft_flops(opts.stft_nfft, opts.stft_window, opts.freq_size)
+    assert (zoom_flops < full_flops) == (oversampling >= 8)
@@ -0,0 +1,70 @@
+# test_inference_optimization.py
+
+import pytest
+import torch
+import torch.nn as nn
+
+from conftest import make_opts
+from models.inference_optimization import optimize_for_inference, fuse_layers
+from models.model_components import maskCNNModel, StudentMaskCNNModel, create_classifier, create_mask_model
+from utils import signal_to_network_input
+
+
+def randomize_batch_norms(model):
+    """Gives every BatchNorm layer statistics and affine parameters far from the defaults,
+       so that folding them into the convolutions changes the weights.
+    """
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, nn.modules.batchnorm._BatchNorm):
+                module.running_mean.uniform_(-1, 1)
+                module.running_var.uniform_(0.5, 2)
+                module.weight.uniform_(0.5, 1.5)
+                module.bias.uniform_(-0.5, 0.5)
+    return model
+
+
+def assert_optimized_matches(model, x):
+    torch.manual_seed(0)
+    model = randomize_batch_norms(model).eval()
+    with torch.no_grad():
+        expected = model(x)
+        actual = optimize_for_inference(model)(x)
+    assert actual.shape == expected.shape
+    assert torch.allclose(actual, expected, rtol=1e-4, atol=1e-5 * expected.abs().max().item())
+
+
+def network_input(opts):
+    torch.manual_seed(1)
+    return signal_to_network_input(torch.randn(2, opts.stft_nfft, dtype=torch.cfloat), opts)
+
+
+@pytest.mark.parametrize('model_class', [maskCNNModel, StudentMaskCNNModel])
+def test_mask_models(model_class):
+    opts = make_opts(['--lstm_dim', '32', '--fc1_dim', '48'])
+    assert_optimized_matches(model_class(opts), network_input(opts))
+
+
+@pytest.mark.parametrize('classifier', ['hybrid', 'factorized'])
+def test_classifiers(classifier):
+    opts = make_opts(['--classifier', classifier])
+    assert_optimized_matches(create_classifier(opts), network_input(opts))
+
+
+def test_dechirp_models():
+    opts = make_opts(['--input_mode', 'dechirp'])
+    x = network_input(opts)
+    assert_optimized_matches(create_mask_model(opts), x)
+    assert_optimized_matches(create_classifier(opts), x)
+
+
+def test_fuse_layers_with_padding():
+    # the models fold their padding when built, the layers of older models still have it
+    layers = [nn.ZeroPad2d((3, 3, 0, 0)), nn.Conv2d(2, 8, (1, 7)), nn.BatchNorm2d(8), nn.ReLU(),
+              nn.ZeroPad2d((0, 0, 2, 2)), nn.Conv2d(8, 8, (5, 1)), nn.BatchNorm2d(8), nn.Dropout()]
+    model = randomize_batch_norms(nn.Sequential(*layers)).eval()
+    fused = nn.Sequential(*fuse_layers(list(model)))
+    assert not any(isinstance(layer, (nn.ZeroPad2d, nn.BatchNorm2d, nn.Dropout)) for layer in fused)
+    x = torch.randn(2, 2, 16, 33)
+    with torch.no_grad():
+        assert torch.allclose(fused(x), model(x), rtol=1e-4, atol=1e-5)
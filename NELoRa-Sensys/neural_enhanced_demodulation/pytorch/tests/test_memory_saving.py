@@ -0,0 +1,30 @@
+# test_memory_saving.py
+
+import torch
+
+from conftest import make_opts
+from models.model_components import maskCNNModel
+
+
+def train_step(memory_saving):
+    """One training step of a seeded maskCNNModel, returns the model and its input gradient.
+    """
+    opts = make_opts(['--lstm_dim', '32', '--fc1_dim', '48', '--checkpoint_segments', '3', '--time_chunk', '4'])
+    opts.memory_saving = memory_saving
+    torch.manual_seed(0)
+    model = maskCNNModel(opts).train()
+    frames = opts.stft_nfft // opts.stft_overlap + 1
+    x = torch.rand(2, opts.x_image_channel, opts.freq_size, frames, requires_grad=True)
+    model(x).square().mean().backward()
+    return model, x.grad
+
+
+def test_memory_saving_matches_plain_training():
+    plain, plain_grad = train_step(False)
+    saving, saving_grad = train_step(True)
+    assert torch.allclose(plain_grad, saving_grad, atol=1e-6)
+    for (name, plain_param), saving_param in zip(plain.named_parameters(), saving.parameters()):
+        assert torch.allclose(plain_param.grad, saving_param.grad, atol=1e-6), name
+    # the recompute during backward must not update the BatchNorm statistics a second time
+    for (name, plain_buffer), saving_buffer in zip(plain.named_buffers(), saving.buffers()):
+        assert torch.equal(plain_buffer, saving_buffer), name
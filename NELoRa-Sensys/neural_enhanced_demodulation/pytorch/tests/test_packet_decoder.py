@@ -0,0 +1,95 @@
+# test_packet_decoder.py
+
+import numpy as np
+import pytest
+import torch
+
+from conftest import make_opts
+from chirp_utils import gen_symbol, dechirp_decode
+from packet_decoder import PacketDecoder, HEADER_BLOCK, hamming_decode
+
+
+def hamming_encode(nibbles, rdd):
+    """LoRaPHY.hamming_encode: bits 5-8 are d0^d1^d2, d1^d2^d3, d0^d1^d3 and d0^d2^d3,
+       CR 4/5 has the parity of all four bits instead.
+    """
+    nibbles = np.asarray(nibbles, dtype=np.int64)
+    d = [(nibbles >> pos) & 1 for pos in range(4)]
+    if rdd == 5:
+        return nibbles | (d[0] ^ d[1] ^ d[2] ^ d[3]) << 4
+    parity = [d[0] ^ d[1] ^ d[2], d[1] ^ d[2] ^ d[3], d[0] ^ d[1] ^ d[3], d[0] ^ d[2] ^ d[3]]
+    codewords = nibbles.copy()
+    for pos in range(rdd - 4):
+        codewords |= parity[pos] << (4 + pos)
+    return codewords
+
+
+def diag_interleave(codewords, rdd):
+    """LoRaPHY.diag_interleave: bit i of symbol x is bit x of codeword (i + x) mod ppm.
+    """
+    ppm = len(codewords)
+    return [sum(((codewords[(i + x) % ppm] >> x) & 1) << i for i in range(ppm)) for x in range(rdd)]
+
+
+def gray_decoding(words, sf, header):
+    """LoRaPHY.gray_decoding: the symbol values that gray code to words.
+    """
+    symbols = []
+    for num in words:
+        mask = num >> 1
+        while mask:
+            num ^= mask
+            mask >>= 1
+        symbols.append((num * 4 + 1) % 2 ** sf if header else (num + 1) % 2 ** sf)
+    return symbols
+
+
+class DechirpPacketDecoder(PacketDecoder):
+    """A PacketDecoder that demodulates with the dechirp baseline instead of a model.
+    """
+
+    def __init__(self, opts):
+        super(DechirpPacketDecoder, self).__init__(torch.nn.Identity(), torch.nn.Identity(), opts)
+
+    def demodulate(self, symbols):
+        codes, confidences = dechirp_decode(symbols, self.opts.sf, self.opts.bw, self.opts.fs)
+        return codes.unsqueeze(1), confidences.unsqueeze(1)
+
+
+@pytest.mark.parametrize('cr', [1, 2, 3, 4])
+def test_packet_round_trip(cr):
+    opts = make_opts(['--lora_cr', str(cr), '--packet_topk', '1'])
+    sf, rdd = opts.sf, cr + 4
+    rng = np.random.RandomState(cr)
+    payload = rng.randint(0, 16, 2 * sf)
+    payload_len = len(payload) // 2
+    header = [payload_len >> 4, payload_len & 0xF, cr << 1 | 1, 0, rng.randint(0, 16)]
+
+    # the header block carries sf - 2 nibbles: the 5 header nibbles and, above SF7, payload
+    first = header + list(payload[:sf - 7])
+    words = diag_interleave(hamming_encode(first, HEADER_BLOCK), HEADER_BLOCK)
+    symbols = gray_decoding(words, sf, True)
+    rest = payload[sf - 7:]
+    for start in range(0, len(rest), sf):
+        words = diag_interleave(hamming_encode(rest[start:start + sf], rdd), rdd)
+        symbols += gray_decoding(words, sf, False)
+
+    decoder = DechirpPacketDecoder(opts)
+    chirps = torch.cat([gen_symbol(symbol, False, sf, opts.bw, opts.fs) for symbol in symbols])
+    packet = torch.cat([torch.zeros(decoder.data_start, dtype=torch.cfloat), chirps])
+    result = decoder.decode(packet)
+
+    assert result['symbols'][0].tolist() == symbols
+    assert result['nibbles'][0].tolist() == header + list(payload)
+    assert result['header']['payload_len'][0] == payload_len
+    assert result['header']['crc'][0] == 1
+    assert result['header']['cr'][0] == cr
+
+
+@pytest.mark.parametrize('rdd', [7, 8])
+def test_hamming_corrects_single_bit_errors(rdd):
+    nibbles = np.arange(16)
+    codewords = hamming_encode(nibbles, rdd)
+    assert hamming_decode(codewords, rdd).tolist() == nibbles.tolist()
+    for pos in range(7):
+        assert hamming_decode(codewords ^ (1 << pos), rdd).tolist() == nibbles.tolist()
@@ -0,0 +1,71 @@
+# time_to_target.py
+
+from __future__ import print_function
+import time
+
+import numpy as np
+
+
+class TimeToTarget(object):
+    """Records the first training iteration and wall-clock time at which the test SER
+       of every SNR reaches its target (opts.target_ser, one value for all SNRs or
+       one per entry of opts.snr_list). The evaluation time is not counted.
+    """
+
+    def __init__(self, opts):
+        target = np.array(opts.target_ser, dtype=float)
+        if len(target) == 1:
+            target = np.repeat(target, len(opts.snr_list))
+        if len(target) != len(opts.snr_list):
+            raise ValueError('target_ser needs one value or one per SNR in snr_list')
+        self.snr_list = opts.snr_list
+        self.target = target
+        self.best_ser = np.ones(len(target))
+        self.reached_iteration = np.full(len(target), -1)
+        self.reached_time = np.full(len(target), np.nan)
+        self.all_reached = None
+        self.start_time = time.time()
+        self.eval_time = 0.0
+
+    def elapsed(self):
+        return time.time() - self.start_time - self.eval_time
+
+    def update(self, iteration, ser, count, eval_time):
+        """Adds the per-SNR SER of an evaluation at iteration that took eval_time seconds.
+           Returns True once every evaluated SNR has reached its target.
+        """
+        self.eval_time += eval_time
+        elapsed = self.elapsed()
+        evaluated = count > 0
+        self.best_ser[evaluated] = np.minimum(self.best_ser[evaluated], ser[evaluated])
+        reached = evaluated & (ser <= self.target) & (self.reached_iteration < 0)
+        self.reached_iteration[reached] = iteration
+        self.reached_time[reached] = elapsed
+        print('Iteration [{:5d}] | SER: {} | SNRs at target: {}/{}'.format(
+            iteration, np.round(ser[evaluated], 4), int((self.reached_iteration[evaluated] >= 0).sum()),
+            int(evaluated.sum())))
+        if self.all_reached is None and (self.reached_iteration[evaluated] >= 0).all():
+            self.all_reached = (iteration, elapsed)
+        return self.all_reached is not None
+
+    def report(self):
+        """Prints the time-to-target of every SNR and of all of them together.
+        """
+        print('=' * 80)
+        print('Time to target SER'.center(80))
+        print('-' * 80)
+        print('{:>8} | {:>10} | {:>10} | {:>10} | {:>12}'.format('SNR', 'target', 'best SER', 'iteration', 'time (s)'))
+        for snr_index, snr in enumerate(self.snr_list):
+            if self.reached_iteration[snr_index] < 0:
+                reached = '{:>10} | {:>12}'.format('-', '-')
+            else:
+                reached = '{:>10d} | {:>12.1f}'.format(self.reached_iteration[snr_index],
+                                                       self.reached_time[snr_index])
+            print('{:>8d} | {:>10.4f} | {:>10.4f} | {}'.format(
+                snr, self.target[snr_index], self.best_ser[snr_index], reached))
+        print('-' * 80)
+        if self.all_reached is None:
+            print('Targets not reached after {:.1f} s of training'.format(self.elapsed()))
+        else:
+            print('All targets reached at iteration {} after {:.1f} s of training'.format(*self.all_reached))
+        print('=' * 80)
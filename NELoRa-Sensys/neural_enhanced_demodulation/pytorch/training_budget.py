@@ -0,0 +1,126 @@
+# training_budget.py
+
+from __future__ import print_function
+from copy import deepcopy
+import os
+import time
+
+import numpy as np
+import torch
+
+import end2end
+
+
+def budget_enabled(opts):
+    return opts.stop_patience > 0 or opts.max_train_time > 0 or opts.max_train_iters > 0
+
+
+class TrainingBudget(object):
+    """Stops training before opts.train_iters iterations.
+       * Plateau: every opts.stop_check_every iterations the monitored value is compared
+         with the best so far, the SER on the first opts.stop_eval_batches batches of the
+         validation split held out of the training files (opts.stop_metric ser, see
+         utils.split_validation) or the running mean of the training loss (loss). Training
+         stops after opts.stop_patience checks without a relative improvement of
+         opts.stop_min_delta (0: never).
+       * Budget: training stops once opts.max_train_time seconds of wall clock (checks
+         included) or opts.max_train_iters iterations are used (0: no limit).
+       * The weights of the best check are saved as [prefix]_maskCNN.pkl and
+         [prefix]_C_XtoY.pkl in opts.checkpoint_dir. Copies of the models are kept with
+         them (pruning may shrink the models after the check), finish() returns them for
+         the final test.
+       * report() compares the iterations and training time used with the estimate for
+         the fixed schedule of opts.train_iters iterations.
+    """
+
+    LOSS_DECAY = 0.98
+
+    def __init__(self, validation_dataloader_X, opts, prefix='budget_best'):
+        self.opts = opts
+        self.prefix = prefix
+        self.subset = []
+        if opts.stop_metric == 'ser':
+            for batch_index, batch in enumerate(validation_dataloader_X):
+                if batch_index >= opts.stop_eval_batches:
+                    break
+                self.subset.append(batch)
+        self.loss_mean = None
+        self.best = (None, np.inf)
+        self.best_models = None
+        self.checks_since_best = 0
+        self.history = []
+        self.reason = None
+        self.start_time = time.time()
+        self.eval_time = 0.0
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def step(self, iteration, loss, mask_CNN, C_XtoY):
+        """Records the training loss of iteration and checks the stopping rules. Returns True
+           when training should stop.
+        """
+        if self.loss_mean is None:
+            self.loss_mean = loss
+        self.loss_mean += (1 - self.LOSS_DECAY) * (loss - self.loss_mean)
+
+        if iteration % self.opts.stop_check_every == 0:
+            self.check(iteration, mask_CNN, C_XtoY)
+        if self.reason is None and self.opts.max_train_iters > 0 and iteration >= self.opts.max_train_iters:
+            self.reason = 'iteration budget'
+        if self.reason is None and self.opts.max_train_time > 0 and self.elapsed() >= self.opts.max_train_time:
+            self.reason = 'time budget'
+        return self.reason is not None
+
+    def check(self, iteration, mask_CNN, C_XtoY):
+        start_time = time.time()
+        if self.opts.stop_metric == 'ser':
+            ser, count = end2end.evaluate_ser(self.subset, mask_CNN, C_XtoY, self.opts)
+            value = np.sum(ser * count) / max(count.sum(), 1)
+        else:
+            value = self.loss_mean
+        self.history.append((iteration, value))
+
+        if value < self.best[1] * (1 - self.opts.stop_min_delta) or self.best[0] is None:
+            self.best = (iteration, value)
+            self.checks_since_best = 0
+            self.best_models = (deepcopy(mask_CNN), deepcopy(C_XtoY))
+            torch.save(mask_CNN.state_dict(), os.path.join(self.opts.checkpoint_dir, self.prefix + '_maskCNN.pkl'))
+            torch.save(C_XtoY.state_dict(), os.path.join(self.opts.checkpoint_dir, self.prefix + '_C_XtoY.pkl'))
+        else:
+            self.checks_since_best += 1
+            if 0 < self.opts.stop_patience <= self.checks_since_best and self.reason is None:
+                self.reason = 'plateau'
+        self.eval_time += time.time() - start_time
+        print('Iteration [{:5d}] | {}: {:.4f} | best {:.4f} at {} | {} checks without improvement'.format(
+            iteration, self.opts.stop_metric, value, self.best[1], self.best[0], self.checks_since_best))
+
+    def finish(self, iteration, mask_CNN, C_XtoY):
+        """Checks the final weights of training (stopped at iteration) too, then returns the
+           models of the best check.
+        """
+        if not self.history or self.history[-1][0] != iteration:
+            self.check(iteration, mask_CNN, C_XtoY)
+        return self.best_models
+
+    def report(self, iteration):
+        """Prints the checks and the compute used against the fixed schedule.
+        """
+        train_time = self.elapsed() - self.eval_time
+        full_time = train_time / max(iteration, 1) * self.opts.train_iters
+        print('=' * 80)
+        print('Budgeted training: {}'.format(self.reason or 'full schedule').center(80))
+        print('-' * 80)
+        print('{:>10} | {:>12} | {}'.format('iteration', self.opts.stop_metric, 'best'))
+        for check_iteration, value in self.history:
+            print('{:>10d} | {:>12.4f} | {}'.format(check_iteration, value, '*' if check_iteration == self.best[0] else ''))
+        print('-' * 80)
+        print('Iterations: {} of {} ({:.1f}% saved)'.format(
+            iteration, self.opts.train_iters, 100.0 * (self.opts.train_iters - iteration) / max(self.opts.train_iters, 1)))
+        print('Training time: {:.1f} s + {:.1f} s of checks, {:.1f} s estimated for the full schedule '
+              '({:.1f} s saved)'.format(train_time, self.eval_time, full_time, full_time - train_time))
+        if self.best[0] is not None:
+            print('Best {} {:.4f} at iteration {}: {}'.format(
+                self.opts.stop_metric, self.best[1], self.best[0],
+                os.path.join(self.opts.checkpoint_dir, self.prefix + '_*.pkl')))
+        print('=' * 80)
@@ -6,8 +6,16 @@ from torch.autograd import Variable
 from random import shuffle
 import numpy as np
 import functools
+import math
 import operator
 
+from chirp_utils import base_downchirp
+from datasets.data_watcher import held_out
+
+
+# torch.inference_mode is only available from torch 1.9 on
+inference_mode = getattr(torch, 'inference_mode', torch.no_grad)
+
 
 def to_var(x):
     """Converts numpy to variable."""
@@ -22,28 +30,148 @@ def convertTuple(tup):
 
 
 def spec_to_network_input(x, opts):
-    """Converts numpy to variable."""
+    """Converts the STFT [B, nfft, W] to the network input [B, C, H, W] (H = freq_size).
+    The input is written once, time-major: it is a [B, C, H, W] view of a contiguous
+    [B, C, W, H] tensor, the layout the conv stack of the mask models consumes."""
     freq_size = opts.freq_size
     # trim
     trim_size = freq_size // 2
-    # up down 拼接
-    y = torch.cat((x[:, -trim_size:, :], x[:, 0:trim_size, :]), 1)
+    # up down 拼接: the top trim_size bins, then the bottom trim_size bins
+    x = x.transpose(1, 2)  # [B,W,nfft]
+    halves = (x[:, :, -trim_size:], x[:, :, 0:trim_size])
+
+    y = torch.empty(x.shape[0], opts.x_image_channel, x.shape[1], freq_size, device=x.device,
+                    dtype=x.real.dtype)  # [B,C,W,H]
+    for part, half in zip((y[..., :trim_size], y[..., trim_size:]), halves):
+        if opts.x_image_channel == 2:
+            part.copy_(torch.view_as_real(half).permute(0, 3, 1, 2))
+        else:
+            part.copy_(torch.angle(half).unsqueeze(1))
+
+    if opts.normalization and opts.x_image_channel == 2:
+        y_abs_max = torch.max(torch.abs(halves[0]).flatten(1).max(1)[0],
+                              torch.abs(halves[1]).flatten(1).max(1)[0])
+        y.div_(y_abs_max.view(-1, 1, 1, 1))
+    return y.transpose(2, 3)  # [B,C,H,W]
+
+
+def dechirp_to_network_input(x, opts):
+    """Dechirps raw chirp symbols [B, nsamp] and returns the FFT of opts.dechirp_windows
+    sub-windows, each zero-padded to nsamp points and folded into the 2^sf bins of the two
+    aliased copies, as [B, 4 * dechirp_windows, 2^sf] (real and imaginary part of both copies)."""
+    nsamp = x.shape[-1]
+    dechirped = x * base_downchirp(opts.sf, opts.bw, opts.fs).to(x.device)
+    rz = torch.fft.fft(dechirped.view(x.shape[0], opts.dechirp_windows, -1), n=nsamp, dim=-1)
+    y = torch.stack((rz[..., :opts.n_classes], rz[..., -opts.n_classes:]), 2)  # [B,W,2,N]
 
     if opts.normalization:
-        y_abs = torch.abs(y)
-        y_abs_max = torch.tensor(
-            list(map(lambda x: torch.max(x), y_abs)))
-        y_abs_max = to_var(torch.unsqueeze(torch.unsqueeze(y_abs_max, 1), 2))
-        y = torch.div(y, y_abs_max)
-
-    if opts.x_image_channel == 2:
-        y = torch.view_as_real(y)  # [B,H,W,2]
-        y = torch.transpose(y, 2, 3)
-        y = torch.transpose(y, 1, 2)
-    else:
-        y = torch.angle(y)  # [B,H,W]
-        y = torch.unsqueeze(y, 1)  # [B,H,W]
-    return y  # [B,2,H,W]
+        y = y / torch.abs(y).flatten(1).max(1)[0].view(-1, 1, 1, 1)
+
+    y = torch.view_as_real(y)  # [B,W,2,N,2]
+    return y.permute(0, 1, 2, 4, 3).reshape(x.shape[0], -1, opts.n_classes)
+
+
+def zoom_length(window, freq_size):
+    """The FFT length of the chirp-z transform of band_limited_stft: the smallest power of 2
+    that holds the linear convolution of window samples with freq_size + window - 1 chirp
+    samples."""
+    return 1 << (window + freq_size - 2).bit_length()
+
+
+def stft_flops(nfft, window, freq_size):
+    """Returns the real FLOPs per frame of the full nfft-point FFT (5 N log2 N) and of the
+    chirp-z transform of the freq_size kept bins (two FFTs of zoom_length points and three
+    chirp multiplications, 6 FLOPs per complex multiply)."""
+    length = zoom_length(window, freq_size)
+    return 5 * nfft * math.log2(nfft), 10 * length * math.log2(length) + 6 * (window + length + freq_size)
+
+
+@functools.lru_cache(maxsize=None)
+def stft_zoom_chirps(nfft, window, freq_size):
+    """The chirps of the chirp-z (Bluestein) transform that evaluates the bins
+    -freq_size/2..freq_size/2-1 of an nfft-point FFT of a rectangular window centered in the
+    frame, as torch.stft places it: the premultiplication of the window samples, the FFT of
+    the convolution chirp and the postmultiplication of the bins. With k = m - freq_size/2,
+    nk = (n^2 + m^2 - (m - n)^2) / 2 - n freq_size/2, the phases are reduced modulo 2 nfft
+    (in units of pi / nfft) as integers, so they stay exact for any nfft."""
+    length = zoom_length(window, freq_size)
+    first = -(freq_size // 2)
+    offset = (nfft - window) // 2
+    samples = np.arange(window, dtype=np.int64)
+    bins = np.arange(freq_size, dtype=np.int64)
+    lags = np.arange(-(window - 1), freq_size, dtype=np.int64)
+
+    def chirp(phases):
+        return np.exp(-1j * np.pi * (phases % (2 * nfft)) / nfft)
+
+    pre = chirp(samples ** 2 + 2 * first * samples)
+    post = chirp(bins ** 2 + 2 * offset * (bins + first))
+    kernel = np.zeros(length, dtype=complex)
+    kernel[lags % length] = np.conj(chirp(lags ** 2))
+    return (torch.tensor(pre, dtype=torch.cfloat), torch.fft.fft(torch.tensor(kernel, dtype=torch.cdouble)).cfloat(),
+            torch.tensor(post, dtype=torch.cfloat))
+
+
+def band_limited_stft(x, opts):
+    """Computes only the opts.freq_size bins of torch.stft(x, n_fft=opts.stft_nfft, ...) that
+    spec_to_network_input keeps, as a [B, freq_size, W] spectrum it accepts in place of the
+    full [B, nfft, W] one. Every frame is reduced to its opts.stft_window windowed samples and
+    the freq_size contiguous bins around DC are evaluated by a chirp-z transform of
+    zoom_length points instead of the nfft-point FFT. Where that takes more FLOPs than the
+    full FFT (stft_flops, oversampling below 8), the full STFT is computed and the kept bins
+    are taken from it."""
+    trim_size = opts.freq_size // 2
+    full_flops, zoom_flops = stft_flops(opts.stft_nfft, opts.stft_window, opts.freq_size)
+    if zoom_flops >= full_flops:
+        x_spectrum_raw = torch.stft(input=x, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
+                                    win_length=opts.stft_window, pad_mode='constant')
+        return torch.cat((x_spectrum_raw[:, :trim_size], x_spectrum_raw[:, -trim_size:]), 1)
+
+    pad = torch.zeros(x.shape[0], opts.stft_window // 2, dtype=x.dtype, device=x.device)
+    frames = torch.cat((pad, x, pad), 1).unfold(1, opts.stft_window, opts.stft_overlap)  # [B,W,window]
+    pre, kernel, post = [chirp.to(x.device) for chirp in
+                         stft_zoom_chirps(opts.stft_nfft, opts.stft_window, opts.freq_size)]
+    y = torch.fft.fft(frames * pre, n=kernel.shape[0])
+    y = torch.fft.ifft(y * kernel)[..., :opts.freq_size] * post  # bins -trim_size..trim_size-1
+    return torch.cat((y[..., trim_size:], y[..., :trim_size]), -1).transpose(1, 2)
+
+
+def signal_to_network_input(x, opts):
+    """Computes the STFT of raw chirp symbols [B, nsamp] and converts it to the network input
+    (the dechirped FFT of dechirp_to_network_input if opts.input_mode is dechirp, only the
+    kept bins of the STFT if opts.stft_mode is band)."""
+    if opts.input_mode == 'dechirp':
+        return dechirp_to_network_input(x, opts)
+    if opts.stft_mode == 'band':
+        return spec_to_network_input(band_limited_stft(x, opts), opts)
+    x_spectrum_raw = torch.stft(input=x, n_fft=opts.stft_nfft, hop_length=opts.stft_overlap,
+                                win_length=opts.stft_window, pad_mode='constant')
+    return spec_to_network_input(x_spectrum_raw, opts)
+
+
+def parse_file_names(names):
+    """Splits {code}_{snr}_{sf}_{bw}_{instance}_{label}_... file names into code, snr, instance and label lists."""
+    fields = [name.split('_') for name in names]
+    code = [float(field[0]) for field in fields]
+    snr = [int(field[1]) for field in fields]
+    instance = [int(field[4]) for field in fields]
+    label = [int(field[5]) for field in fields]
+    return code, snr, instance, label
+
+
+def print_ser_table(title, ser_columns, count, snr_list):
+    """Prints per-SNR SER columns (a dict name -> array aligned with snr_list) side by side."""
+    names = list(ser_columns.keys())
+    print('=' * 80)
+    print(title.center(80))
+    print('-' * 80)
+    print(' | '.join(['{:>8}'.format('SNR'), '{:>8}'.format('count')] + ['{:>12}'.format(name) for name in names]))
+    for snr_index, snr in enumerate(snr_list):
+        if count[snr_index] == 0:
+            continue
+        print(' | '.join(['{:>8d}'.format(snr), '{:>8d}'.format(int(count[snr_index]))] +
+                         ['{:>12.4f}'.format(ser_columns[name][snr_index]) for name in names]))
+    print('=' * 80)
 
 
 def generate_dataset(root_path, data_dir, ratio_bt_train_and_test,
@@ -74,11 +202,33 @@ def generate_dataset(root_path, data_dir, ratio_bt_train_and_test,
         print("length of training and testing data is {},{}".format(len(files_train), len(files_test)))
     return [files_train, files_test]
 
+def split_validation(files_train, opts):
+    """Holds the validation split out of files_train: the opts.validation_ratio of the files
+    that held_out selects by name. Returns the remaining training files and the validation
+    files, raises ValueError if no file is held out."""
+    files_validation = [name for name in files_train if held_out(name, opts.validation_ratio)]
+    if not files_validation:
+        raise ValueError('--validation_ratio {} holds out none of the {} training files'.format(
+            opts.validation_ratio, len(files_train)))
+    files_train = [name for name in files_train if not held_out(name, opts.validation_ratio)]
+    print("length of training and validation data is {},{}".format(len(files_train), len(files_validation)))
+    return files_train, files_validation
+
+
 def set_gpu(free_gpu_id):
     """Converts numpy to variable."""
     torch.cuda.set_device(free_gpu_id)
 
 
+def set_threads(opts):
+    """Applies opts.num_threads and opts.num_interop_threads (0 keeps the PyTorch default).
+    The inter-op threads can only be set before the first parallel work of the process."""
+    if opts.num_threads > 0:
+        torch.set_num_threads(opts.num_threads)
+    if opts.num_interop_threads > 0:
+        torch.set_num_interop_threads(opts.num_interop_threads)
+
+
 def to_var(x):
     """Converts numpy to variable."""
     if torch.cuda.is_available():